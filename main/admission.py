@@ -0,0 +1,116 @@
+"""
+Admission control: ограничения одновременных запросов по полосам (lanes) и скорости
+запросов клиента (token bucket). Используется AdmissionControlMiddleware (main/middleware.py).
+
+Полосы:
+  - priority - пишущие запросы маршрутов ADMISSION_PRIORITY_ROUTES (создание заказа, checkout,
+    добавление единицы заказа): без ограничений, не тратят токены клиента;
+  - reports - маршруты ADMISSION_REPORT_ROUTES, стоят ADMISSION_REPORT_COST токенов;
+  - reads / writes - остальные безопасные и пишущие запросы.
+
+Счётчики и корзины токенов - в памяти процесса: при нескольких процессах лимиты действуют
+в каждом отдельно. Сумма лимитов полос должна быть меньше числа потоков сервера, тогда
+у priority всегда есть свободный поток.
+"""
+import threading
+import time
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class Lane:
+    """ Полоса с ограничением одновременных запросов (limit 0 - без ограничения) """
+
+    def __init__(self, name, limit=0):
+        self.name = name
+        self.limit = limit
+        self.inflight = 0
+        self.rejected = 0  # отказов 503: полоса занята
+        self.throttled = 0  # отказов 429: у клиента кончились токены
+        self.lock = threading.Lock()
+
+    def try_enter(self):
+        with self.lock:
+            if self.limit and self.inflight >= self.limit:
+                self.rejected += 1
+                return False
+            self.inflight += 1
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.inflight -= 1
+
+
+class TokenBucket:
+    """
+    Корзины токенов по клиентам: rate токенов в секунду, не больше burst.
+    Заполненные корзины давно не появлявшихся клиентов удаляются, когда клиентов больше max_clients.
+    """
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, client, cost=1):
+        """ 0, если токены списаны, иначе через сколько секунд их хватит """
+        if self.rate <= 0 or cost <= 0:
+            return 0
+        now = time.monotonic()
+        with self.lock:
+            tokens, stamp = self.buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            if tokens < cost:
+                self.buckets[client] = (tokens, now)
+                return (cost - tokens) / self.rate
+            self.buckets[client] = (tokens - cost, now)
+            if len(self.buckets) > self.max_clients:
+                self.prune(now)
+        return 0
+
+    def prune(self, now):
+        refill = self.burst / self.rate
+        self.buckets = {
+            client: (tokens, stamp) for client, (tokens, stamp) in self.buckets.items() if now - stamp < refill
+        }
+
+
+class AdmissionController:
+
+    def __init__(self, priority_routes, report_routes, concurrency, rate, burst, report_cost):
+        self.priority_routes = set(priority_routes)
+        self.report_routes = set(report_routes)
+        self.lanes = {name: Lane(name, concurrency.get(name, 0)) for name in ('priority', 'reports', 'reads', 'writes')}
+        self.costs = {'priority': 0, 'reports': report_cost, 'reads': 1, 'writes': 1}
+        self.buckets = TokenBucket(rate, burst)
+
+    def lane_for(self, route, method):
+        safe = method in SAFE_METHODS
+        if route in self.priority_routes and not safe:
+            return self.lanes['priority']
+        if route in self.report_routes:
+            return self.lanes['reports']
+        return self.lanes['reads' if safe else 'writes']
+
+    def admit(self, client, route, method):
+        """ (полоса, None) - запрос принят и занял место в полосе; (полоса, (status, retry_after)) - отказ """
+        lane = self.lane_for(route, method)
+        # сначала место в полосе: запрос, отбитый 503, не должен тратить токены клиента
+        if not lane.try_enter():
+            return lane, (503, None)
+        wait = self.buckets.take(client, self.costs[lane.name])
+        if wait:
+            lane.leave()
+            with lane.lock:
+                lane.throttled += 1
+            return lane, (429, wait)
+        return lane, None
+
+    def stats(self):
+        return {
+            name: {'inflight': lane.inflight, 'limit': lane.limit, 'rejected': lane.rejected, 'throttled': lane.throttled}
+            for name, lane in self.lanes.items()
+        }
@@ -9,8 +9,28 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+# горячие GET-маршруты обслуживаются асинхронными view (order/async_views.py)
+os.environ.setdefault('ROOT_URLCONF', 'main.asgi_urls')
 
-application = get_asgi_application()
+# как get_asgi_application(), но потоковые ответы читаются вне цикла событий (main/handlers.py)
+django.setup(set_prefix=False)
+
+from main.handlers import StreamingASGIHandler  # noqa: E402
+from order import live, tasks  # noqa: E402  (модели доступны только после setup)
+
+django_application = StreamingASGIHandler()
+
+live.broker.active = True
+# воркеры очереди задач в этом процессе, если TASKS_EAGER=False и TASKS_WORKERS > 0
+tasks.start_local_workers()
+
+
+async def application(scope, receive, send):
+    # лента заказов (Server-Sent Events) - долгие соединения в обход Django
+    if scope['type'] == 'http' and scope['path'] in ('/order/live', '/order/live/'):
+        await live.sse_app(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,11 @@
+"""
+URLconf для ASGI: горячие GET-маршруты обслуживают асинхронные view из order.async_views,
+всё остальное - те же маршруты, что и в main.urls.
+"""
+from django.urls import include, path
+
+from main.urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path('order/', include('order.async_views')),
+] + wsgi_urlpatterns
@@ -0,0 +1,45 @@
+"""
+sqlite3 с профилем для конкурентной записи.
+
+Подключение: ENGINE = 'main.backends.sqlite3'. В OPTIONS дополнительно понимаются:
+  'pragmas'   - dict PRAGMA, выполняемых на каждом новом подключении
+                (journal_mode, synchronous, busy_timeout, mmap_size, cache_size, ...);
+  'immediate' - начинать транзакции (transaction.atomic) с BEGIN IMMEDIATE.
+
+BEGIN IMMEDIATE берёт блокировку записи в начале транзакции: писатели ждут друг друга
+в пределах busy_timeout, а не получают "database is locked", когда две отложенные
+(DEFERRED) транзакции одновременно пытаются перейти от чтения к записи.
+"""
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'foreign_keys': 'ON',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # это не аргументы sqlite3.connect()
+        kwargs.pop('pragmas', None)
+        kwargs.pop('immediate', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**DEFAULT_PRAGMAS, **self.settings_dict['OPTIONS'].get('pragmas', {})}
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.settings_dict['OPTIONS'].get('immediate', True):
+            self.cursor().execute('BEGIN IMMEDIATE')
+        else:
+            super()._start_transaction_under_autocommit()
@@ -0,0 +1,333 @@
+import asyncio
+import cProfile
+import json
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+from main.admission import AdmissionController
+from main.routers import use_replicas
+
+timing_logger = logging.getLogger('main.timing')
+profiler_logger = logging.getLogger('main.profiler')
+
+PROFILER_SALT = 'main.profiler'
+
+
+class QueryTimer:
+    """ execute_wrapper: считает SQL-запросы и время, проведённое в БД """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class RequestTimingMiddleware:
+    """
+    Замеры на запрос: число SQL-запросов, время в БД, время view без сериализаторов,
+    время сериализаторов (участки view под serialize_timer), время рендера ответа в JSON
+    и общее время. Отдаются в заголовках Server-Timing и X-Query-Count и одной JSON-строкой
+    в лог main.timing. Тело потокового ответа (StreamingHttpResponse, ?stream=1) формируется
+    уже после middleware, поэтому его сериализация и запросы в замеры не входят.
+
+    Замеряется доля запросов REQUEST_TIMING_SAMPLE_RATE (0 - выключено, 1 - все);
+    остальные запросы проходят без обёрток.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_TIMING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        queries = QueryTimer()
+        request._timing = timing = {'view_start': None, 'view_end': None, 'render_end': None, 'serialize': 0.0}
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        end = time.perf_counter()
+
+        view_end = timing['view_end'] or end
+        metrics = {
+            'db': queries.duration,
+            'view': view_end - (timing['view_start'] or start) - timing['serialize'],
+            'serialize': timing['serialize'],
+            'render': (timing['render_end'] or view_end) - view_end,
+            'total': end - start,
+        }
+        response['X-Query-Count'] = str(queries.count)
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={value * 1000:.2f}' for name, value in metrics.items()
+        )
+        match = request.resolver_match
+        timing_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'route': match.url_name if match else None,
+            'status': response.status_code,
+            'queries': queries.count,
+            **{f'{name}_ms': round(value * 1000, 2) for name, value in metrics.items()},
+        }))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = getattr(request, '_timing', None)
+        if timing is not None:
+            timing['view_start'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF Response рендерится после view: здесь view закончилась, рендер ещё не начался
+        timing = getattr(request, '_timing', None)
+        if timing is not None:
+            timing['view_end'] = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: timing.update(render_end=time.perf_counter()))
+        return response
+
+
+@contextmanager
+def serialize_timer(request):
+    """ Участок view, который сериализует ответ: его время - метрика serialize RequestTimingMiddleware """
+    timing = getattr(request, '_timing', None)
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing['serialize'] += time.perf_counter() - start
+
+
+def make_profile_token():
+    """ Подписанный токен для X-Profile / ?profile=, действует PROFILER_TOKEN_MAX_AGE секунд """
+    return signing.TimestampSigner(salt=PROFILER_SALT).sign('profile')
+
+
+class StackSampler:
+    """
+    Сэмплирующий профайлер: фоновый поток каждые interval секунд снимает стек
+    потока запроса. Результат - collapsed stacks (формат flamegraph.pl / speedscope).
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfilerMiddleware:
+    """
+    Профилирование отдельного запроса: при PROFILER_ENABLED и действительном подписанном
+    токене (заголовок X-Profile или ?profile=, см. manage.py profile_token) запрос
+    выполняется под профайлером, а профиль пишется в PROFILER_DIR с именем маршрута.
+
+    Режим - PROFILER_MODE или ?profile_mode=: cprofile (детерминированный, файл .prof
+    для pstats/snakeviz) или sampling (collapsed stacks для flamegraph).
+    """
+    modes = ('cprofile', 'sampling')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.PROFILER_ENABLED
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        token = request.headers.get('X-Profile') or request.GET.get('profile')
+        if not token or not self.is_valid(token):
+            return self.get_response(request)
+
+        mode = request.GET.get('profile_mode', settings.PROFILER_MODE)
+        if mode not in self.modes:
+            mode = settings.PROFILER_MODE
+        started = time.time()
+        if mode == 'sampling':
+            with StackSampler(threading.get_ident(), settings.PROFILER_SAMPLE_INTERVAL) as profiler:
+                response = self.get_response(request)
+        else:
+            profiler = cProfile.Profile()
+            response = profiler.runcall(self.get_response, request)
+
+        match = request.resolver_match
+        name = match.url_name if match and match.url_name else 'unresolved'
+        extension = 'collapsed' if mode == 'sampling' else 'prof'
+        filename = f"{name}-{int(started * 1000)}-{os.getpid()}.{extension}"
+        os.makedirs(settings.PROFILER_DIR, exist_ok=True)
+        path = os.path.join(settings.PROFILER_DIR, filename)
+        if mode == 'sampling':
+            profiler.dump(path)
+        else:
+            profiler.dump_stats(path)
+
+        profiler_logger.info('profiled %s %s -> %s', request.method, request.path, path)
+        response['X-Profile-File'] = filename
+        return response
+
+    @staticmethod
+    def is_valid(token):
+        try:
+            signing.TimestampSigner(salt=PROFILER_SALT).unsign(token, max_age=settings.PROFILER_TOKEN_MAX_AGE)
+        except signing.BadSignature:
+            return False
+        return True
+
+
+class ReplicaReadMiddleware:
+    """
+    Безопасные запросы (GET, HEAD, OPTIONS) читают с реплик (main/routers.py), кроме случаев,
+    когда клиент привязан к primary:
+      - заголовок X-Pin-Primary: 1 - на один запрос;
+      - cookie pin_primary - ставится на PRIMARY_PIN_SECONDS после успешного пишущего запроса,
+        чтобы клиент сразу видел свои записи (read-your-own-writes), пока реплика догоняет.
+    """
+    cookie_name = 'pin_primary'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = settings.PRIMARY_PIN_SECONDS
+
+    def __call__(self, request):
+        safe = request.method in self.safe_methods
+        pinned = request.headers.get('X-Pin-Primary') == '1' or self.cookie_name in request.COOKIES
+        with use_replicas(safe and not pinned):
+            response = self.get_response(request)
+        if not safe and response.status_code < 400 and self.pin_seconds > 0:
+            response.set_cookie(self.cookie_name, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
+
+
+class AdmissionControlMiddleware:
+    """
+    Сброс лишней нагрузки до view (main/admission.py): запрос сверх лимита токенов клиента
+    получает 429, сверх лимита одновременных запросов своей полосы - 503; оба с Retry-After.
+    Пишущие запросы создания заказа идут по полосе priority и не ограничиваются.
+
+    Работает и под WSGI, и под ASGI без переключения потоков. Место в полосе освобождается,
+    когда ответ отдан: у потоковых ответов - после последнего чанка.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # как в django.utils.deprecation.MiddlewareMixin: асинхронный режим под ASGI
+        self._is_coroutine = asyncio.coroutines._is_coroutine if asyncio.iscoroutinefunction(get_response) else None
+        self.client_header = settings.ADMISSION_CLIENT_HEADER
+        self.retry_after = settings.ADMISSION_RETRY_AFTER
+        self.controller = AdmissionController(
+            priority_routes=settings.ADMISSION_PRIORITY_ROUTES,
+            report_routes=settings.ADMISSION_REPORT_ROUTES,
+            concurrency=settings.ADMISSION_CONCURRENCY,
+            rate=settings.ADMISSION_CLIENT_RATE,
+            burst=settings.ADMISSION_CLIENT_BURST,
+            report_cost=settings.ADMISSION_REPORT_COST,
+        )
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        lane, rejected = self.admit(request)
+        if rejected is not None:
+            return rejected
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            lane.leave()
+            raise
+        return self.release_with(response, lane)
+
+    async def __acall__(self, request):
+        lane, rejected = self.admit(request)
+        if rejected is not None:
+            return rejected
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            lane.leave()
+            raise
+        return self.release_with(response, lane)
+
+    def admit(self, request):
+        try:
+            route = resolve(request.path_info, getattr(request, 'urlconf', None)).url_name
+        except Resolver404:
+            route = None
+        lane, rejection = self.controller.admit(self.client(request), route, request.method)
+        if rejection is None:
+            return lane, None
+        status, wait = rejection
+        if status == 429:
+            response = JsonResponse({'detail': 'Request was throttled.'}, status=429)
+        else:
+            wait = self.retry_after
+            response = JsonResponse({'detail': 'Server is busy, try again later.'}, status=503)
+        response['Retry-After'] = str(max(1, math.ceil(wait)))
+        response['X-Admission-Lane'] = lane.name
+        return lane, response
+
+    def client(self, request):
+        if self.client_header:
+            forwarded = request.headers.get(self.client_header)
+            if forwarded:
+                return forwarded.split(',')[0].strip()
+        return request.META.get('REMOTE_ADDR')
+
+    @staticmethod
+    def release_with(response, lane):
+        if response.streaming:
+            # потоковый ответ читает БД, пока отдаётся: место освобождается при закрытии
+            response._resource_closers.append(lane.leave)
+        else:
+            lane.leave()
+        return response
@@ -0,0 +1,23 @@
+"""
+Парсеры тела запроса сверх стандартных DRF.
+
+MessagePackParser (Content-Type: application/msgpack) требует пакет msgpack
+и подключается в REST_FRAMEWORK, только если он установлен.
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except ValueError as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
@@ -0,0 +1,60 @@
+"""
+Рендеры ответов API.
+
+FastJSONRenderer кодирует ответ через orjson сразу в bytes и даёт тот же результат, что
+JSONRenderer DRF (компактный UTF-8, даты/Decimal/UUID через JSONEncoder DRF). Если orjson
+не установлен, ответ с отступами (indent) или данные orjson не может закодировать -
+работает обычный JSONRenderer.
+
+MessagePackRenderer (Accept: application/msgpack) требует пакет msgpack.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_encoder = JSONEncoder()
+
+
+def encode_default(obj):
+    """ Типы, которых нет в JSON/MessagePack, приводятся так же, как в JSONEncoder DRF """
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # datetime отдаются в encode_default, чтобы формат ('Z' вместо '+00:00') совпадал с DRF
+            ret = orjson.dumps(data, default=encode_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # как JSONRenderer: U+2028 и U+2029 экранируются для вставки в <script>
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default)
@@ -0,0 +1,52 @@
+"""
+Маршрутизация чтения на реплики.
+
+Запись всегда идёт в default. Чтение уходит на реплику, только если оно разрешено
+для текущего контекста (replica_reads): это делает ReplicaReadMiddleware для
+безопасных (GET/HEAD/OPTIONS) запросов без привязки к primary. Всё остальное -
+пишущие запросы, management-команды, shell - читает из default и видит свои записи.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def use_replicas(enabled=True):
+    """ Разрешить (или запретить) чтение с реплик внутри блока """
+    token = replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+def use_primary():
+    return use_replicas(False)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # связанные объекты читаются из той же БД, что и сам объект
+            return instance._state.db
+        if settings.DATABASE_REPLICA_ALIASES and replica_reads.get():
+            return random.choice(settings.DATABASE_REPLICA_ALIASES)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики - копии default, объекты из разных алиасов относятся к одной БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схема на реплики приходит репликацией
+        return db not in settings.DATABASE_REPLICA_ALIASES
@@ -10,8 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 import os
+from importlib.util import find_spec
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -54,7 +55,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'main.urls'
+# main/asgi.py по умолчанию переключает на main.asgi_urls (асинхронные GET-view)
+ROOT_URLCONF = config('ROOT_URLCONF', default='main.urls')
 
 TEMPLATES = [
     {
@@ -81,10 +83,41 @@ WSGI_APPLICATION = 'main.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': config('SQLITE_NAME', default=str(BASE_DIR / 'db.sqlite3')),
     }
 }
 
+# Профиль SQLite для конкурентной записи (main/backends/sqlite3): WAL, busy timeout,
+# mmap/cache и BEGIN IMMEDIATE для транзакций.
+if config('SQLITE_PROFILE', default=False, cast=bool):
+    DATABASES['default']['ENGINE'] = 'main.backends.sqlite3'
+    DATABASES['default']['OPTIONS'] = {
+        'immediate': True,
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': config('SQLITE_SYNCHRONOUS', default='NORMAL'),
+            'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int),
+            'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+            'cache_size': config('SQLITE_CACHE_SIZE', default=-64 * 1024, cast=int),
+        },
+    }
+
+# Реплики только для чтения: DATABASE_REPLICAS=/data/replica1.sqlite3,/data/replica2.sqlite3
+# (NAME реплики; остальные параметры берутся из default). GET-запросы читают с реплик,
+# запись и чтение в пишущих запросах идут в default (main/routers.py).
+DATABASE_REPLICAS = config('DATABASE_REPLICAS', default='', cast=Csv())
+DATABASE_REPLICA_ALIASES = []
+for number, name in enumerate(DATABASE_REPLICAS, 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': name, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICA_ALIASES.append(alias)
+
+DATABASE_ROUTERS = ['main.routers.PrimaryReplicaRouter']
+
+# Сколько секунд после пишущего запроса клиент читает из default (cookie), чтобы видеть
+# свои записи, пока реплика догоняет
+PRIMARY_PIN_SECONDS = config('PRIMARY_PIN_SECONDS', default=5, cast=int)
+
 # DATABASES = {
 #     'default': {
 #         'ENGINE': config('ENGINE'),
@@ -97,6 +130,101 @@ DATABASES = {
 # }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Меню заведений кэшируются здесь; при нескольких процессах нужен общий кэш (Redis, Memcached)
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+
+# Request timing
+# Доля запросов, для которых считаются SQL-запросы и время (Server-Timing, X-Query-Count, лог main.timing).
+# 0 - выключено, 1 - каждый запрос.
+
+REQUEST_TIMING_SAMPLE_RATE = config('REQUEST_TIMING_SAMPLE_RATE', default=0.0, cast=float)
+
+
+# Request profiler
+# Запрос с подписанным токеном (manage.py profile_token) в X-Profile или ?profile=
+# выполняется под профайлером; профиль пишется в PROFILER_DIR.
+
+PROFILER_ENABLED = config('PROFILER_ENABLED', default=False, cast=bool)
+PROFILER_DIR = config('PROFILER_DIR', default=str(BASE_DIR / 'profiles'))
+PROFILER_MODE = config('PROFILER_MODE', default='cprofile')  # cprofile | sampling
+PROFILER_SAMPLE_INTERVAL = config('PROFILER_SAMPLE_INTERVAL', default=0.005, cast=float)
+PROFILER_TOKEN_MAX_AGE = config('PROFILER_TOKEN_MAX_AGE', default=3600, cast=int)
+
+# Инструментирующие middleware подключаются, только когда включены: они синхронные,
+# и под ASGI каждая из них стоила бы переключения в поток на каждый запрос.
+if PROFILER_ENABLED:
+    MIDDLEWARE.insert(0, 'main.middleware.ProfilerMiddleware')
+if REQUEST_TIMING_SAMPLE_RATE > 0:
+    MIDDLEWARE.insert(0, 'main.middleware.RequestTimingMiddleware')
+if DATABASE_REPLICA_ALIASES:
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.common.CommonMiddleware'), 'main.middleware.ReplicaReadMiddleware')
+
+
+# Admission control (main/admission.py): лимиты одновременных запросов по полосам и скорости
+# запросов клиента; лишние запросы сразу получают 429/503 с Retry-After.
+
+ADMISSION_CONTROL = config('ADMISSION_CONTROL', default=False, cast=bool)
+# пишущие запросы этих маршрутов идут без ограничений (полоса priority)
+ADMISSION_PRIORITY_ROUTES = config('ADMISSION_PRIORITY_ROUTES', default='create-order,checkout,order-item-list', cast=Csv())
+ADMISSION_REPORT_ROUTES = config('ADMISSION_REPORT_ROUTES', default='revenue-report,establishment-orders', cast=Csv())
+# одновременных запросов на процесс по полосам, 0 - без ограничения
+ADMISSION_CONCURRENCY = {
+    'reports': config('ADMISSION_REPORTS_CONCURRENCY', default=2, cast=int),
+    'reads': config('ADMISSION_READS_CONCURRENCY', default=8, cast=int),
+    'writes': config('ADMISSION_WRITES_CONCURRENCY', default=4, cast=int),
+}
+ADMISSION_CLIENT_RATE = config('ADMISSION_CLIENT_RATE', default=20.0, cast=float)  # токенов в секунду, 0 - без лимита
+ADMISSION_CLIENT_BURST = config('ADMISSION_CLIENT_BURST', default=40, cast=int)
+ADMISSION_REPORT_COST = config('ADMISSION_REPORT_COST', default=5, cast=int)  # токенов за запрос отчёта
+ADMISSION_RETRY_AFTER = config('ADMISSION_RETRY_AFTER', default=1, cast=int)  # секунд в Retry-After при 503
+# заголовок с адресом клиента за прокси (X-Forwarded-For); пусто - REMOTE_ADDR
+ADMISSION_CLIENT_HEADER = config('ADMISSION_CLIENT_HEADER', default='')
+
+if ADMISSION_CONTROL:
+    # первой: отказ не проходит через остальные middleware
+    MIDDLEWARE.insert(0, 'main.middleware.AdmissionControlMiddleware')
+
+
+# Logging
+# https://docs.djangoproject.com/en/4.1/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'main.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'main.profiler': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'order.tasks': {
+            'handlers': ['console'],
+            'level': config('TASKS_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -139,3 +267,62 @@ STATIC_ROOT = BASE_DIR/'staticfiles'
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Django REST framework
+
+REST_FRAMEWORK = {
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'main.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# MessagePack (application/msgpack) в запросах и ответах - если установлен msgpack
+if find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('main.parsers.MessagePackParser')
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('main.renderers.MessagePackRenderer')
+
+# Живая лента заказов (order/live.py, только под ASGI)
+LIVE_REPLAY_SIZE = config('LIVE_REPLAY_SIZE', default=1000, cast=int)  # событий в буфере для Last-Event-ID
+LIVE_QUEUE_SIZE = config('LIVE_QUEUE_SIZE', default=100, cast=int)  # непрочитанных событий, после которых клиент отключается
+LIVE_HEARTBEAT = config('LIVE_HEARTBEAT', default=15, cast=float)  # секунд между ping без событий
+LIVE_RETRY_MS = config('LIVE_RETRY_MS', default=3000, cast=int)
+
+# Отложенные задачи (order/tasks.py). По умолчанию - очередь в БД, её выполняют TASKS_WORKERS потоков
+# веб-процесса (main/wsgi.py, main/asgi.py) и/или manage.py run_tasks (тогда TASKS_WORKERS=0).
+# TASKS_EAGER=True - выполнять после коммита в том же процессе, то есть в потоке запроса (для отладки);
+# сверка сумм заказов тогда не ставится - запускайте manage.py reconcile_totals периодически (cron)
+TASKS_EAGER = config('TASKS_EAGER', default=False, cast=bool)
+TASKS_WORKERS = config('TASKS_WORKERS', default=1, cast=int)
+TASKS_BATCH_SIZE = config('TASKS_BATCH_SIZE', default=100, cast=int)
+TASKS_MAX_ATTEMPTS = config('TASKS_MAX_ATTEMPTS', default=5, cast=int)
+TASKS_RETRY_DELAY = config('TASKS_RETRY_DELAY', default=2.0, cast=float)  # секунд, удваивается с каждой попыткой
+TASKS_POLL_INTERVAL = config('TASKS_POLL_INTERVAL', default=1.0, cast=float)
+TASKS_LEASE = config('TASKS_LEASE', default=300, cast=int)  # секунд до возврата в очередь задачи упавшего воркера
+TASKS_KEEP_DONE = config('TASKS_KEEP_DONE', default=3600, cast=int)  # секунд хранения выполненных (для метрик)
+TASKS_CLEANUP_INTERVAL = config('TASKS_CLEANUP_INTERVAL', default=60, cast=int)
+
+# Архив заказов (order/archive.py, manage.py archive_orders): оплаченные заказы старше
+# ARCHIVE_AFTER_DAYS дней переносятся пачками по ARCHIVE_BATCH_SIZE заказов
+ARCHIVE_AFTER_DAYS = config('ARCHIVE_AFTER_DAYS', default=90, cast=int)
+ARCHIVE_BATCH_SIZE = config('ARCHIVE_BATCH_SIZE', default=500, cast=int)
+
+# Админка: списки таблиц не меньше этого числа строк показывают оценку числа строк вместо COUNT(*)
+ADMIN_ESTIMATED_COUNT_FROM = config('ADMIN_ESTIMATED_COUNT_FROM', default=100000, cast=int)
+
+# Поиск продуктов (order/search.py): путь к классу бэкенда; пусто - по СУБД (SQLite FTS5, PostgreSQL tsvector)
+PRODUCT_SEARCH_BACKEND = config('PRODUCT_SEARCH_BACKEND', default='')
+
+# Размер страницы списков по умолчанию (order/pagination.py) и наибольший page_size,
+# который клиент может запросить через ?page_size=
+PAGE_SIZE = config('PAGE_SIZE', default=50, cast=int)
+MAX_PAGE_SIZE = config('MAX_PAGE_SIZE', default=500, cast=int)
+
+# Сколько строк читать из БД за раз в потоковых ответах (?stream=1)
+STREAM_CHUNK_SIZE = config('STREAM_CHUNK_SIZE', default=500, cast=int)
@@ -14,4 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
 
 application = get_wsgi_application()
+
+from order import tasks  # noqa: E402  (модели доступны только после setup)
+
+# воркеры очереди задач в этом процессе, если TASKS_EAGER=False и TASKS_WORKERS > 0
+tasks.start_local_workers()
 app = application
@@ -1,12 +1,157 @@
+import calendar
+from datetime import datetime
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from order.models import Order, Establishment, OrderItem, Product, Delivery, parse_id
+
+
+def estimated_count(queryset):
+    """
+    Оценка числа строк таблицы по статистике БД без COUNT(*): pg_class.reltuples в PostgreSQL,
+    sqlite_stat1 (после ANALYZE) или наибольший id в SQLite. None, если оценить нельзя.
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+            return queryset.model._default_manager.using(queryset.db).aggregate(last=Max('pk'))['last'] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Страницы без COUNT(*) по всей таблице: без фильтров число строк берётся из оценки,
+    если в таблице не меньше ADMIN_ESTIMATED_COUNT_FROM строк; с фильтрами считается точно.
+    """
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_FROM:
+                return estimate
+        return super().count
+
+
+class IndexedDatesQuerySetMixin:
+    """
+    dates()/datetimes() для панели date_hierarchy: вместо DISTINCT по усечённой дате всех строк
+    (полный проход, в SQLite - с функцией Python на каждой строке) наличие строк в каждом
+    году/месяце/дне проверяется запросом EXISTS по диапазону индексированного поля.
+    """
+
+    def aggregate(self, *args, **kwargs):
+        # панель date_hierarchy сначала берёт aggregate(first=Min(поле), last=Max(поле)):
+        # SQLite берёт из индекса только один MIN или MAX на запрос, поэтому - два запроса по индексу
+        if not args and set(kwargs) == {'first', 'last'} \
+                and isinstance(kwargs['first'], Min) and isinstance(kwargs['last'], Max):
+            return self.bounds(kwargs['first'].source_expressions[0].name)
+        return super().aggregate(*args, **kwargs)
+
+    def bounds(self, field_name):
+        values = self.order_by().values_list(field_name, flat=True)
+        return {'first': values.order_by(field_name).first(), 'last': values.order_by(f'-{field_name}').first()}
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None, is_dst=None):
+        return self.indexed_periods(field_name, kind, aware=True)
 
-from order.models import Order, Establishment, OrderItem, Product, Delivery
+    def dates(self, field_name, kind, order='ASC'):
+        return [period.date() for period in self.indexed_periods(field_name, kind, aware=False)]
+
+    def indexed_periods(self, field_name, kind, aware):
+        bounds = self.bounds(field_name)
+        if bounds['first'] is None:
+            return []
+        first, last = bounds['first'], bounds['last']
+        if aware:
+            first, last = timezone.localtime(first), timezone.localtime(last)
+        start = datetime(first.year, first.month if kind != 'year' else 1, first.day if kind == 'day' else 1)
+        periods = []
+        while start.date() <= (last.date() if isinstance(last, datetime) else last):
+            end = next_period(start, kind)
+            lower, upper = (timezone.make_aware(start), timezone.make_aware(end)) if aware else (start.date(), end.date())
+            if self.has_rows(field_name, lower, upper):
+                periods.append(lower if aware else start)
+            start = end
+        return periods
+
+    def has_rows(self, field_name, lower, upper):
+        probe = self.model._default_manager.using(self.db).filter(**{f'{field_name}__gte': lower, f'{field_name}__lt': upper})
+        if self.query.distinct:
+            return self.filter(pk__in=probe.values('pk')).exists()
+        # границы пробы - первыми в WHERE: SQLite берёт для диапазона по индексу первое условие
+        # на поле, а фильтр уже открытого месяца или года заставил бы идти от его начала
+        return (probe & self).exists()
+
+
+def next_period(start, kind):
+    if kind == 'year':
+        return start.replace(year=start.year + 1)
+    if kind == 'month':
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    days = calendar.monthrange(start.year, start.month)[1]
+    if start.day < days:
+        return start.replace(day=start.day + 1)
+    return next_period(start.replace(day=1), 'month')
+
+
+class IndexedDateHierarchyChangeList(ChangeList):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # результаты уже выбраны; этот queryset дальше читает только панель date_hierarchy
+        queryset = self.queryset._chain()
+        queryset.__class__ = type(f'Indexed{queryset.__class__.__name__}', (IndexedDatesQuerySetMixin, queryset.__class__), {})
+        self.queryset = queryset
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """ Список без COUNT(*) всей таблицы на каждой странице и с date_hierarchy по индексу """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return IndexedDateHierarchyChangeList
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'order_type', 'created_at', 'modified_at', 'total', 'paid']
-    list_filter = ['order_type']
+class OrderAdmin(LargeTableAdmin):
+    list_display = ['id', 'order_type', 'establishment', 'created_at', 'modified_at', 'total', 'paid']
+    list_filter = ['order_type', 'paid']
+    list_select_related = ['establishment']
+    # поиск по номеру заказа - для автодополнения заказа в единицах заказа и доставках
+    search_fields = ['id']
+    date_hierarchy = 'created_at'
+    # порядок индекса order_created_at_id_idx
+    ordering = ['-created_at', '-id']
+    # ведутся по единицам заказа (Order.DERIVED_FIELDS), из формы не сохраняются
+    readonly_fields = Order.DERIVED_FIELDS
+
+    def get_search_results(self, request, queryset, search_term):
+        # '=id' дало бы id LIKE '12' по всей таблице; номер заказа ищется по первичному ключу
+        if not search_term.strip():
+            return queryset, False
+        # parse_id: '²' проходит isdigit(), но не int(), а число больше 64 бит не влезает в запрос
+        pk = parse_id(search_term)
+        return (queryset.filter(pk=pk) if pk is not None else queryset.none()), False
 
 
 @admin.register(Establishment)
@@ -17,20 +162,25 @@ class EstablishmentAdmin(admin.ModelAdmin):
 
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(LargeTableAdmin):
     list_display = ['id', 'order', 'product', 'amount']
+    list_select_related = ['order', 'product']
+    autocomplete_fields = ['order', 'product']
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = ['id', 'name', 'price', 'cafe']
     list_filter = ['cafe']
-    search_fields = ['name', 'cafe']
+    list_select_related = ['cafe']
+    search_fields = ['name', 'cafe__name']
+    autocomplete_fields = ['cafe']
 
 
 @admin.register(Delivery)
-class DeliveryAdmin(admin.ModelAdmin):
-    list_display = ['id', 'address', 'phone', 'description']
-    list_filter = ['phone']
-    search_fields = ['address', 'description']
-
+class DeliveryAdmin(LargeTableAdmin):
+    list_display = ['id', 'address', 'phone', 'description', 'order']
+    list_select_related = ['order']
+    # фильтр по телефону выводил в боковую панель все различные номера таблицы
+    search_fields = ['address', 'description', '=phone']
+    autocomplete_fields = ['order']
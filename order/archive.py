@@ -0,0 +1,79 @@
+"""
+Архив заказов: оплаченные заказы старше ARCHIVE_AFTER_DAYS дней вместе с единицами заказа
+и доставками переносятся в таблицы ArchivedOrder / ArchivedOrderItem / ArchivedDelivery,
+чтобы рабочие таблицы и их индексы содержали только актуальные заказы.
+
+Перенос идёт пачками по batch_size заказов, каждая пачка - отдельная транзакция: копирование
+в архив и удаление из рабочих таблиц видны вместе или не видны вовсе. Удаление не отправляет
+сигналы моделей: сводки выручки уже учитывают эти заказы, а их пересчёт (order/reports.py)
+читает и архив. Архив доступен только для чтения: /order/archive/order/ (manage.py archive_orders).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from order.models import ArchivedDelivery, ArchivedOrder, ArchivedOrderItem, Delivery, Order, OrderItem
+
+ORDER_FIELDS = ('id', 'order_type', 'establishment_id', 'created_at', 'modified_at', 'subtotal', 'total', 'paid')
+ITEM_FIELDS = ('id', 'order_id', 'product_id', 'amount')
+DELIVERY_FIELDS = ('id', 'address', 'phone', 'description', 'order_id')
+
+
+def cutoff(days=None):
+    return timezone.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS if days is None else days)
+
+
+def archivable(before):
+    """ Заказы, которые можно перенести: оплаченные и созданные раньше before """
+    return Order.objects.filter(paid=True, created_at__lt=before)
+
+
+def archive_orders(before=None, batch_size=None, limit=None):
+    """
+    Переносит в архив заказы archivable(before) пачками, от старых к новым.
+    Возвращает число перенесённых заказов, единиц заказа и доставок.
+    """
+    before = before or cutoff()
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    moved = {'orders': 0, 'items': 0, 'deliveries': 0}
+    while limit is None or moved['orders'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved['orders'])
+        ids = list(archivable(before).order_by('created_at', 'id').values_list('id', flat=True)[:size])
+        if not ids:
+            break
+        for key, count in archive_batch(ids, before).items():
+            moved[key] += count
+    return moved
+
+
+def archive_batch(order_ids, before):
+    with transaction.atomic():
+        # блокировка строк (в PostgreSQL) не даёт добавить единицу заказа, пока заказ переносится;
+        # условия повторяются: заказ могли изменить после выбора пачки
+        orders = list(archivable(before).select_for_update().filter(id__in=order_ids).values(*ORDER_FIELDS))
+        order_ids = [order['id'] for order in orders]
+        items = list(OrderItem.objects.filter(order_id__in=order_ids).values(*ITEM_FIELDS))
+        deliveries = list(Delivery.objects.filter(order_id__in=order_ids).values(*DELIVERY_FIELDS))
+
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders])
+        ArchivedOrderItem.objects.bulk_create([ArchivedOrderItem(**item) for item in items])
+        ArchivedDelivery.objects.bulk_create([ArchivedDelivery(**delivery) for delivery in deliveries])
+
+        # _raw_delete - DELETE без сигналов и без выборки объектов (Order.delete пересчитал бы сводки)
+        for queryset in (
+            Delivery.objects.filter(order_id__in=order_ids),
+            OrderItem.objects.filter(order_id__in=order_ids),
+            Order.objects.filter(id__in=order_ids),
+        ):
+            queryset._raw_delete(queryset.db)
+    return {'orders': len(orders), 'items': len(items), 'deliveries': len(deliveries)}
+
+
+def table_sizes():
+    """ Число строк в рабочих и архивных таблицах заказов """
+    return {
+        model._meta.db_table: model.objects.count()
+        for model in (Order, OrderItem, Delivery, ArchivedOrder, ArchivedOrderItem, ArchivedDelivery)
+    }
@@ -0,0 +1,145 @@
+"""
+Асинхронные версии самых частых GET-запросов для запуска под ASGI (main/asgi.py).
+Данные читаются через async ORM (aiterator, aget, afirst); ответы совпадают с синхронными view.
+Остальные методы тех же маршрутов передаются синхронным DRF view.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotModified
+from django.urls import path, register_converter
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags
+from rest_framework.exceptions import NotFound
+
+from main.renderers import FastJSONRenderer
+from order import fast_serializers, menu_cache, models, pagination, serializers, streaming, views
+from order.converters import IdConverter
+
+
+def render_json(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def not_found():
+    # тот же ответ, что DRF отдаёт на Http404
+    return render_json({'detail': NotFound.default_detail}, status=NotFound.status_code)
+
+
+async def aprefetch_order_relations(orders):
+    """
+    Аналог OrderQuerySet.with_related() для async: aiterator в Django 4.1 не поддерживает
+    prefetch_related, поэтому единицы заказа и доставки читаются двумя запросами
+    и раскладываются в prefetch-кэш заказов.
+    """
+    by_id = {order.id: order for order in orders}
+    order_items = {order_id: [] for order_id in by_id}
+    deliveries = {order_id: [] for order_id in by_id}
+
+    items = models.OrderItem.objects.filter(order_id__in=by_id).select_related('product__cafe').order_by('id')
+    async for item in items.aiterator():
+        item.order = by_id[item.order_id]
+        order_items[item.order_id].append(item)
+    async for delivery in models.Delivery.objects.filter(order_id__in=by_id).order_by('id').aiterator():
+        delivery.order = by_id[delivery.order_id]
+        deliveries[delivery.order_id].append(delivery)
+
+    for order in orders:
+        order._prefetched_objects_cache = {
+            'order_items': _prefetched(order.order_items.all(), order_items[order.id]),
+            'delivery_address': _prefetched(order.delivery_address.all(), deliveries[order.id]),
+        }
+    return orders
+
+
+def _prefetched(queryset, rows):
+    queryset._result_cache = rows
+    queryset._prefetch_done = True
+    return queryset
+
+
+async def order_list(request, order_type=None):
+    orders = models.Order.objects.all()
+    if order_type is not None:
+        orders = orders.filter(order_type=order_type)
+    paginator = pagination.OrderKeysetPagination()
+    try:
+        page_queryset = paginator.get_page_queryset(fast_serializers.OrderSerializer.values(orders), request)
+    except NotFound as e:
+        # плохой курсор: тот же 404, что DRF отдаёт синхронным view
+        return render_json({'detail': e.detail}, status=e.status_code)
+    page = paginator.paginate_rows([row async for row in page_queryset.aiterator()])
+    data = await fast_serializers.OrderSerializer(page, many=True).adata()
+    return render_json(paginator.get_paginated_data(data))
+
+
+async def order_detail(request, pk):
+    modified_at = await models.Order.objects.filter(pk=pk).values_list('modified_at', flat=True).afirst()
+    if modified_at is None:
+        return not_found()
+    etag, last_modified = views.order_validators(pk, modified_at)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        try:
+            order = await models.Order.objects.aget(pk=pk)
+        except models.Order.DoesNotExist:
+            return not_found()
+        await aprefetch_order_relations([order])
+        response = render_json(serializers.OrderDetailSerializer(order).data)
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+async def establishment_menu(request, pk):
+    version = await menu_cache.aget_version(pk)
+    etag = menu_cache.get_etag(version)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return HttpResponseNotModified(headers={'ETag': etag})
+
+    payload = await menu_cache.aget_payload(pk, version)
+    if payload is None:
+        try:
+            establishment = await models.Establishment.objects.aget(pk=pk)
+        except models.Establishment.DoesNotExist:
+            return not_found()
+        products = establishment.products.select_related('cafe').order_by('id')
+        payload = FastJSONRenderer().render({
+            'establishment': serializers.EstablishmentSerializer(establishment).data,
+            'products': serializers.ProductSerializer([p async for p in products.aiterator()], many=True).data,
+        })
+        await menu_cache.aset_payload(pk, version, payload)
+
+    return HttpResponse(payload, content_type='application/json', headers={
+        'ETag': etag,
+        'Cache-Control': 'no-cache',
+    })
+
+
+def async_reads(async_view, sync_view, **view_kwargs):
+    """ GET/HEAD обслуживает async_view, остальные методы - синхронный DRF view """
+    sync_view = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD') and not streaming.wants_stream(request):
+            return await async_view(request, *args, **kwargs, **view_kwargs)
+        return await sync_view(request, *args, **kwargs)
+    # как у DRF APIView.as_view(); декоратор csrf_exempt в Django 4.1 сделал бы view синхронной
+    view.csrf_exempt = True
+    return view
+
+
+register_converter(IdConverter, 'id')
+
+urlpatterns = [
+    path('order/', async_reads(order_list, views.OrderListAPIView.as_view()), name='order-list'),
+    path('order/<int:pk>/', async_reads(order_detail, views.OrderDetailAPIView.as_view()), name='order-detail'),
+    path('establishment/<id:pk>/menu/',
+         async_reads(establishment_menu, views.EstablishmentMenuAPIView.as_view()), name='establishment-menu'),
+    path('get/delivery-orders/',
+         async_reads(order_list, views.DeliveryOrderListAPIView.as_view(), order_type=2), name='delivery-orders'),
+    path('get/in-place-orders/',
+         async_reads(order_list, views.InPlaceOrderListAPIView.as_view(), order_type=1), name='in-place-orders'),
+    path('get/pick-up-orders/',
+         async_reads(order_list, views.PickUpOrderListAPIView.as_view(), order_type=3), name='pick-up-orders'),
+]
@@ -0,0 +1,302 @@
+"""
+Нагрузочный прогон API: сценарии для каждого маршрута order/urls.py,
+замеры латентности, RPS и числа SQL-запросов на запрос.
+"""
+import asyncio
+import json
+import math
+import multiprocessing
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import namedtuple
+from urllib.parse import urlencode
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, connections, transaction
+from django.test import AsyncClient, Client
+from django.test.client import MULTIPART_CONTENT, encode_multipart, BOUNDARY
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from order import models
+from order.urls import urlpatterns
+
+# body - функция без аргументов, возвращающая (bytes, content_type) или None
+Scenario = namedtuple('Scenario', 'route method path body')
+
+Result = namedtuple('Result', 'route method requests errors p50 p95 p99 rps queries')
+
+
+def form(**data):
+    return lambda: (encode_multipart(BOUNDARY, data), MULTIPART_CONTENT)
+
+
+def as_json(data):
+    return lambda: (json.dumps(data).encode(), 'application/json')
+
+
+def sample_ids():
+    """ id существующих объектов, на которых гоняются detail-маршруты """
+    ids = {}
+    for key, model in (
+        ('order', models.Order),
+        ('item', models.OrderItem),
+        ('product', models.Product),
+        ('delivery', models.Delivery),
+        ('establishment', models.Establishment),
+    ):
+        ids[key] = model.objects.order_by('-id').values_list('id', flat=True).first()
+    if None in ids.values():
+        missing = ', '.join(key for key, value in ids.items() if value is None)
+        raise LookupError(f"no {missing} rows in the database; run manage.py seed_data first")
+    ids['menu_cafe'], name = models.Product.objects.values_list('cafe_id', 'name').get(pk=ids['product'])
+    # префикс первого слова названия - запрос для поиска продуктов
+    ids['search'] = name.split()[0][:3]
+    # архив может быть пуст: тогда detail-маршрут архива не прогоняется
+    ids['archived_order'] = models.ArchivedOrder.objects.order_by('-id').values_list('id', flat=True).first()
+    return ids
+
+
+def build_scenarios(ids):
+    order, item, product = ids['order'], ids['item'], ids['product']
+    delivery, establishment = ids['delivery'], ids['establishment']
+
+    def url(name, pk=None):
+        return reverse(name, kwargs={'pk': pk} if pk is not None else None)
+
+    def unique_name():
+        return f"bench {uuid.uuid4().hex[:12]}"
+
+    def menu_file():
+        content = f"cafe,name,price\n{ids['menu_cafe']},Bench dish,100\n".encode()
+        return encode_multipart(BOUNDARY, {'file': SimpleUploadedFile('menu.csv', content)}), MULTIPART_CONTENT
+
+    def new_establishment():
+        return form(name=unique_name(), description='bench', service_price=10, delivery_price=100)()
+
+    scenarios = [
+        Scenario('order-list', 'GET', url('order-list'), None),
+        Scenario('order-list', 'POST', url('order-list'), form(order_type=1)),
+        Scenario('order-detail', 'GET', url('order-detail', order), None),
+        Scenario('order-detail', 'PATCH', url('order-detail', order), form(order_type=1)),
+        Scenario('order-detail', 'DELETE', url('order-detail', order), None),
+        Scenario('order-item-list', 'GET', url('order-item-list'), None),
+        Scenario('order-item-list', 'POST', url('order-item-list'), form(order=order, product=product, amount=1)),
+        Scenario('order-item-detail', 'GET', url('order-item-detail', item), None),
+        Scenario('order-item-detail', 'PATCH', url('order-item-detail', item), form(amount=2)),
+        Scenario('order-item-detail', 'DELETE', url('order-item-detail', item), None),
+        Scenario('product-list', 'GET', url('product-list'), None),
+        Scenario('product-list', 'POST', url('product-list'), form(name='Bench dish', price=100, cafe=establishment)),
+        Scenario('product-detail', 'GET', url('product-detail', product), None),
+        Scenario('product-detail', 'DELETE', url('product-detail', product), None),
+        Scenario('product-import', 'POST', url('product-import'), menu_file),
+        Scenario('product-search', 'GET', f"{url('product-search')}?{urlencode({'q': ids['search']})}", None),
+        Scenario('delivery-list', 'GET', url('delivery-list'), None),
+        Scenario('delivery-list', 'POST', url('delivery-list'),
+                 form(order=order, address='Bench street 1', phone='+996555000000', description='bench')),
+        Scenario('delivery-detail', 'GET', url('delivery-detail', delivery), None),
+        Scenario('delivery-detail', 'DELETE', url('delivery-detail', delivery), None),
+        Scenario('establishment-list', 'GET', url('establishment-list'), None),
+        Scenario('establishment-list', 'POST', url('establishment-list'), new_establishment),
+        Scenario('establishment-detail', 'GET', url('establishment-detail', establishment), None),
+        Scenario('establishment-detail', 'PATCH', url('establishment-detail', establishment), form(description='bench')),
+        Scenario('establishment-menu', 'GET', url('establishment-menu', ids['menu_cafe']), None),
+        Scenario('delivery-orders', 'GET', url('delivery-orders'), None),
+        Scenario('in-place-orders', 'GET', url('in-place-orders'), None),
+        Scenario('pick-up-orders', 'GET', url('pick-up-orders'), None),
+        Scenario('establishment-orders', 'GET', url('establishment-orders', ids['menu_cafe']), None),
+        Scenario('create-order', 'POST', url('create-order'), form(product=product, amount=1)),
+        Scenario('checkout', 'POST', url('checkout'), as_json({'items': [{'product': product, 'amount': 2}]})),
+        Scenario('revenue-report', 'GET', url('revenue-report'), None),
+        Scenario('archived-order-list', 'GET', url('archived-order-list'), None),
+    ]
+    if ids.get('archived_order') is not None:
+        scenarios.append(Scenario('archived-order-detail', 'GET', url('archived-order-detail', ids['archived_order']), None))
+    return scenarios
+
+
+def uncovered_routes(scenarios):
+    covered = {scenario.route for scenario in scenarios}
+    return sorted(pattern.name for pattern in urlpatterns if pattern.name not in covered)
+
+
+def percentile(values, fraction):
+    """ Перцентиль методом nearest-rank по отсортированному списку """
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+def summarize(scenario, timings, errors, queries, elapsed):
+    timings = sorted(timings)
+    return Result(
+        route=scenario.route,
+        method=scenario.method,
+        requests=len(timings),
+        errors=errors,
+        p50=percentile(timings, 0.50) * 1000,
+        p95=percentile(timings, 0.95) * 1000,
+        p99=percentile(timings, 0.99) * 1000,
+        rps=len(timings) / elapsed if elapsed else 0.0,
+        queries=sum(queries) / len(queries) if queries else None,
+    )
+
+
+def run_in_process(scenario, requests, client=None):
+    """
+    Прогон через Django test client. Каждый запрос выполняется в транзакции,
+    которая откатывается, поэтому пишущие сценарии не меняют данные.
+    """
+    client = client or Client(raise_request_exception=False)
+    timings, queries, errors = [], [], 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        body, content_type = scenario.body() if scenario.body else (b'', 'application/octet-stream')
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                begin = time.perf_counter()
+                response = client.generic(scenario.method, scenario.path, body, content_type)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append(time.perf_counter() - begin)
+            transaction.set_rollback(True)
+        queries.append(len(captured))
+        errors += response.status_code >= 400
+    return summarize(scenario, timings, errors, queries, time.perf_counter() - started)
+
+
+def run_live(scenario, requests, base_url):
+    """ Прогон по HTTP против запущенного сервера (runserver, gunicorn, uvicorn) """
+    timings, queries, errors = [], [], 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        body, content_type = scenario.body() if scenario.body else (None, None)
+        request = urllib.request.Request(base_url.rstrip('/') + scenario.path, data=body, method=scenario.method)
+        if content_type:
+            request.add_header('Content-Type', content_type)
+        begin = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                query_count = response.headers.get('X-Query-Count')
+        except urllib.error.HTTPError as e:
+            e.read()
+            query_count = e.headers.get('X-Query-Count')
+            errors += 1
+        timings.append(time.perf_counter() - begin)
+        if query_count is not None:
+            queries.append(int(query_count))
+    return summarize(scenario, timings, errors, queries, time.perf_counter() - started)
+
+
+def run_concurrent_wsgi(scenario, concurrency, requests):
+    """ requests GET-запросов через WSGI-обработчик из concurrency потоков """
+    per_worker = [requests // concurrency + (n < requests % concurrency) for n in range(concurrency)]
+
+    def worker(count):
+        client = Client(raise_request_exception=False)
+        timings, errors = [], 0
+        try:
+            for _ in range(count):
+                begin = time.perf_counter()
+                response = client.get(scenario.path)
+                timings.append(time.perf_counter() - begin)
+                errors += response.status_code >= 400
+        finally:
+            connections.close_all()
+        return timings, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, per_worker))
+    elapsed = time.perf_counter() - started
+    timings = [t for worker_timings, _ in results for t in worker_timings]
+    return summarize(scenario, timings, sum(errors for _, errors in results), [], elapsed)
+
+
+_write_scenario = None
+
+
+def _init_writer(scenario):
+    global _write_scenario
+    _write_scenario = scenario
+
+
+def _write(count):
+    client = Client()
+    timings, errors, locked = [], 0, 0
+    for _ in range(count):
+        body, content_type = _write_scenario.body()
+        begin = time.perf_counter()
+        try:
+            response = client.generic(_write_scenario.method, _write_scenario.path, body, content_type)
+            errors += response.status_code >= 400
+        except OperationalError as e:
+            errors += 1
+            locked += 'locked' in str(e)
+        timings.append(time.perf_counter() - begin)
+    connections.close_all()
+    return timings, errors, locked
+
+
+def run_concurrent_writes(scenario, concurrency, requests):
+    """
+    requests пишущих запросов из concurrency процессов (в потоках писатели упирались бы в GIL,
+    а не в блокировки SQLite). Возвращает (Result, locked): locked - сколько запросов
+    упало с "database is locked".
+    """
+    per_worker = [requests // concurrency + (n < requests % concurrency) for n in range(concurrency)]
+    # дочерние процессы (fork) не должны унаследовать открытое подключение
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(concurrency, mp_context=context, initializer=_init_writer, initargs=(scenario,)) as pool:
+        results = list(pool.map(_write, per_worker))
+    elapsed = time.perf_counter() - started
+    timings = [t for worker_timings, _, _ in results for t in worker_timings]
+    errors = sum(r[1] for r in results)
+    return summarize(scenario, timings, errors, [], elapsed), sum(r[2] for r in results)
+
+
+async def run_concurrent_asgi(scenario, concurrency, requests):
+    """ requests GET-запросов через ASGI-обработчик, не больше concurrency одновременно """
+    client = AsyncClient(raise_request_exception=False)
+    semaphore = asyncio.Semaphore(concurrency)
+    timings, errors = [], 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            begin = time.perf_counter()
+            response = await client.get(scenario.path)
+            timings.append(time.perf_counter() - begin)
+            errors += response.status_code >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return summarize(scenario, timings, errors, [], time.perf_counter() - started)
+
+
+def time_calls(fn, repeat):
+    """ Время каждого из repeat вызовов fn(), отсортированное """
+    timings = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - begin)
+    return sorted(timings)
+
+
+def format_results(results):
+    lines = [f"{'route':<22} {'method':<7} {'reqs':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} "
+             f"{'p99 ms':>9} {'req/s':>9} {'queries':>8}"]
+    for r in results:
+        queries = f"{r.queries:.1f}" if r.queries is not None else '-'
+        lines.append(f"{r.route:<22} {r.method:<7} {r.requests:>6} {r.errors:>5} {r.p50:>9.2f} {r.p95:>9.2f} "
+                     f"{r.p99:>9.2f} {r.rps:>9.1f} {queries:>8}")
+    return '\n'.join(lines)
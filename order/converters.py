@@ -0,0 +1,15 @@
+from order import models
+
+
+class IdConverter:
+    """ Как <int:...>, но id больше 64 бит - 404, а не OverflowError в запросе к базе """
+    regex = '[0-9]+'
+
+    def to_python(self, value):
+        value = int(value)
+        if value > models.MAX_ID:
+            raise ValueError(value)
+        return value
+
+    def to_url(self, value):
+        return str(value)
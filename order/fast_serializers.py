@@ -0,0 +1,192 @@
+"""
+Быстрые сериализаторы списков только для чтения.
+
+Строят ответ из строк .values() вместо обхода полей DRF-сериализатора для каждого объекта
+и дают тот же результат, что сериализаторы из order/serializers.py (проверяется в order/tests.py).
+Строковые представления связанных объектов повторяют __str__ моделей:
+Order - "id: X, order_type: Y", Product и Establishment - "id: X, name: Y".
+
+Использование: rows = OrderSerializer.values(queryset); OrderSerializer(rows, many=True).data
+"""
+from collections import defaultdict
+
+from rest_framework import serializers as drf_serializers
+
+from order import models, serializers
+
+# DateTimeField DRF: перевод в текущую таймзону, ISO 8601, 'Z' вместо '+00:00'
+_datetime = drf_serializers.DateTimeField().to_representation
+
+
+def _order_str(order_id, order_type):
+    return f"id: {order_id}, order_type: {order_type}"
+
+
+def _name_str(pk, name):
+    return f"id: {pk}, name: {name}"
+
+
+class FastSerializer:
+    """ Повторяет вывод serializer_class для строк, выбранных через values(queryset) """
+    serializer_class = None
+    fields = ()
+
+    def __init__(self, instance, many=False):
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def values(cls, queryset):
+        # prefetch_related не работает с .values(), связанные строки читает prefetch()
+        return queryset.prefetch_related(None).values(*cls.fields)
+
+    @property
+    def data(self):
+        rows = list(self.instance) if self.many else [self.instance]
+        self.prefetch(rows)
+        return self.represent(rows)
+
+    async def adata(self):
+        rows = list(self.instance) if self.many else [self.instance]
+        await self.aprefetch(rows)
+        return self.represent(rows)
+
+    def represent(self, rows):
+        data = [self.to_representation(row) for row in rows]
+        return data if self.many else data[0]
+
+    def prefetch(self, rows):
+        pass
+
+    async def aprefetch(self, rows):
+        pass
+
+    def to_representation(self, row):
+        raise NotImplementedError
+
+
+class OrderItemSerializer(FastSerializer):
+    serializer_class = serializers.OrderItemSerializer
+    fields = ('id', 'order_id', 'order__order_type', 'product_id', 'product__name', 'amount')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'order': _order_str(row['order_id'], row['order__order_type']),
+            # у архивной единицы продукт мог быть удалён (product_id NULL) - как у DRF, None
+            'product': _name_str(row['product_id'], row['product__name']) if row['product_id'] is not None else None,
+            'amount': row['amount'],
+        }
+
+
+class ProductSerializer(FastSerializer):
+    serializer_class = serializers.ProductSerializer
+    fields = ('id', 'name', 'price', 'cafe_id', 'cafe__name')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'price': row['price'],
+            'cafe': _name_str(row['cafe_id'], row['cafe__name']),
+        }
+
+
+class DeliverySerializer(FastSerializer):
+    serializer_class = serializers.DeliverySerializer
+    fields = ('id', 'address', 'phone', 'description', 'order_id', 'order__order_type')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'address': row['address'],
+            'phone': row['phone'],
+            'description': row['description'],
+            'order': _order_str(row['order_id'], row['order__order_type']),
+        }
+
+
+class OrderSerializer(FastSerializer):
+    """
+    Заказы вместе с delivery_address и order_items: связанные строки страницы
+    читаются двумя запросами, как при with_related().
+    """
+    serializer_class = serializers.OrderSerializer
+    fields = ('id', 'order_type', 'created_at', 'modified_at', 'total', 'paid')
+    delivery_fields = ('id', 'order_id', 'address', 'phone', 'description')
+
+    @classmethod
+    def values(cls, queryset):
+        fields = cls.fields
+        if 'computed_total' in queryset.query.annotations:
+            # current_total: сумма из with_totals, если она посчитана
+            fields += ('computed_total',)
+        return queryset.prefetch_related(None).values(*fields)
+
+    delivery_model = models.Delivery
+    item_model = models.OrderItem
+
+    def related_querysets(self, rows):
+        order_ids = [row['id'] for row in rows]
+        deliveries = self.delivery_model.objects.filter(order_id__in=order_ids).order_by('id').values(*self.delivery_fields)
+        items = OrderItemSerializer.values(self.item_model.objects.filter(order_id__in=order_ids).order_by('id'))
+        return deliveries, items
+
+    def prefetch(self, rows):
+        if rows:
+            deliveries, items = self.related_querysets(rows)
+            self.group(deliveries, items)
+
+    async def aprefetch(self, rows):
+        if rows:
+            deliveries, items = self.related_querysets(rows)
+            self.group([row async for row in deliveries.aiterator()], [row async for row in items.aiterator()])
+
+    def group(self, deliveries, items):
+        self.deliveries = defaultdict(list)
+        for row in deliveries:
+            self.deliveries[row['order_id']].append({
+                'id': row['id'],
+                'address': row['address'],
+                'phone': row['phone'],
+                'description': row['description'],
+            })
+        item_serializer = OrderItemSerializer(None)
+        self.items = defaultdict(list)
+        for row in items:
+            self.items[row['order_id']].append(item_serializer.to_representation(row))
+
+    def to_representation(self, row):
+        ret = {
+            'id': row['id'],
+            'order_type': row['order_type'],
+            'created_at': _datetime(row['created_at']),
+            'modified_at': _datetime(row['modified_at']),
+            'total': row['computed_total'] if 'computed_total' in row else row['total'],
+            'paid': row['paid'],
+        }
+        delivery_address = self.deliveries.get(row['id'])
+        if delivery_address:
+            ret['delivery_address'] = delivery_address
+        order_items = self.items.get(row['id'])
+        if order_items:
+            ret['order_items'] = order_items
+        return ret
+
+
+class ArchivedOrderSerializer(OrderSerializer):
+    """ Заказы из архива: связанные строки - из архивных таблиц """
+    serializer_class = serializers.ArchivedOrderSerializer
+    delivery_model = models.ArchivedDelivery
+    item_model = models.ArchivedOrderItem
+
+
+FAST_SERIALIZERS = {
+    fast.serializer_class: fast
+    for fast in (OrderSerializer, OrderItemSerializer, ProductSerializer, DeliverySerializer, ArchivedOrderSerializer)
+}
+
+
+def for_serializer(serializer_class):
+    """ Быстрый аналог DRF-сериализатора или None, если его нет """
+    return FAST_SERIALIZERS.get(serializer_class)
@@ -0,0 +1,195 @@
+"""
+Живая лента заказов (Server-Sent Events) для экранов кухни и курьеров.
+
+События created / updated / paid публикуются из сигналов моделей (order/signals.py) после
+коммита транзакции и раздаются подписчикам внутри процесса: у каждого процесса свой брокер,
+поэтому под несколькими воркерами клиент видит изменения, сделанные в его процессе.
+Последние LIVE_REPLAY_SIZE событий хранятся для переподключений (заголовок Last-Event-ID);
+если клиент отстал сильнее, он получает событие reset и должен перечитать список.
+
+Лента - отдельное ASGI-приложение (sse_app), main/asgi.py направляет в него /order/live/:
+    GET /order/live/?establishment=1&order_type=1&order_type=3
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+from functools import partial
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers as drf_serializers
+
+from order.models import Order
+
+EVENT_FIELDS = ('id', 'establishment_id', 'order_type', 'paid', 'total', 'modified_at')
+
+_datetime = drf_serializers.DateTimeField().to_representation
+
+
+class Event:
+    __slots__ = ('id', 'kind', 'establishment', 'order_type', 'payload')
+
+    def __init__(self, id, kind, order):
+        self.id = id
+        self.kind = kind
+        self.establishment = order['establishment_id']
+        self.order_type = order['order_type']
+        data = {**order, 'modified_at': _datetime(order['modified_at'])}
+        self.payload = f"id: {id}\nevent: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+class Subscription:
+
+    def __init__(self, loop, establishment=None, order_types=None):
+        self.loop = loop
+        self.establishment = establishment
+        self.order_types = order_types
+        # None в очереди - конец ленты (клиент отключился или не успевает читать)
+        self.queue = asyncio.Queue()
+
+    def matches(self, event):
+        return (
+            (self.establishment is None or event.establishment == self.establishment)
+            and (not self.order_types or event.order_type in self.order_types)
+        )
+
+    def deliver(self, event):
+        """ Вызывается в потоке event loop подписчика """
+        if self.queue.qsize() >= settings.LIVE_QUEUE_SIZE:
+            # медленный клиент отключается; после переподключения он догонит по Last-Event-ID
+            event = None
+        self.queue.put_nowait(event)
+
+    def close(self):
+        self.queue.put_nowait(None)
+
+
+class Broker:
+
+    def __init__(self, replay_size):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+        self.replay = deque(maxlen=replay_size)
+        self.last_id = 0
+        # лента включается, когда поднято ASGI-приложение; под WSGI публикация ничего не делает
+        self.active = False
+
+    def subscribe(self, loop, establishment=None, order_types=None, last_event_id=None):
+        """
+        Подписка и пропущенные после last_event_id события из буфера.
+        Вместо списка возвращается 'reset', если часть пропущенных событий уже вытеснена
+        из буфера или last_event_id выдан до перезапуска процесса.
+        """
+        subscription = Subscription(loop, establishment, order_types)
+        with self.lock:
+            self.subscriptions.add(subscription)
+            if last_event_id is None:
+                return subscription, []
+            oldest = self.replay[0].id if self.replay else self.last_id + 1
+            if last_event_id > self.last_id or oldest > last_event_id + 1:
+                return subscription, 'reset'
+            missed = [event for event in self.replay if event.id > last_event_id]
+        return subscription, [event for event in missed if subscription.matches(event)]
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, kind, orders):
+        with self.lock:
+            events = []
+            for order in orders:
+                self.last_id += 1
+                events.append(Event(self.last_id, kind, order))
+            self.replay.extend(events)
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            for event in events:
+                if subscription.matches(event):
+                    subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+
+    def publish_orders(self, kind, order_ids):
+        """ Опубликовать состояние заказов после коммита текущей транзакции """
+        if self.active and order_ids:
+            transaction.on_commit(partial(self._publish_orders, kind, list(order_ids)))
+
+    def _publish_orders(self, kind, order_ids):
+        orders = Order.objects.filter(id__in=order_ids).values(*EVENT_FIELDS)
+        self.publish(kind, [order for order in orders if order['establishment_id'] is not None])
+
+
+broker = Broker(settings.LIVE_REPLAY_SIZE)
+
+
+def parse_filters(query_string):
+    params = parse_qs(query_string.decode('latin-1'))
+    establishment = int(params['establishment'][0]) if 'establishment' in params else None
+    order_types = {int(value) for value in params.get('order_type', [])}
+    return establishment, order_types
+
+
+async def sse_app(scope, receive, send):
+    """ ASGI-приложение ленты: text/event-stream до отключения клиента """
+    if scope['type'] != 'http' or scope['method'] != 'GET':
+        await _plain_response(send, 405, b'{"detail":"Method not allowed."}')
+        return
+    headers = dict(scope['headers'])
+    try:
+        establishment, order_types = parse_filters(scope['query_string'])
+        last_event_id = headers.get(b'last-event-id')
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        await _plain_response(send, 400, b'{"detail":"Invalid filter."}')
+        return
+
+    loop = asyncio.get_running_loop()
+    subscription, missed = broker.subscribe(loop, establishment, order_types, last_event_id)
+    watcher = loop.create_task(_wait_disconnect(receive, subscription))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        # retry - через сколько миллисекунд браузер переподключается
+        body = f"retry: {settings.LIVE_RETRY_MS}\n\n".encode()
+        if missed == 'reset':
+            body += b'event: reset\ndata: {}\n\n'
+        else:
+            body += b''.join(event.payload for event in missed)
+        await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), settings.LIVE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # комментарий SSE держит соединение через прокси
+                await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+                continue
+            if event is None:
+                break
+            await send({'type': 'http.response.body', 'body': event.payload, 'more_body': True})
+        if not watcher.done():
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        broker.unsubscribe(subscription)
+        watcher.cancel()
+
+
+async def _wait_disconnect(receive, subscription):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            subscription.close()
+            return
+
+
+async def _plain_response(send, status, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from order import archive, benchmark
+
+LIST_ROUTES = ('order-list', 'order-item-list', 'delivery-list')
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит в архив оплаченные заказы старше --days дней (по умолчанию ARCHIVE_AFTER_DAYS) '
+        'вместе с единицами заказа и доставками. С --measure замеряет списки заказов до и после переноса.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Возраст заказа в днях (по умолчанию ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, help='Заказов в транзакции (по умолчанию ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--limit', type=int, help='Перенести не больше стольких заказов')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать заказы для переноса')
+        parser.add_argument('--measure', action='store_true', help='Замерить GET-списки до и после переноса')
+        parser.add_argument('--requests', type=int, default=50, help='Запросов на маршрут при --measure')
+
+    def handle(self, *args, **options):
+        before = archive.cutoff(options['days'])
+        if options['dry_run']:
+            count = archive.archivable(before).count()
+            self.stdout.write(f"orders to archive (created before {before:%Y-%m-%d %H:%M}): {count} (dry run, nothing moved)")
+            return
+
+        sizes = archive.table_sizes()
+        timings = self.measure(options['requests']) if options['measure'] else None
+        moved = archive.archive_orders(before, batch_size=options['batch_size'], limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f"archived orders: {moved['orders']}, items: {moved['items']}, deliveries: {moved['deliveries']}"
+        ))
+
+        after = archive.table_sizes()
+        self.stdout.write(f"{'table':<28} {'before':>10} {'after':>10}")
+        for table, count in sizes.items():
+            self.stdout.write(f"{table:<28} {count:>10} {after[table]:>10}")
+
+        if timings is not None:
+            self.stdout.write(f"{'route':<22} {'p50 before':>11} {'p50 after':>10} {'speedup':>8}")
+            for route, result in self.measure(options['requests']).items():
+                old = timings[route]
+                speedup = old.p50 / result.p50 if result.p50 else 0.0
+                self.stdout.write(f"{route:<22} {old.p50:>11.2f} {result.p50:>10.2f} {speedup:>7.2f}x")
+
+    def measure(self, requests):
+        """ p50 GET-списков рабочих таблиц (сценарии benchmark) """
+        scenarios = benchmark.build_scenarios(benchmark.sample_ids())
+        return {
+            scenario.route: benchmark.run_in_process(scenario, requests)
+            for scenario in scenarios
+            if scenario.method == 'GET' and (scenario.route in LIST_ROUTES or scenario.route.endswith('-orders'))
+        }
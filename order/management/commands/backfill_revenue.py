@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from order import reports
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневные сводки выручки (DailyRevenue) по заказам за период'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', type=date.fromisoformat, help='YYYY-MM-DD, включительно')
+        parser.add_argument('--date-to', type=date.fromisoformat, help='YYYY-MM-DD, включительно')
+        parser.add_argument('--establishment', type=int, action='append', dest='establishments',
+                            help='Только эти заведения (можно несколько раз)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = reports.rebuild(
+            date_from=options['date_from'],
+            date_to=options['date_to'],
+            establishment_ids=options['establishments'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"daily revenue rows: {rows}"))
@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment
+
+from order import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет все маршруты order/urls.py и печатает p50/p95/p99, req/s и SQL-запросы на запрос. '
+        'По умолчанию - в процессе через Django test client с откатом каждого запроса; '
+        'с --url - по HTTP против запущенного сервера.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=3, help='Запросов на прогрев перед замером')
+        parser.add_argument('--route', action='append', dest='routes', help='Только эти маршруты (имя url)')
+        parser.add_argument('--reads-only', action='store_true', help='Только GET-сценарии')
+        parser.add_argument('--url', help='Базовый URL запущенного сервера, например http://127.0.0.1:8000')
+        parser.add_argument('--writes', action='store_true',
+                            help='С --url: выполнять и POST/PATCH (данные сервера изменятся; DELETE не выполняется)')
+        parser.add_argument('--output', help='Сохранить результаты в JSON для сравнения между прогонами')
+
+    def handle(self, *args, **options):
+        try:
+            scenarios = benchmark.build_scenarios(benchmark.sample_ids())
+        except LookupError as e:
+            raise CommandError(e)
+
+        for route in benchmark.uncovered_routes(scenarios):
+            self.stderr.write(f"no scenario for route {route}")
+        if options['routes']:
+            scenarios = [s for s in scenarios if s.route in options['routes']]
+        if options['reads_only'] or (options['url'] and not options['writes']):
+            scenarios = [s for s in scenarios if s.method == 'GET']
+        if options['url']:
+            scenarios = [s for s in scenarios if s.method != 'DELETE']
+
+        if not options['url']:
+            # test client ходит на testserver, которого может не быть в ALLOWED_HOSTS
+            setup_test_environment()
+
+        results = []
+        for scenario in scenarios:
+            if options['url']:
+                benchmark.run_live(scenario, options['warmup'], options['url'])
+                results.append(benchmark.run_live(scenario, options['requests'], options['url']))
+            else:
+                benchmark.run_in_process(scenario, options['warmup'])
+                results.append(benchmark.run_in_process(scenario, options['requests']))
+
+        self.stdout.write(benchmark.format_results(results))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump([result._asdict() for result in results], f, indent=2)
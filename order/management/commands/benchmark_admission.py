@@ -0,0 +1,155 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+
+from order import benchmark, models
+
+
+class PooledWSGIServer(WSGIServer):
+    """ WSGI-сервер с фиксированным пулом потоков, как gunicorn --threads: лишние запросы ждут в очереди """
+    request_queue_size = 256
+
+    def __init__(self, address, threads):
+        super().__init__(address, QuietHandler)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.handle_in_pool, request, client_address)
+
+    def handle_in_pool(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def fetch(url, body=None, content_type=None):
+    request = urllib.request.Request(url, data=body, method='POST' if body else 'GET')
+    if content_type:
+        request.add_header('Content-Type', content_type)
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+
+
+class Command(BaseCommand):
+    help = (
+        'Заказы под наплывом тяжёлых чтений: один клиент гоняет список заказов и отчёт по выручке '
+        'в --flood потоков, пока другой создаёт заказы через checkout. Сервер - пул из --threads потоков; '
+        'сравнивается работа без admission control и с ним. Каждый режим - в отдельном процессе на копии БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Потоков сервера')
+        parser.add_argument('--flood', type=int, default=16, help='Потоков тяжёлых чтений')
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--worker', choices=['off', 'on'], help='Служебный: прогон в текущем режиме, вывод в JSON')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self.run_worker(options['threads'], options['flood'], options['seconds'])
+
+        source = settings.DATABASES['default']['NAME']
+        self.stdout.write(f"{'admission':<10} {'orders':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err':>5} "
+                          f"{'reads ok':>9} {'429':>6} {'503':>6}")
+        for mode in ('off', 'on'):
+            with tempfile.TemporaryDirectory() as directory:
+                database = os.path.join(directory, 'bench.sqlite3')
+                shutil.copyfile(source, database)
+                env = {
+                    **os.environ,
+                    'SQLITE_NAME': database,
+                    'SQLITE_PROFILE': 'True',
+                    'ADMISSION_CONTROL': str(mode == 'on'),
+                    # полосы чтений меньше пула: у priority всегда остаётся свободный поток
+                    'ADMISSION_READS_CONCURRENCY': str(max(1, options['threads'] // 2)),
+                    'ADMISSION_REPORTS_CONCURRENCY': '1',
+                    'REQUEST_TIMING_SAMPLE_RATE': '0',
+                    'PROFILER_ENABLED': 'False',
+                }
+                output = subprocess.run(
+                    [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_admission',
+                     '--worker', mode, '--threads', str(options['threads']), '--flood', str(options['flood']),
+                     '--seconds', str(options['seconds'])],
+                    env=env, check=True, capture_output=True, text=True,
+                ).stdout
+            row = json.loads(output.strip().splitlines()[-1])
+            self.stdout.write(
+                f"{mode:<10} {row['orders']:>7} {row['p50']:>9.2f} {row['p95']:>9.2f} {row['p99']:>9.2f} "
+                f"{row['errors']:>5} {row['reads_ok']:>9} {row['throttled']:>6} {row['rejected']:>6}"
+            )
+
+    def run_worker(self, threads, flood, seconds):
+        product = models.Product.objects.order_by('id').first()
+        if product is None:
+            raise CommandError('no products in the database; run manage.py seed_data first')
+        server = PooledWSGIServer(('127.0.0.1', 0), threads)
+        server.set_app(get_wsgi_application())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        heavy = [
+            f"{base}{reverse('order-list')}?page_size={settings.MAX_PAGE_SIZE}",
+            f"{base}{reverse('revenue-report')}",
+        ]
+        body, content_type = benchmark.as_json({'items': [{'product': product.id, 'amount': 1}]})()
+        checkout = f"{base}{reverse('checkout')}"
+
+        stop = threading.Event()
+        statuses = []
+
+        def flooder(number):
+            while not stop.is_set():
+                statuses.append(fetch(heavy[number % len(heavy)]))
+
+        flooders = [threading.Thread(target=flooder, args=(n,)) for n in range(flood)]
+        for thread in flooders:
+            thread.start()
+        time.sleep(0.5)
+
+        timings, errors = [], 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            begin = time.perf_counter()
+            errors += fetch(checkout, body, content_type) != 201
+            timings.append(time.perf_counter() - begin)
+        stop.set()
+        for thread in flooders:
+            thread.join()
+        server.shutdown()
+
+        timings.sort()
+        self.stdout.write(json.dumps({
+            'orders': len(timings),
+            'errors': errors,
+            'p50': benchmark.percentile(timings, 0.50) * 1000,
+            'p95': benchmark.percentile(timings, 0.95) * 1000,
+            'p99': benchmark.percentile(timings, 0.99) * 1000,
+            'reads_ok': statuses.count(200),
+            'throttled': statuses.count(429),
+            'rejected': statuses.count(503),
+        }))
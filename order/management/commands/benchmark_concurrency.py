@@ -0,0 +1,43 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_test_environment
+
+from order import benchmark
+
+DEFAULT_ROUTES = ['order-list', 'order-detail', 'in-place-orders', 'establishment-menu']
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает, как растёт пропускная способность GET-маршрутов с числом одновременных запросов: '
+        'WSGI (main.urls, поток на запрос) против ASGI (main.asgi_urls, асинхронные view).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--route', action='append', dest='routes', help=f"По умолчанию: {', '.join(DEFAULT_ROUTES)}")
+        parser.add_argument('--concurrency', default='1,8,32,128', help='Уровни конкурентности через запятую')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на каждый уровень')
+
+    def handle(self, *args, **options):
+        try:
+            scenarios = benchmark.build_scenarios(benchmark.sample_ids())
+        except LookupError as e:
+            raise CommandError(e)
+        routes = options['routes'] or DEFAULT_ROUTES
+        scenarios = [s for s in scenarios if s.route in routes and s.method == 'GET']
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        setup_test_environment()
+
+        self.stdout.write(f"{'route':<20} {'mode':<5} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err':>5}")
+        for scenario in scenarios:
+            for level in levels:
+                with override_settings(ROOT_URLCONF='main.urls'):
+                    wsgi = benchmark.run_concurrent_wsgi(scenario, level, options['requests'])
+                with override_settings(ROOT_URLCONF='main.asgi_urls'):
+                    asgi = asyncio.run(benchmark.run_concurrent_asgi(scenario, level, options['requests']))
+                for mode, r in (('wsgi', wsgi), ('asgi', asgi)):
+                    self.stdout.write(
+                        f"{scenario.route:<20} {mode:<5} {level:>5} {r.rps:>9.1f} {r.p50:>9.2f} "
+                        f"{r.p95:>9.2f} {r.p99:>9.2f} {r.errors:>5}"
+                    )
@@ -0,0 +1,75 @@
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.test.client import MULTIPART_CONTENT, encode_multipart, BOUNDARY
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from main import parsers, renderers
+from order import benchmark, models, serializers
+
+
+class Command(BaseCommand):
+    help = (
+        'Стоимость кодирования и разбора: список заказов через JSONRenderer DRF, FastJSONRenderer '
+        'и MessagePack; разбор тела запроса create-order в multipart, form, JSON и MessagePack.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500, help='Заказов в списке')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        orders = list(models.Order.objects.with_related().order_by('-created_at', '-id')[:options['orders']])
+        if not orders:
+            raise CommandError('no orders in the database; run manage.py seed_data first')
+        data = serializers.OrderSerializer(orders, many=True).data
+        repeat = options['repeat']
+
+        encoders = [('drf json', JSONRenderer()), ('fast json', renderers.FastJSONRenderer())]
+        if renderers.msgpack is not None:
+            encoders.append(('msgpack', renderers.MessagePackRenderer()))
+        elif renderers.orjson is None:
+            self.stderr.write('orjson is not installed: fast json falls back to the DRF renderer')
+
+        self.stdout.write(f"{len(orders)} orders")
+        self.stdout.write(f"{'encode':<12} {'p50 ms':>9} {'p95 ms':>9} {'bytes':>9}")
+        bodies = {}
+        for name, renderer in encoders:
+            bodies[name] = body = renderer.render(data)
+            timings = benchmark.time_calls(lambda: renderer.render(data), repeat)
+            self.stdout.write(f"{name:<12} {benchmark.percentile(timings, 0.5) * 1000:>9.2f} "
+                              f"{benchmark.percentile(timings, 0.95) * 1000:>9.2f} {len(body):>9}")
+        if bodies['fast json'] != bodies['drf json']:
+            self.stderr.write('fast json output differs from the DRF renderer')
+
+        decoders = [('json', JSONParser(), bodies['drf json'])]
+        if 'msgpack' in bodies:
+            decoders.append(('msgpack', parsers.MessagePackParser(), bodies['msgpack']))
+        self.stdout.write(f"\n{'decode':<12} {'p50 ms':>9} {'p95 ms':>9}")
+        for name, parser, body in decoders:
+            timings = benchmark.time_calls(lambda: parser.parse(io.BytesIO(body)), repeat)
+            self.stdout.write(f"{name:<12} {benchmark.percentile(timings, 0.5) * 1000:>9.2f} "
+                              f"{benchmark.percentile(timings, 0.95) * 1000:>9.2f}")
+
+        # тело одного запроса create-order через DRF Request.data (вместе с созданием запроса)
+        item = {'product': models.Product.objects.values_list('id', flat=True).first(), 'amount': 2}
+        request_bodies = [
+            ('multipart', encode_multipart(BOUNDARY, item), MULTIPART_CONTENT),
+            ('form', '&'.join(f'{key}={value}' for key, value in item.items()).encode(), 'application/x-www-form-urlencoded'),
+            ('json', JSONRenderer().render(item), 'application/json'),
+        ]
+        request_parsers = [JSONParser(), FormParser(), MultiPartParser()]
+        if renderers.msgpack is not None:
+            request_bodies.append(('msgpack', renderers.MessagePackRenderer().render(item), 'application/msgpack'))
+            request_parsers.append(parsers.MessagePackParser())
+        factory = RequestFactory()
+        self.stdout.write(f"\n{'request body':<12} {'p50 us':>9} {'p95 us':>9}")
+        for name, body, content_type in request_bodies:
+            def parse():
+                return Request(factory.generic('POST', '/', body, content_type), parsers=request_parsers).data
+            timings = benchmark.time_calls(parse, repeat * 20)
+            self.stdout.write(f"{name:<12} {benchmark.percentile(timings, 0.5) * 1e6:>9.1f} "
+                              f"{benchmark.percentile(timings, 0.95) * 1e6:>9.1f}")
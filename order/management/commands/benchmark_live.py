@@ -0,0 +1,96 @@
+import asyncio
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from order import benchmark, live
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон живой ленты (order/live.py): --subscribers подключений к ASGI-приложению '
+        'ленты в одном процессе, память на подключение и задержка раздачи событий от публикации '
+        'до отправки клиенту.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=5000)
+        parser.add_argument('--establishments', type=int, default=50, help='Подписчики делятся по заведениям')
+        parser.add_argument('--events', type=int, default=200)
+        parser.add_argument('--interval', type=float, default=0.01, help='Секунд между событиями')
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(**options))
+
+    async def run(self, subscribers, establishments, events, interval, **options):
+        loop = asyncio.get_running_loop()
+        published = {}
+        latencies = []
+        disconnects = []
+        connected = 0
+
+        async def client(n):
+            nonlocal connected
+            disconnect = loop.create_future()
+            disconnects.append(disconnect)
+
+            async def receive():
+                await disconnect
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                nonlocal connected
+                if message['type'] == 'http.response.start':
+                    connected += 1
+                elif message.get('body', b'').startswith(b'id: '):
+                    event_id = int(message['body'][4:message['body'].index(b'\n')])
+                    latencies.append(time.perf_counter() - published[event_id])
+
+            scope = {
+                'type': 'http', 'method': 'GET', 'path': '/order/live/', 'headers': [],
+                'query_string': f'establishment={n % establishments + 1}'.encode(),
+            }
+            await live.sse_app(scope, receive, send)
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        tasks = [loop.create_task(client(n)) for n in range(subscribers)]
+        while connected < subscribers:
+            await asyncio.sleep(0.01)
+        connect_time = time.perf_counter() - started
+        per_subscriber = (tracemalloc.get_traced_memory()[0] - before) / subscribers
+        tracemalloc.stop()
+
+        def publish():
+            # публикация из другого потока, как из сигнала синхронного view
+            now = timezone.now()
+            for n in range(events):
+                order = {'id': n, 'establishment_id': n % establishments + 1, 'order_type': 1,
+                         'paid': False, 'total': 100, 'modified_at': now}
+                published[live.broker.last_id + 1] = time.perf_counter()
+                live.broker.publish('created', [order])
+                time.sleep(interval)
+
+        await asyncio.to_thread(publish)
+        expected = sum(
+            1 for n in range(events) for s in range(subscribers) if s % establishments == n % establishments
+        )
+        deadline = time.perf_counter() + 10
+        while len(latencies) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+
+        for disconnect in disconnects:
+            disconnect.set_result(None)
+        await asyncio.gather(*tasks)
+
+        latencies.sort()
+        self.stdout.write(f"subscribers: {subscribers}, connected in {connect_time * 1000:.0f} ms, "
+                          f"~{per_subscriber / 1024:.1f} KiB per subscriber")
+        self.stdout.write(f"deliveries: {len(latencies)}/{expected}, "
+                          f"p50 {benchmark.percentile(latencies, 0.5) * 1000:.2f} ms, "
+                          f"p95 {benchmark.percentile(latencies, 0.95) * 1000:.2f} ms, "
+                          f"p99 {benchmark.percentile(latencies, 0.99) * 1000:.2f} ms")
+        self.stdout.write(f"subscriptions left: {len(live.broker.subscriptions)}")
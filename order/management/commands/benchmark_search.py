@@ -0,0 +1,99 @@
+import random
+import time
+from functools import reduce
+from operator import and_
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.test import Client
+from django.urls import reverse
+
+from order import benchmark, fast_serializers, models, search
+
+
+def scan(words, page_size):
+    """ Тот же поиск без индекса: LIKE по всем продуктам и заведениям """
+    condition = reduce(and_, (
+        Q(name__icontains=word) | Q(cafe__name__icontains=word) | Q(cafe__description__icontains=word)
+        for word in words
+    ))
+    queryset = models.Product.objects.filter(condition).order_by('id')[:page_size]
+    return fast_serializers.ProductSerializer(fast_serializers.ProductSerializer.values(queryset), many=True).data
+
+
+class Command(BaseCommand):
+    help = (
+        'Латентность поиска продуктов (GET /order/product/search/) на запросах из названий продуктов '
+        'и заведений текущей БД в сравнении с поиском LIKE без индекса. '
+        'Данные: manage.py seed_data --establishments 200 --products 500 --orders 0'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=50, help='Запросов каждого вида')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--no-scan', action='store_true', help='Не замерять поиск без индекса')
+        parser.add_argument('--list-all', action='store_true',
+                            help='Замерить и выгрузку всех продуктов страницами product-list (поиск на клиенте)')
+
+    def handle(self, *args, **options):
+        products = models.Product.objects.count()
+        if not products:
+            raise CommandError('no products in the database; run manage.py seed_data first')
+        rng = random.Random(options['seed'])
+        last = models.Product.objects.order_by('-id').values_list('id', flat=True).first()
+        sample = []
+        while len(sample) < options['queries']:
+            row = models.Product.objects.filter(id__gte=rng.randint(1, last)).values_list('name', 'cafe__name').first()
+            if row and search.terms(row[0]):
+                sample.append((search.terms(row[0]), search.terms(row[1])))
+
+        kinds = {
+            'prefix': [words[0][:3] for words, _ in sample],
+            'word': [words[0] for words, _ in sample],
+            'two words': [' '.join(words[:2]) for words, _ in sample],
+            'dish + cafe': [f"{words[0][:4]} {cafe[0]}" for words, cafe in sample if cafe],
+        }
+        self.stdout.write(f"products: {products}, backend: {type(search.get_backend()).__name__}, "
+                          f"page size: {options['page_size']}")
+        self.stdout.write(f"{'query':<12} {'engine':<7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'hits/page':>10}")
+
+        client = Client()
+        url = reverse('product-search')
+        for kind, queries in kinds.items():
+            timings, hits = [], 0
+            for query in queries:
+                begin = time.perf_counter()
+                response = client.get(f"{url}?{urlencode({'q': query, 'page_size': options['page_size']})}")
+                timings.append(time.perf_counter() - begin)
+                if response.status_code != 200:
+                    raise CommandError(f"{query!r}: HTTP {response.status_code}")
+                hits += len(response.json()['results'])
+            self.report(kind, 'index', timings, hits / len(queries))
+
+            if options['no_scan']:
+                continue
+            timings, hits = [], 0
+            for query in queries:
+                begin = time.perf_counter()
+                hits += len(scan(search.terms(query), options['page_size']))
+                timings.append(time.perf_counter() - begin)
+            self.report(kind, 'scan', timings, hits / len(queries))
+
+        if options['list_all']:
+            begin, pages = time.perf_counter(), 0
+            next_url = f"{reverse('product-list')}?page_size={settings.MAX_PAGE_SIZE}"
+            while next_url:
+                next_url = client.get(next_url).json()['next']
+                pages += 1
+            self.stdout.write(f"all products via product-list: {pages} pages, {time.perf_counter() - begin:.2f}s")
+
+    def report(self, kind, engine, timings, hits):
+        timings.sort()
+        self.stdout.write(
+            f"{kind:<12} {engine:<7} {benchmark.percentile(timings, 0.50) * 1000:>9.2f} "
+            f"{benchmark.percentile(timings, 0.95) * 1000:>9.2f} {benchmark.percentile(timings, 0.99) * 1000:>9.2f} "
+            f"{hits:>10.1f}"
+        )
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.renderers import FastJSONRenderer
+from order import benchmark, fast_serializers, models, serializers
+
+LISTS = {
+    'orders': (serializers.OrderSerializer, lambda: models.Order.objects.with_related().order_by('-created_at', '-id')),
+    'order-items': (serializers.OrderItemSerializer, lambda: models.OrderItem.objects.select_related('order', 'product').order_by('id')),
+    'products': (serializers.ProductSerializer, lambda: models.Product.objects.select_related('cafe').order_by('id')),
+    'deliveries': (serializers.DeliverySerializer, lambda: models.Delivery.objects.select_related('order').order_by('id')),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает DRF-сериализаторы списков с быстрыми (order/fast_serializers.py): '
+        'запрос + сериализация + JSON для --rows строк, и проверяет, что вывод совпадает.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--list', action='append', dest='lists', choices=sorted(LISTS))
+
+    def handle(self, *args, **options):
+        renderer = FastJSONRenderer()
+        rows, repeat = options['rows'], options['repeat']
+        self.stdout.write(f"{'list':<12} {'rows':>6} {'drf ms':>9} {'fast ms':>9} {'speedup':>8}")
+        for name in options['lists'] or sorted(LISTS):
+            serializer_class, queryset = LISTS[name]
+            fast = fast_serializers.for_serializer(serializer_class)
+
+            def drf():
+                return renderer.render(serializer_class(queryset()[:rows], many=True).data)
+
+            def quick():
+                return renderer.render(fast(fast.values(queryset()[:rows]), many=True).data)
+
+            if drf() != quick():
+                raise CommandError(f"{name}: fast serializer output differs from {serializer_class.__name__}")
+            count = queryset()[:rows].count()
+            drf_ms = benchmark.percentile(benchmark.time_calls(drf, repeat), 0.5) * 1000
+            fast_ms = benchmark.percentile(benchmark.time_calls(quick, repeat), 0.5) * 1000
+            self.stdout.write(f"{name:<12} {count:>6} {drf_ms:>9.1f} {fast_ms:>9.1f} {drf_ms / fast_ms:>7.1f}x")
@@ -0,0 +1,83 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+
+from order import benchmark, models
+
+PROFILES = {
+    # профиль по умолчанию: rollback journal, BEGIN DEFERRED
+    'default': {'SQLITE_PROFILE': 'False'},
+    # main/backends/sqlite3: WAL, busy_timeout, mmap/cache, BEGIN IMMEDIATE
+    'tuned': {'SQLITE_PROFILE': 'True'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Конкурентная запись заказов (create-order, checkout) в SQLite: профиль по умолчанию против '
+        'SQLITE_PROFILE. Каждый профиль гоняется в отдельном процессе на чистой временной БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,4,16', help='Уровни конкурентности через запятую')
+        parser.add_argument('--requests', type=int, default=500, help='Запросов на каждый уровень')
+        parser.add_argument('--route', default='create-order', choices=['create-order', 'checkout'])
+        parser.add_argument('--profile', action='append', dest='profiles', choices=sorted(PROFILES))
+        parser.add_argument('--worker', action='store_true', help='Служебный: прогон в текущем профиле, вывод в JSON')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        if options['worker']:
+            return self.run_worker(options['route'], levels, options['requests'])
+
+        self.stdout.write(f"{'profile':<8} {'conc':>5} {'writes/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+                          f"{'p99 ms':>9} {'err':>5} {'locked':>7}")
+        for profile in options['profiles'] or sorted(PROFILES):
+            with tempfile.TemporaryDirectory() as directory:
+                env = {
+                    **os.environ,
+                    **PROFILES[profile],
+                    'SQLITE_NAME': os.path.join(directory, 'bench.sqlite3'),
+                    'REQUEST_TIMING_SAMPLE_RATE': '0',
+                    'PROFILER_ENABLED': 'False',
+                }
+                output = subprocess.run(
+                    [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_writes', '--worker', '--route', options['route'],
+                     '--concurrency', options['concurrency'], '--requests', str(options['requests'])],
+                    env=env, check=True, capture_output=True, text=True,
+                ).stdout
+            # отчёт - последняя строка вывода, выше может быть вывод самих view
+            for row in json.loads(output.strip().splitlines()[-1]):
+                self.stdout.write(
+                    f"{profile:<8} {row['concurrency']:>5} {row['rps']:>9.1f} {row['p50']:>9.2f} {row['p95']:>9.2f} "
+                    f"{row['p99']:>9.2f} {row['errors']:>5} {row['locked']:>7}"
+                )
+
+    def run_worker(self, route, levels, requests):
+        call_command('migrate', verbosity=0)
+        cafe = models.Establishment.objects.create(
+            name='Bench writes', description='bench', service_price=10, delivery_price=100,
+        )
+        product = models.Product.objects.create(name='Bench dish', price=100, cafe=cafe)
+        scenarios = {
+            'create-order': benchmark.form(product=product.id, amount=1),
+            # checkout сначала читает продукты, потом пишет: в отложенной (DEFERRED) транзакции
+            # это переход SHARED -> RESERVED, на котором SQLite отдаёт "database is locked" без ожидания
+            'checkout': benchmark.as_json({'items': [{'product': product.id, 'amount': 2}]}),
+        }
+        scenario = benchmark.Scenario(route, 'POST', reverse(route), scenarios[route])
+        setup_test_environment()
+
+        rows = []
+        for level in levels:
+            result, locked = benchmark.run_concurrent_writes(scenario, level, requests)
+            rows.append({'concurrency': level, 'locked': locked, **result._asdict()})
+        self.stdout.write(json.dumps(rows))
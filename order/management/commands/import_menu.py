@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from order import menu_import
+
+
+class Command(BaseCommand):
+    help = 'Импорт меню заведений из CSV (cafe,name,price) или JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument('--format', choices=menu_import.FORMATS, help='По умолчанию - по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        failed = False
+        for path in options['paths']:
+            fmt = options['format'] or menu_import.guess_format(path)
+            try:
+                with open(path, encoding='utf-8-sig', newline='') as f:
+                    report = menu_import.import_menu(menu_import.read_rows(f, fmt), batch_size=options['batch_size'])
+            except (OSError, menu_import.MenuFileError) as e:
+                raise CommandError(e)
+
+            self.stdout.write(
+                f"{path}: created {report['created']}, updated {report['updated']}, "
+                f"unchanged {report['unchanged']}, errors {len(report['errors'])}"
+            )
+            for error in report['errors']:
+                failed = True
+                self.stderr.write(f"  row {error['row']}: {error['error']}")
+        if not failed:
+            self.stdout.write(self.style.SUCCESS('done'))
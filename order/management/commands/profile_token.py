@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from main.middleware import make_profile_token
+
+
+class Command(BaseCommand):
+    help = 'Печатает подписанный токен для профилирования запроса (заголовок X-Profile или ?profile=)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_profile_token())
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from order import search
+
+
+class Command(BaseCommand):
+    help = 'Создаёт индекс поиска продуктов, если его нет, и пересобирает его по всем продуктам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        backend = search.get_backend(options['database'])
+        start = time.perf_counter()
+        with transaction.atomic(using=options['database']):
+            backend.install()
+            count = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"{type(backend).__name__}: {count} products indexed in {time.perf_counter() - start:.2f}s"
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from order.models import reconcile_totals
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает subtotal и total всех заказов и сообщает о расхождениях'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения, ничего не сохранять')
+
+    def handle(self, *args, **options):
+        checked, drifted, drift = reconcile_totals(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        message = f"checked: {checked}, drifted: {drifted}, total drift: {drift}"
+        if options['dry_run']:
+            message += ' (dry run, nothing saved)'
+        style = self.style.WARNING if drifted else self.style.SUCCESS
+        self.stdout.write(style(message))
@@ -0,0 +1,43 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from order import tasks
+
+
+class Command(BaseCommand):
+    help = 'Выполняет отложенные задачи из очереди в БД (order/tasks.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Число потоков-воркеров')
+        parser.add_argument('--batch-size', type=int, help='Задач в пачке (по умолчанию TASKS_BATCH_SIZE)')
+        parser.add_argument('--once', action='store_true', help='Выполнить всё, что готово, и выйти')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            worker = tasks.Worker(batch_size=options['batch_size'])
+            done = 0
+            while True:
+                count = worker.run_once()
+                if not count:
+                    break
+                done += count
+            self.stdout.write(self.style.SUCCESS(f"tasks done: {done}"))
+            return
+
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+        threads = [
+            threading.Thread(target=tasks.Worker(batch_size=options['batch_size']).run, args=(stop,))
+            for _ in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"{len(threads)} task workers started")
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+            if stop.is_set():
+                tasks.wake()
@@ -0,0 +1,105 @@
+import random
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from order import models, search
+from order.models import reconcile_totals
+
+
+# названия продуктов: слова для поиска (manage.py benchmark_search)
+DISHES = (
+    'Плов', 'Лагман', 'Манты', 'Шорпо', 'Бешбармак', 'Самса', 'Ашлям-фу', 'Куурдак', 'Чучвара', 'Гуляш',
+    'Борщ', 'Пельмени', 'Шашлык', 'Салат оливье', 'Чай зелёный', 'Компот', 'Pizza margherita', 'Burger',
+    'Caesar salad', 'Coffee latte',
+)
+
+
+class Command(BaseCommand):
+    help = 'Заполняет БД синтетическими заведениями, продуктами, заказами и доставками (bulk insert)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--establishments', type=int, default=10)
+        parser.add_argument('--products', type=int, default=50, help='Продуктов на заведение')
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--max-items', type=int, default=5, help='Наибольшее число единиц в заказе')
+        parser.add_argument('--paid-ratio', type=float, default=0.7)
+        parser.add_argument('--days', type=int, default=30, help='created_at заказов распределяется по последним N дням')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=None, help='Seed для воспроизводимого набора данных')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        # названия заведений уникальны, поэтому каждый запуск получает свой префикс
+        run = uuid.UUID(int=rng.getrandbits(128)).hex[:6]
+
+        with transaction.atomic():
+            establishments = models.Establishment.objects.bulk_create([
+                models.Establishment(
+                    name=f"Bench {run} {n}",
+                    description=f"Synthetic establishment {n}",
+                    service_price=rng.choice([0, 5, 10, 12, 15]),
+                    delivery_price=rng.choice([0, 100, 150, 200]),
+                )
+                for n in range(options['establishments'])
+            ], batch_size=batch_size)
+            products = models.Product.objects.bulk_create([
+                models.Product(name=f"{rng.choice(DISHES)} {n}", price=rng.randint(50, 1500), cafe=establishment)
+                for establishment in establishments
+                for n in range(options['products'])
+            ], batch_size=batch_size)
+            # bulk_create не отправляет post_save: индекс поиска заполняется сам
+            search.index_establishments([establishment.id for establishment in establishments])
+            by_cafe = {}
+            for product in products:
+                by_cafe.setdefault(product.cafe_id, []).append(product)
+            self.stdout.write(f"establishments: {len(establishments)}, products: {len(products)}")
+
+            now = timezone.now()
+            span = timedelta(days=options['days']).total_seconds()
+            created = sorted(now - timedelta(seconds=rng.uniform(0, span)) for _ in range(options['orders']))
+
+            orders_total = items_total = deliveries_total = 0
+            for start in range(0, len(created), batch_size):
+                stamps = created[start:start + batch_size]
+                cafes = [rng.choice(establishments) for _ in stamps]
+                orders = models.Order.objects.bulk_create([
+                    models.Order(
+                        order_type=rng.choice([1, 2, 3]),
+                        establishment=cafe,
+                        paid=rng.random() < options['paid_ratio'],
+                    )
+                    for cafe in cafes
+                ])
+                # created_at - auto_now_add, поэтому даты проставляются отдельным bulk_update
+                for order, stamp in zip(orders, stamps):
+                    order.created_at = order.modified_at = stamp
+                models.Order.objects.bulk_update(orders, ['created_at', 'modified_at'])
+
+                items, deliveries = [], []
+                for order, cafe in zip(orders, cafes):
+                    for product in rng.sample(by_cafe[cafe.id], min(rng.randint(1, options['max_items']), len(by_cafe[cafe.id]))):
+                        items.append(models.OrderItem(order=order, product=product, amount=rng.randint(1, 4)))
+                    if order.order_type == 2:
+                        deliveries.append(models.Delivery(
+                            order=order,
+                            address=f"Street {rng.randint(1, 300)}, {rng.randint(1, 150)}",
+                            phone=f"+996{rng.randint(500000000, 999999999)}",
+                            description='',
+                        ))
+                models.OrderItem.objects.bulk_create(items)
+                models.Delivery.objects.bulk_create(deliveries)
+                orders_total += len(orders)
+                items_total += len(items)
+                deliveries_total += len(deliveries)
+
+            # bulk_create не проходит через OrderItem.save, поэтому суммы считаются одним пересчётом
+            reconcile_totals(batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"orders: {orders_total}, order items: {items_total}, deliveries: {deliveries_total}"
+        ))
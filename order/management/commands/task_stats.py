@@ -0,0 +1,15 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from order import tasks
+
+
+class Command(BaseCommand):
+    help = 'Глубина очереди задач и задержки выполнения по задачам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=3600, help='Секунд истории выполненных задач')
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(tasks.metrics(window=options['window']), indent=2, ensure_ascii=False))
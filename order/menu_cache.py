@@ -0,0 +1,61 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(establishment_id):
+    return f"menu:{establishment_id}:version"
+
+
+def _payload_key(establishment_id, version):
+    return f"menu:{establishment_id}:{version}"
+
+
+def get_version(establishment_id):
+    """
+    Текущая версия меню заведения. Версия - случайный токен, а не счётчик,
+    чтобы после очистки кэша не выдать заново ETag, который уже видел клиент.
+    """
+    key = _version_key(establishment_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(establishment_id):
+    key = _version_key(establishment_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, uuid.uuid4().hex, timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def get_etag(version):
+    return f'"{version}"'
+
+
+def get_payload(establishment_id, version):
+    return cache.get(_payload_key(establishment_id, version))
+
+
+def set_payload(establishment_id, version, payload):
+    cache.set(_payload_key(establishment_id, version), payload, timeout=None)
+
+
+async def aget_payload(establishment_id, version):
+    return await cache.aget(_payload_key(establishment_id, version))
+
+
+async def aset_payload(establishment_id, version, payload):
+    await cache.aset(_payload_key(establishment_id, version), payload, timeout=None)
+
+
+def invalidate(*establishment_ids):
+    """ Сбрасывает версии меню после коммита текущей транзакции """
+    keys = [_version_key(establishment_id) for establishment_id in set(establishment_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
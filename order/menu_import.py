@@ -0,0 +1,158 @@
+import csv
+import io
+import json
+
+from django.db import transaction
+from django.db.models import Q
+
+from order import menu_cache, models, search
+
+FORMATS = ('csv', 'jsonl')
+
+
+class MenuFileError(ValueError):
+    """ Файл меню нельзя прочитать целиком (например, он не в UTF-8) """
+
+
+def guess_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """
+    Строки меню из текстового потока.
+    CSV - с заголовком cafe,name,price; JSON Lines - по объекту с теми же ключами на строку.
+    cafe - id или название заведения. Испорченная строка CSV попадает в отчёт как ошибка,
+    файл не в UTF-8 - MenuFileError.
+    """
+    try:
+        yield from _read_csv(stream) if fmt == 'csv' else _read_jsonl(stream)
+    except UnicodeDecodeError as e:
+        raise MenuFileError(f"file is not valid UTF-8: {e.reason}")
+
+
+def _read_csv(stream):
+    reader = csv.DictReader(stream)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # строка уже прочитана, следующий next() продолжит со следующей
+            row = {'_error': f"invalid CSV: {e}"}
+        yield row
+
+
+def _read_jsonl(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = {'_error': f"invalid JSON: {e}"}
+        yield row if isinstance(row, dict) else {'_error': 'expected a JSON object'}
+
+
+def read_upload(uploaded_file, fmt=None):
+    fmt = fmt or guess_format(uploaded_file.name)
+    return read_rows(io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline=''), fmt)
+
+
+def import_menu(rows, batch_size=500):
+    """
+    Добавляет и обновляет продукты пачками. Продукт определяется парой (заведение, название):
+    существующему обновляется цена, новый создаётся. Заведения и текущие продукты читаются
+    одним запросом на файл. Ошибочные строки пропускаются и попадают в отчёт.
+    """
+    report = {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': []}
+    parsed = []
+    for number, row in enumerate(rows, start=1):
+        try:
+            parsed.append((number, _parse_row(row)))
+        except ValueError as e:
+            report['errors'].append({'row': number, 'error': str(e)})
+
+    cafes = _resolve_cafes({cafe for _, (cafe, _, _) in parsed})
+    existing = {}
+    products = models.Product.objects.filter(cafe__in=set(cafes.values())).order_by('-id')
+    for product in products.only('id', 'cafe_id', 'name', 'price'):
+        existing[(product.cafe_id, product.name)] = product
+
+    to_create, to_update = {}, {}
+    for number, (cafe, name, price) in parsed:
+        if cafe not in cafes:
+            report['errors'].append({'row': number, 'error': f"unknown cafe: {cafe}"})
+            continue
+        key = (cafes[cafe].id, name)
+        product = existing.get(key)
+        if product is None:
+            to_create[key] = models.Product(cafe=cafes[cafe], name=name, price=price)
+        elif product.price != price or key in to_update:
+            product.price = price
+            to_update[key] = product
+        else:
+            report['unchanged'] += 1
+
+    with transaction.atomic():
+        models.Product.objects.bulk_create(to_create.values(), batch_size=batch_size)
+        models.Product.objects.bulk_update(to_update.values(), ['price'], batch_size=batch_size)
+        # bulk-операции не отправляют post_save, поэтому меню сбрасываем сами
+        menu_cache.invalidate(*(cafe_id for cafe_id, _ in [*to_create, *to_update]))
+        # и индекс поиска: у обновлённых меняется только цена, она в индекс не входит
+        index_created(to_create.values())
+    report['created'] = len(to_create)
+    report['updated'] = len(to_update)
+    report['errors'].sort(key=lambda error: error['row'])
+    return report
+
+
+def index_created(products):
+    """ Добавить в индекс поиска продукты после bulk_create """
+    products = list(products)
+    if all(product.pk is not None for product in products):
+        search.index_products([product.pk for product in products])
+    else:
+        # СУБД не вернула id из bulk_create - переиндексируются заведения целиком
+        search.index_establishments({product.cafe_id for product in products})
+
+
+def _parse_row(row):
+    if '_error' in row:
+        raise ValueError(row['_error'])
+    cafe = str(row.get('cafe') or '').strip()
+    name = str(row.get('name') or '').strip()
+    if not cafe:
+        raise ValueError('cafe is required')
+    if not name:
+        raise ValueError('name is required')
+    if '\x00' in cafe or '\x00' in name:
+        raise ValueError('NUL character in cafe or name')
+    if len(name) > models.Product._meta.get_field('name').max_length:
+        raise ValueError('name is too long')
+    return cafe, name, _parse_price(row.get('price'))
+
+
+def _parse_price(value):
+    """ Цена - целое от 0 до MAX_POSITIVE_INT: число из JSON или цифры из CSV, дробные не округляются """
+    price = None
+    if isinstance(value, int) and not isinstance(value, bool):
+        price = value
+    elif isinstance(value, str) and value.strip().isdecimal():
+        price = int(value)
+    if price is None or not 0 <= price <= models.MAX_POSITIVE_INT:
+        raise ValueError(f"invalid price: {value!r}")
+    return price
+
+
+def _resolve_cafes(keys):
+    """ {ключ из файла: Establishment}, ключ - id или название """
+    ids = {models.parse_id(key) for key in keys} - {None}
+    cafes = {}
+    for cafe in models.Establishment.objects.filter(Q(id__in=ids) | Q(name__in=keys)):
+        cafes[cafe.name] = cafe
+        if cafe.id in ids:
+            cafes[str(cafe.id)] = cafe
+    return {key: cafes[key] for key in keys if key in cafes}
@@ -0,0 +1,42 @@
+# Generated by Django 4.1.5 on 2026-10-18 16:38
+
+from django.db import migrations, models
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+
+
+def fill_subtotals(apps, schema_editor):
+    Order = apps.get_model('order', 'Order')
+    OrderItem = apps.get_model('order', 'OrderItem')
+
+    items = OrderItem.objects.filter(order=OuterRef('pk'))
+    subtotal = Subquery(
+        items.values('order').annotate(subtotal=Sum(F('product__price') * F('amount'))).values('subtotal')
+    )
+    Order.objects.update(subtotal=Coalesce(subtotal, 0))
+
+    first_item = items.order_by('id')
+    service_price = Subquery(first_item.values('product__cafe__service_price')[:1])
+    delivery_price = Subquery(first_item.values('product__cafe__delivery_price')[:1])
+    Order.objects.update(total=Case(
+        When(order_type=1, then=F('subtotal') + F('subtotal') / 100 * Coalesce(service_price, 0)),
+        When(order_type=2, then=F('subtotal') + Coalesce(delivery_price, 0)),
+        default=F('subtotal'),
+        output_field=models.IntegerField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сумма без обслуживания и доставки'),
+        ),
+        migrations.RunPython(fill_subtotals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.5 on 2026-10-18 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0003_order_created_at_id_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='обнавлен в '),
+        ),
+    ]
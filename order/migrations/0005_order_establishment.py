@@ -0,0 +1,33 @@
+# Generated by Django 4.1.5 on 2026-10-18 16:43
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_establishments(apps, schema_editor):
+    Order = apps.get_model('order', 'Order')
+    OrderItem = apps.get_model('order', 'OrderItem')
+
+    first_item = OrderItem.objects.filter(order=OuterRef('pk')).order_by('id')
+    Order.objects.update(establishment=Subquery(first_item.values('product__cafe')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0004_order_modified_at_auto_now'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='establishment',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='order.establishment', verbose_name='Заведение'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['establishment', 'created_at', 'id'], name='order_estab_created_idx'),
+        ),
+        migrations.RunPython(fill_establishments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.1.5 on 2026-10-18 17:02
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def fill_daily_revenue(apps, schema_editor):
+    Order = apps.get_model('order', 'Order')
+    DailyRevenue = apps.get_model('order', 'DailyRevenue')
+
+    rows = (
+        Order.objects.filter(establishment__isnull=False)
+        .values('establishment_id', 'order_type', 'paid', day=TruncDate('created_at'))
+        .annotate(orders=Count('id'), subtotal=Sum('subtotal'), revenue=Sum('total'))
+        .order_by()
+    )
+    DailyRevenue.objects.bulk_create([DailyRevenue(**row) for row in rows], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0005_order_establishment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('order_type', models.IntegerField(choices=[(1, 'Service'), (2, 'Delivery'), (3, 'Pickup')], verbose_name='Тип Заказа')),
+                ('paid', models.BooleanField(verbose_name='Оплачено')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('subtotal', models.PositiveBigIntegerField(default=0, verbose_name='Сумма без обслуживания и доставки')),
+                ('revenue', models.PositiveBigIntegerField(default=0, verbose_name='Выручка')),
+                ('establishment', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_revenue', to='order.establishment', verbose_name='Заведение')),
+            ],
+            options={
+                'verbose_name': 'Выручка за день',
+                'verbose_name_plural': 'Выручка по дням',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dailyrevenue',
+            index=models.Index(fields=['day'], name='daily_revenue_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrevenue',
+            constraint=models.UniqueConstraint(fields=('establishment', 'day', 'order_type', 'paid'), name='daily_revenue_bucket'),
+        ),
+        migrations.RunPython(fill_daily_revenue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.1.5 on 2026-10-18 17:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0007_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('order_type', models.IntegerField(choices=[(1, 'Service'), (2, 'Delivery'), (3, 'Pickup')], verbose_name='Тип Заказа')),
+                ('created_at', models.DateTimeField(verbose_name='создан в ')),
+                ('modified_at', models.DateTimeField(verbose_name='обнавлен в ')),
+                ('subtotal', models.PositiveIntegerField(verbose_name='Сумма без обслуживания и доставки')),
+                ('total', models.PositiveIntegerField(verbose_name='Общая сумма заказа')),
+                ('paid', models.BooleanField(verbose_name='Оплачено')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='В архиве с')),
+                ('establishment', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_orders', to='order.establishment', verbose_name='Заведение')),
+            ],
+            options={
+                'verbose_name': 'Заказ в архиве',
+                'verbose_name_plural': 'Заказы в архиве',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество продукта')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='order.archivedorder')),
+                ('product', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_order_items', to='order.product')),
+            ],
+            options={
+                'verbose_name': 'Единица архивного заказа',
+                'verbose_name_plural': 'Единицы архивных заказов',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedDelivery',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('address', models.CharField(max_length=100, verbose_name='Адрес')),
+                ('phone', models.CharField(max_length=13, verbose_name='Номер Телефона')),
+                ('description', models.TextField(blank=True, max_length=255, null=True, verbose_name='Описание для Доставщика')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='delivery_address', to='order.archivedorder')),
+            ],
+            options={
+                'verbose_name': 'Доставка архивного заказа',
+                'verbose_name_plural': 'Доставки архивных заказов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['created_at', 'id'], name='archived_order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['establishment', 'created_at', 'id'], name='archived_order_estab_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+# Схема индекса на момент миграции; дальше индекс ведёт order/search.py.
+# SQL записан здесь, чтобы миграция не зависела от текущего кода и моделей приложения.
+TABLE = 'order_product_search'
+
+CREATE = {
+    'sqlite': [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+        "name, cafe_name, cafe_description, cafe_id UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+        f"INSERT INTO {TABLE} (rowid, name, cafe_name, cafe_description, cafe_id) "
+        "SELECT p.id, p.name, e.name, COALESCE(e.description, ''), p.cafe_id "
+        'FROM "order_product" p JOIN "order_establishment" e ON e.id = p.cafe_id',
+    ],
+    'postgresql': [
+        f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+        "product_id bigint PRIMARY KEY, cafe_id bigint NOT NULL, document tsvector NOT NULL)",
+        f"CREATE INDEX IF NOT EXISTS {TABLE}_document_idx ON {TABLE} USING GIN (document)",
+        f"INSERT INTO {TABLE} (product_id, cafe_id, document) "
+        "SELECT p.id, p.cafe_id, "
+        "setweight(to_tsvector('simple', p.name), 'A') || setweight(to_tsvector('simple', e.name), 'B') || "
+        "setweight(to_tsvector('simple', COALESCE(e.description, '')), 'C') "
+        'FROM "order_product" p JOIN "order_establishment" e ON e.id = p.cafe_id',
+    ],
+}
+
+
+def create_index(apps, schema_editor):
+    # для других СУБД (свой PRODUCT_SEARCH_BACKEND) индекс создаёт manage.py rebuild_product_search
+    for sql in CREATE.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE:
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0008_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,4 +1,27 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Prefetch, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+from django.utils import timezone
+
+# суммы заказов изменены UPDATE-ом в обход Order.save (order_ids - список id заказов)
+totals_changed = Signal()
+# заведение заказов пересчитано по первой единице (previous - прежние пары (establishment_id, created_at))
+establishment_changed = Signal()
+
+# наибольшее значение 64-битных целых столбцов (id и т.п.)
+MAX_ID = 2 ** 63 - 1
+# наибольшее значение PositiveIntegerField (цены, количества) - 32 бита на всех СУБД
+MAX_POSITIVE_INT = 2 ** 31 - 1
+
+
+def parse_id(value):
+    """ id из строки запроса или файла; None, если это не число от 0 до MAX_ID """
+    value = value.strip()
+    if not value.isdecimal():
+        return None
+    value = int(value)
+    return value if value <= MAX_ID else None
 
 
 class Establishment(models.Model):
@@ -28,34 +51,143 @@ class Product(models.Model):
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # заведение на момент загрузки: при переносе продукта меню сбрасывается у обоих
+        # (через __dict__, чтобы не догружать отложенное поле)
+        self._saved_cafe_id = self.__dict__.get('cafe_id')
+
     def __str__(self):
         return f"id: {self.id}, name: {self.name}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._saved_cafe_id = self.cafe_id
+
 
 def get_totall(order_id):
-    total = 0
-    order = Order.objects.get(id=order_id)
-    order_itmems = order.order_items.all()
+    """ Общая сумма заказа, посчитанная одним запросом к БД """
+    return Order.objects.with_totals().values_list('computed_total', flat=True).get(id=order_id)
+
+
+def apply_subtotal_delta(order_id, delta, establishment_id=None):
+    """
+    Сдвигает подытог заказа на delta и тем же UPDATE пересчитывает total.
+    establishment_id - заведение добавленной единицы: записывается в заказ, если там пусто.
+    """
+    subtotal = F('subtotal') + delta
+    fields = {
+        'subtotal': subtotal,
+        'total': order_total_expression(subtotal),
+        'modified_at': timezone.now(),
+    }
+    if establishment_id is not None:
+        fields['establishment_id'] = Coalesce(F('establishment_id'), Value(establishment_id))
+    Order.objects.filter(pk=order_id).update(**fields)
+    totals_changed.send(sender=Order, order_ids=[order_id])
 
-    if order.order_type == 1:
-        """если тип заказа: обслуживание"""
 
-        for item in order_itmems:
-            total += item.product.price * item.amount
-        return total + int(total/100) * order_itmems[0].product.cafe.service_price
+def reconcile_totals(batch_size=500, dry_run=False, order_ids=None):
+    """
+    Пересчитывает subtotal, total и заведение заказов (всех или order_ids) по их единицам заказа.
+    Возвращает (число проверенных заказов, число расхождений, сумма расхождений total).
+    """
+    checked, drifted, drift = 0, 0, 0
+    batch, changed, moved = [], [], []
+    orders = Order.objects.all() if order_ids is None else Order.objects.filter(id__in=order_ids)
+    rows = orders.with_totals().annotate(first_cafe_id=first_item_cafe()).values_list(
+        'id', 'subtotal', 'total', 'items_subtotal', 'computed_total',
+        'establishment_id', 'first_cafe_id', 'created_at',
+    )
+    with transaction.atomic():
+        for row in rows.iterator(chunk_size=batch_size):
+            pk, subtotal, total, items_subtotal, computed_total, establishment_id, first_cafe_id, created_at = row
+            checked += 1
+            if subtotal == items_subtotal and total == computed_total and establishment_id == first_cafe_id:
+                continue
+            drifted += 1
+            drift += abs(total - computed_total)
+            batch.append(Order(id=pk, subtotal=items_subtotal, total=computed_total, establishment_id=first_cafe_id))
+            if establishment_id != first_cafe_id:
+                moved.append((establishment_id, created_at))
+            if len(batch) >= batch_size:
+                if not dry_run:
+                    Order.objects.bulk_update(batch, ['subtotal', 'total', 'establishment'])
+                    changed += [order.id for order in batch]
+                batch = []
+        if batch and not dry_run:
+            Order.objects.bulk_update(batch, ['subtotal', 'total', 'establishment'])
+            changed += [order.id for order in batch]
+        if changed:
+            totals_changed.send(sender=Order, order_ids=changed)
+            if moved:
+                establishment_changed.send(sender=Order, order_ids=changed, previous=moved)
+    return checked, drifted, drift
 
-    elif order.order_type == 2:
-        """если тип заказа: доставка"""
 
-        for item in order_itmems:
-            total += item.product.price * item.amount
-        return total + order_itmems[0].product.cafe.delivery_price
-    else:
-        """если тип заказа: pick up - то есть клиент сам забирает"""
+def refresh_establishments(order_ids):
+    """
+    Пересчитывает заведение заказов по первой единице заказа - после удаления единицы
+    или её переноса в другой заказ либо на другой продукт.
+    """
+    rows = Order.objects.filter(id__in=order_ids).annotate(first_cafe_id=first_item_cafe()).values_list(
+        'id', 'establishment_id', 'first_cafe_id', 'created_at',
+    )
+    changed, previous = [], []
+    for pk, establishment_id, first_cafe_id, created_at in rows:
+        if establishment_id != first_cafe_id:
+            Order.objects.filter(pk=pk).update(establishment_id=first_cafe_id)
+            changed.append(pk)
+            previous.append((establishment_id, created_at))
+    if changed:
+        establishment_changed.send(sender=Order, order_ids=changed, previous=previous)
 
-        for item in order_itmems:
-            total += item.product.price * item.amount
-        return total
+
+def first_item_cafe():
+    """ Заведение первой единицы заказа (подзапрос для Order) """
+    first_item = OrderItem.objects.filter(order=OuterRef('pk')).order_by('id')
+    return Subquery(first_item.values('product__cafe_id')[:1])
+
+
+def order_total_expression(subtotal):
+    """
+    Правила get_totall в виде выражения БД:
+    обслуживание - подытог + % за обслуживание, доставка - подытог + цена доставки,
+    pick up - только подытог. Цены берутся у заведения первой единицы заказа.
+    """
+    first_item = OrderItem.objects.filter(order=OuterRef('pk')).order_by('id')
+    service_price = Subquery(first_item.values('product__cafe__service_price')[:1])
+    delivery_price = Subquery(first_item.values('product__cafe__delivery_price')[:1])
+    return Case(
+        When(order_type=1, then=subtotal + subtotal / 100 * Coalesce(service_price, 0)),
+        When(order_type=2, then=subtotal + Coalesce(delivery_price, 0)),
+        default=subtotal,
+        output_field=models.IntegerField(),
+    )
+
+
+class OrderQuerySet(models.QuerySet):
+
+    def with_related(self):
+        """ Подгружает единицы заказа с продуктами и адреса доставки для сериализации """
+        return self.prefetch_related(
+            Prefetch('order_items', queryset=OrderItem.objects.select_related('product__cafe').order_by('id')),
+            Prefetch('delivery_address', queryset=Delivery.objects.order_by('id')),
+        )
+
+    def with_totals(self):
+        """ Добавляет computed_total - сумму заказа, посчитанную на стороне БД """
+        items_subtotal = Subquery(
+            OrderItem.objects.filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(subtotal=Sum(F('product__price') * F('amount')))
+            .values('subtotal')
+        )
+        return self.annotate(
+            items_subtotal=Coalesce(items_subtotal, 0),
+        ).annotate(
+            computed_total=order_total_expression(F('items_subtotal')),
+        )
 
 
 class Order(models.Model):
@@ -67,18 +199,69 @@ class Order(models.Model):
         (3, 'Pickup'),
     ]
     order_type = models.IntegerField(verbose_name='Тип Заказа', choices=TYPE_CHOICES, default=1)
+    # заведение первой единицы заказа, хранится для выборки заказов по заведению
+    establishment = models.ForeignKey(
+        Establishment, related_name='orders', on_delete=models.SET_NULL,
+        null=True, blank=True, db_index=False, verbose_name='Заведение',
+    )
     created_at = models.DateTimeField(verbose_name='создан в ', auto_now_add=True)
-    modified_at = models.DateTimeField(verbose_name='обнавлен в ', auto_now_add=True)
+    modified_at = models.DateTimeField(verbose_name='обнавлен в ', auto_now=True)
+    subtotal = models.PositiveIntegerField(verbose_name='Сумма без обслуживания и доставки', default=0)
     total = models.PositiveIntegerField(verbose_name='Общая сумма заказа', default=0)
     paid = models.BooleanField(verbose_name='Оплачено', default=False)
 
+    DERIVED_FIELDS = ('subtotal', 'total', 'establishment')
+
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='order_created_at_id_idx'),
+            models.Index(fields=['establishment', 'created_at', 'id'], name='order_estab_created_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._saved_order_type = self.order_type
+        self._saved_paid = self.paid
 
     def __str__(self):
         return f"id: {self.id}, order_type: {self.order_type}"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # subtotal, total и establishment ведутся UPDATE-ами (apply_subtotal_delta, refresh_total):
+            # сохранение загруженного раньше экземпляра не должно их затирать
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        if self.order_type != self._saved_order_type:
+            self.refresh_total()
+        self._saved_order_type = self.order_type
+        self._saved_paid = self.paid
+
+    def refresh_total(self):
+        """ Пересчитывает total из сохранённого подытога по текущему типу заказа """
+        Order.objects.filter(pk=self.pk).update(total=order_total_expression(F('subtotal')), modified_at=timezone.now())
+        totals_changed.send(sender=Order, order_ids=[self.pk])
+        self.subtotal, self.total, self.modified_at = Order.objects.values_list(
+            'subtotal', 'total', 'modified_at',
+        ).get(pk=self.pk)
+
+    @staticmethod
+    def touch(order_id):
+        """ Обновляет modified_at заказа, когда меняется что-то, связанное с ним """
+        Order.objects.filter(pk=order_id).update(modified_at=timezone.now())
+
+    @property
+    def current_total(self):
+        """ Сумма из with_totals, если заказ загружен с ней, иначе сохранённая """
+        return getattr(self, 'computed_total', self.total)
+
 
 class OrderItem(models.Model):
     """ Модель для OrderItem """
@@ -93,6 +276,26 @@ class OrderItem(models.Model):
     def __str__(self):
         return str(self.id)
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            if self.pk is not None:
+                previous = OrderItem.objects.filter(pk=self.pk).values_list(
+                    'order_id', 'product_id', 'amount', 'product__price',
+                ).first()
+            super().save(*args, **kwargs)
+            delta = self.amount * self.product.price
+            if previous is not None:
+                previous_order_id, previous_product_id, previous_amount, previous_price = previous
+                if previous_order_id == self.order_id:
+                    delta -= previous_amount * previous_price
+                else:
+                    apply_subtotal_delta(previous_order_id, -previous_amount * previous_price)
+            apply_subtotal_delta(self.order_id, delta, establishment_id=self.product.cafe_id)
+            if previous is not None and (previous_order_id, previous_product_id) != (self.order_id, self.product_id):
+                # единица могла быть первой в прежнем заказе или стать первой в новом
+                refresh_establishments({previous_order_id, self.order_id})
+
 
 class Delivery(models.Model):
     """ Модель для Доставки """
@@ -109,3 +312,144 @@ class Delivery(models.Model):
     def __str__(self):
         return str(self.id)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Order.touch(self.order_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        Order.touch(self.order_id)
+        return result
+
+
+class DailyRevenue(models.Model):
+    """
+    Дневная сводка по заведению: число заказов и выручка за день (по created_at)
+    в разрезе типа заказа и оплаты. Поддерживается order/reports.py.
+    """
+    establishment = models.ForeignKey(Establishment, related_name='daily_revenue', on_delete=models.CASCADE,
+                                      db_index=False, verbose_name='Заведение')
+    day = models.DateField(verbose_name='День')
+    order_type = models.IntegerField(verbose_name='Тип Заказа', choices=Order.TYPE_CHOICES)
+    paid = models.BooleanField(verbose_name='Оплачено')
+    orders = models.PositiveIntegerField(verbose_name='Заказов', default=0)
+    subtotal = models.PositiveBigIntegerField(verbose_name='Сумма без обслуживания и доставки', default=0)
+    revenue = models.PositiveBigIntegerField(verbose_name='Выручка', default=0)
+
+    class Meta:
+        verbose_name = 'Выручка за день'
+        verbose_name_plural = 'Выручка по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['establishment', 'day', 'order_type', 'paid'], name='daily_revenue_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='daily_revenue_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.establishment_id} {self.day}"
+
+
+class Task(models.Model):
+    """
+    Отложенная задача из очереди в БД (order/tasks.py). Одинаковые ожидающие задачи
+    (name, key) не дублируются; выполненные удаляются воркером через TASKS_KEEP_DONE секунд.
+    """
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    ]
+    name = models.CharField(max_length=50, verbose_name='Задача')
+    key = models.CharField(max_length=100, verbose_name='Ключ')
+    payload = models.JSONField(verbose_name='Данные')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(verbose_name='Попыток', default=0)
+    run_at = models.DateTimeField(verbose_name='Выполнить после', default=timezone.now)
+    created_at = models.DateTimeField(verbose_name='Создана', auto_now_add=True)
+    started_at = models.DateTimeField(verbose_name='Начата', null=True, blank=True)
+    finished_at = models.DateTimeField(verbose_name='Завершена', null=True, blank=True)
+    # воркер, взявший задачу, и до какого времени она за ним закреплена
+    claimed_by = models.CharField(max_length=64, verbose_name='Воркер', blank=True)
+    locked_until = models.DateTimeField(verbose_name='Закреплена до', null=True, blank=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+
+    class Meta:
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'key'], condition=Q(status='pending'), name='task_pending_key'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} {self.key} ({self.status})"
+
+
+class ArchivedOrder(models.Model):
+    """
+    Оплаченный заказ, перенесённый из Order в архив (order/archive.py) с тем же id и полями.
+    Архив только читается; связи и __str__ повторяют Order, поэтому подходят его сериализаторы.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    order_type = models.IntegerField(verbose_name='Тип Заказа', choices=Order.TYPE_CHOICES)
+    establishment = models.ForeignKey(
+        Establishment, related_name='archived_orders', on_delete=models.SET_NULL,
+        null=True, blank=True, db_index=False, verbose_name='Заведение',
+    )
+    created_at = models.DateTimeField(verbose_name='создан в ')
+    modified_at = models.DateTimeField(verbose_name='обнавлен в ')
+    subtotal = models.PositiveIntegerField(verbose_name='Сумма без обслуживания и доставки')
+    total = models.PositiveIntegerField(verbose_name='Общая сумма заказа')
+    paid = models.BooleanField(verbose_name='Оплачено')
+    archived_at = models.DateTimeField(verbose_name='В архиве с', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Заказ в архиве'
+        verbose_name_plural = 'Заказы в архиве'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='archived_order_created_idx'),
+            models.Index(fields=['establishment', 'created_at', 'id'], name='archived_order_estab_idx'),
+        ]
+
+    def __str__(self):
+        return f"id: {self.id}, order_type: {self.order_type}"
+
+    @property
+    def current_total(self):
+        return self.total
+
+
+class ArchivedOrderItem(models.Model):
+    """ Единица архивного заказа; удаление продукта не стирает историю (product станет NULL) """
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, related_name='order_items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='archived_order_items', on_delete=models.SET_NULL, null=True)
+    amount = models.PositiveIntegerField(verbose_name='Количество продукта')
+
+    class Meta:
+        verbose_name = 'Единица архивного заказа'
+        verbose_name_plural = 'Единицы архивных заказов'
+
+    def __str__(self):
+        return str(self.id)
+
+
+class ArchivedDelivery(models.Model):
+    """ Доставка архивного заказа """
+    id = models.BigIntegerField(primary_key=True)
+    address = models.CharField(max_length=100, verbose_name='Адрес')
+    phone = models.CharField(max_length=13, verbose_name='Номер Телефона')
+    description = models.TextField(max_length=255, verbose_name='Описание для Доставщика', null=True, blank=True)
+    order = models.ForeignKey(ArchivedOrder, related_name='delivery_address', on_delete=models.CASCADE)
+
+    class Meta:
+        verbose_name = 'Доставка архивного заказа'
+        verbose_name_plural = 'Доставки архивных заказов'
+
+    def __str__(self):
+        return str(self.id)
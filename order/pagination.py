@@ -0,0 +1,165 @@
+import base64
+import binascii
+import json
+import math
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from order.models import MAX_ID, parse_id
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация по полям ordering.
+    Курсор хранит ключ крайней записи страницы, поэтому любая страница выбирается
+    условием по индексу + LIMIT, без OFFSET, и не съезжает при вставке новых записей.
+    Последнее поле ordering должно быть уникальным (обычно id).
+    Параметры читаются из request.GET, поэтому класс работает и с обычным Django request
+    (асинхронные view), а не только с DRF Request.
+    """
+    ordering = ('id',)
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = settings.PAGE_SIZE
+        self.max_page_size = settings.MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_rows(list(self.get_page_queryset(queryset, request)))
+
+    def get_page_queryset(self, queryset, request):
+        """ Queryset одной страницы (+1 запись, чтобы узнать, есть ли следующая) """
+        self.read_request(request)
+
+        ordering = self.reversed_ordering() if self.reverse else self.ordering
+        if self.position is not None:
+            try:
+                queryset = queryset.filter(self.keyset_filter(queryset.model, ordering, self.position))
+            except (ValidationError, TypeError, ValueError, OverflowError):
+                raise NotFound(self.invalid_cursor_message)
+        return queryset.order_by(*ordering)[:self.page_size + 1]
+
+    def read_request(self, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+
+    def paginate_rows(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def reversed_ordering(self):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+
+    @staticmethod
+    def keyset_filter(model, ordering, position):
+        """ (f1, f2, ...) > (v1, v2, ...) с учётом направления каждого поля """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            model_field = model._meta.get_field(name)
+            # int(Infinity) из курсора падает OverflowError
+            value = model_field.to_python(value)
+            # целое вне 64 бит падает OverflowError только при выполнении запроса
+            if isinstance(value, int) and not -MAX_ID - 1 <= value <= MAX_ID:
+                raise ValueError(value)
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, row, reverse):
+        position = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        cursor = json.dumps([position, reverse], separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(cursor.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = request.GET.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            position, reverse = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(position) != len(self.ordering):
+                raise ValueError
+        except (binascii.Error, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(reverse)
+
+
+class OrderKeysetPagination(KeysetPagination):
+    """ Заказы: сначала новые, ключ (created_at, id) """
+    ordering = ('-created_at', '-id')
+
+
+class SearchPagination(KeysetPagination):
+    """
+    Результаты поиска продуктов (order/search.py): ключ (score, id), где score - релевантность
+    из индекса, поэтому страница выбирается самим бэкендом поиска, а не фильтром queryset.
+    """
+    ordering = ('score', 'id')
+
+    def paginate_search(self, backend, words, request, **filters):
+        """ Строки {'score', 'id'} одной страницы, лучшие первыми """
+        self.read_request(request)
+        after = None
+        if self.position is not None:
+            try:
+                score = float(self.position[0])
+            except (TypeError, ValueError, OverflowError):
+                score = math.nan
+            pk = parse_id(str(self.position[1]))
+            # score - конечное число (Infinity/NaN в JSON допустимы), id - в пределах 64 бит
+            if not math.isfinite(score) or pk is None:
+                raise NotFound(self.invalid_cursor_message)
+            after = (score, pk)
+        rows = backend.search(words, self.page_size + 1, after=after, reverse=self.reverse, **filters)
+        return self.paginate_rows([{'score': score, 'id': pk} for score, pk in rows])
@@ -0,0 +1,140 @@
+"""
+Отчёты по выручке из дневных сводок DailyRevenue.
+
+Сводка хранится по корзинам (заведение, день) и пересчитывается целиком по заказам
+этой корзины - одним запросом по индексу (establishment, created_at, id) - задачей
+refresh_revenue (order/tasks.py), которую ставят сигналы изменения заказов (order/signals.py).
+Пересчёт учитывает и заказы, перенесённые в архив (order/archive.py). Заказы без заведения
+(без единиц заказа) в сводки не входят. rebuild() пересчитывает сводки за период
+(manage.py backfill_revenue).
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from order import tasks
+from order.models import ArchivedOrder, DailyRevenue, Order
+
+GROUP_BY = ('day', 'establishment', 'order_type', 'paid')
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def bucket(establishment_id, created_at):
+    return establishment_id, timezone.localdate(created_at)
+
+
+def mark(buckets):
+    """ Поставить пересчёт корзин в очередь задач (выполняется после коммита текущей транзакции) """
+    tasks.enqueue('refresh_revenue', [
+        [establishment_id, day.isoformat()] for establishment_id, day in buckets if establishment_id is not None
+    ])
+
+
+def mark_orders(order_ids, batch_size=500):
+    buckets = set()
+    for start in range(0, len(order_ids), batch_size):
+        rows = Order.objects.filter(
+            id__in=order_ids[start:start + batch_size], establishment__isnull=False,
+        ).values_list('establishment_id', 'created_at')
+        buckets.update(bucket(*row) for row in rows)
+    mark(buckets)
+
+
+def refresh_buckets(buckets):
+    for establishment_id, day in buckets:
+        refresh_bucket(establishment_id, day)
+
+
+@tasks.task('refresh_revenue')
+def refresh_revenue(payloads):
+    refresh_buckets({(establishment_id, date.fromisoformat(day)) for establishment_id, day in payloads})
+
+
+def summarize(filters, *fields, **expressions):
+    """
+    Число заказов, подытог и выручка по группам fields (и expressions) - из рабочих заказов
+    и архива (order/archive.py) вместе.
+    """
+    merged = {}
+    for model in (Order, ArchivedOrder):
+        rows = (
+            model.objects.filter(**filters)
+            .values(*fields, **expressions)
+            .annotate(orders=Count('id'), subtotal=Sum('subtotal'), revenue=Sum('total'))
+            .order_by()
+        )
+        for row in rows:
+            key = tuple(row[field] for field in (*fields, *expressions))
+            if key in merged:
+                for total in ('orders', 'subtotal', 'revenue'):
+                    merged[key][total] += row[total]
+            else:
+                merged[key] = row
+    return list(merged.values())
+
+
+def refresh_bucket(establishment_id, day):
+    start = start_of_day(day)
+    rows = summarize(
+        {'establishment_id': establishment_id, 'created_at__gte': start, 'created_at__lt': start + timedelta(days=1)},
+        'order_type', 'paid',
+    )
+    with transaction.atomic():
+        DailyRevenue.objects.filter(establishment_id=establishment_id, day=day).delete()
+        DailyRevenue.objects.bulk_create([
+            DailyRevenue(establishment_id=establishment_id, day=day, **row) for row in rows
+        ])
+
+
+def rebuild(date_from=None, date_to=None, establishment_ids=None, batch_size=2000):
+    """ Пересчитывает сводки за период (даты включительно) целиком; возвращает число строк сводки """
+    filters = {'establishment__isnull': False}
+    summaries = DailyRevenue.objects.all()
+    if date_from is not None:
+        filters['created_at__gte'] = start_of_day(date_from)
+        summaries = summaries.filter(day__gte=date_from)
+    if date_to is not None:
+        filters['created_at__lt'] = start_of_day(date_to + timedelta(days=1))
+        summaries = summaries.filter(day__lte=date_to)
+    if establishment_ids is not None:
+        filters['establishment_id__in'] = establishment_ids
+        summaries = summaries.filter(establishment_id__in=establishment_ids)
+
+    rows = summarize(filters, 'establishment_id', 'order_type', 'paid', day=TruncDate('created_at'))
+    with transaction.atomic():
+        summaries.delete()
+        created = DailyRevenue.objects.bulk_create([DailyRevenue(**row) for row in rows], batch_size=batch_size)
+    return len(created)
+
+
+def revenue_report(date_from=None, date_to=None, establishment=None, order_type=None, paid=None, group_by=GROUP_BY):
+    """
+    Выручка из сводок за период, сгруппированная по полям group_by (из GROUP_BY,
+    пусто - по всем), и итог по всем строкам.
+    """
+    summaries = DailyRevenue.objects.all()
+    if date_from is not None:
+        summaries = summaries.filter(day__gte=date_from)
+    if date_to is not None:
+        summaries = summaries.filter(day__lte=date_to)
+    if establishment is not None:
+        summaries = summaries.filter(establishment_id=establishment)
+    if order_type is not None:
+        summaries = summaries.filter(order_type=order_type)
+    if paid is not None:
+        summaries = summaries.filter(paid=paid)
+
+    totals = {'orders': Sum('orders'), 'subtotal': Sum('subtotal'), 'revenue': Sum('revenue')}
+    group_by = [field for field in GROUP_BY if field in (group_by or GROUP_BY)]
+    results = summaries.values(*group_by).annotate(**totals).order_by(*group_by)
+    summary = summaries.aggregate(**totals)
+    return {
+        'results': list(results),
+        'totals': {key: value or 0 for key, value in summary.items()},
+    }
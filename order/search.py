@@ -0,0 +1,252 @@
+"""
+Полнотекстовый поиск продуктов по названию продукта и названию/описанию заведения.
+
+Индекс - отдельная таблица order_product_search: в SQLite - виртуальная таблица FTS5,
+в PostgreSQL - tsvector с GIN-индексом. Бэкенд выбирается по СУБД или настройкой
+PRODUCT_SEARCH_BACKEND (путь к подклассу SearchBackend). Индекс обновляется в той же
+транзакции, что и продукты: сигналы Product и Establishment (order/signals.py), импорт меню
+и seed_data (bulk-операции сигналов не отправляют). Полная перестройка:
+manage.py rebuild_product_search.
+
+Каждое слово запроса ищется как префикс ("пло" находит "Плов"), нужны все слова.
+Результаты упорядочены по релевантности: совпадение в названии продукта весит больше,
+чем в названии заведения, а оно - больше, чем в описании.
+
+    backend = search.get_backend()
+    backend.search(search.terms('плов ош'), limit=20)  # [(score, product_id), ...]
+"""
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, router
+from django.utils.module_loading import import_string
+
+from order.models import Establishment, Product
+
+TABLE = 'order_product_search'
+BACKENDS = {
+    'sqlite': 'order.search.SQLiteSearchBackend',
+    'postgresql': 'order.search.PostgresSearchBackend',
+}
+MAX_TERMS = 8
+# id в одном IN (...): меньше лимита параметров SQLite
+CHUNK_SIZE = 500
+
+_word = re.compile(r'\w+')
+
+
+def terms(query):
+    """ Слова запроса в нижнем регистре (не больше MAX_TERMS); пустой список - искать нечего """
+    return [word.lower() for word in _word.findall(query or '')][:MAX_TERMS]
+
+
+def backend_for(using):
+    """ Бэкенд поиска для БД using или None, если для этой СУБД бэкенда нет """
+    path = settings.PRODUCT_SEARCH_BACKEND or BACKENDS.get(connections[using].vendor)
+    return import_string(path)(using) if path else None
+
+
+def get_backend(using=None):
+    """ Бэкенд для поиска (по умолчанию - БД чтения продуктов, может быть репликой) """
+    using = using or router.db_for_read(Product)
+    backend = backend_for(using)
+    if backend is None:
+        raise ImproperlyConfigured(
+            f"no product search backend for {connections[using].vendor}; set PRODUCT_SEARCH_BACKEND"
+        )
+    return backend
+
+
+def index_products(product_ids, using=None):
+    """ Обновить в индексе продукты product_ids (удалённые - убрать) """
+    backend = backend_for(using or router.db_for_write(Product))
+    if backend is not None:
+        backend.index(product_ids)
+
+
+def remove_products(product_ids, using=None):
+    backend = backend_for(using or router.db_for_write(Product))
+    if backend is not None:
+        backend.remove(product_ids)
+
+
+def index_establishments(establishment_ids, using=None):
+    """ Обновить в индексе все продукты заведений (изменились название или описание) """
+    backend = backend_for(using or router.db_for_write(Product))
+    if backend is not None:
+        backend.index_establishments(establishment_ids)
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start:start + CHUNK_SIZE]
+
+
+class SearchBackend:
+    """
+    Индекс в таблице TABLE, одна строка на продукт. Подкласс задаёт key (столбец id продукта),
+    document (выражения строки индекса по продукту p и заведению e), install/uninstall и search.
+    """
+    key = None
+    columns = ()
+    document = ()
+
+    def __init__(self, using):
+        self.using = using
+        self.connection = connections[using]
+
+    def execute(self, sql, params=()):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def fetch(self, sql, params=()):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def install(self):
+        raise NotImplementedError
+
+    def uninstall(self):
+        raise NotImplementedError
+
+    def search(self, words, limit, after=None, reverse=False, establishment_id=None):
+        """
+        [(score, product_id)] по возрастанию (score, id) - сначала самые релевантные;
+        after - ключ (score, id), после которого начинать (reverse - до которого, в обратном порядке).
+        """
+        raise NotImplementedError
+
+    def index(self, product_ids):
+        for chunk in _chunks(set(product_ids)):
+            self.remove(chunk)
+            self.insert(f"p.id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+    def index_establishments(self, establishment_ids):
+        for chunk in _chunks(set(establishment_ids)):
+            where = f"p.cafe_id IN ({', '.join(['%s'] * len(chunk))})"
+            self.execute(
+                f"DELETE FROM {TABLE} WHERE {self.key} IN (SELECT p.id FROM {self.products} p WHERE {where})", chunk,
+            )
+            self.insert(where, chunk)
+
+    def remove(self, product_ids):
+        for chunk in _chunks(set(product_ids)):
+            self.execute(f"DELETE FROM {TABLE} WHERE {self.key} IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+    def rebuild(self):
+        """ Пересобрать индекс по всем продуктам; возвращает число строк индекса """
+        self.execute(f"DELETE FROM {TABLE}")
+        return self.insert('1 = 1', [])
+
+    def insert(self, where, params):
+        return self.execute(
+            f"INSERT INTO {TABLE} ({', '.join(self.columns)}) "
+            f"SELECT {', '.join(self.document)} FROM {self.products} p "
+            f"JOIN {self.establishments} e ON e.id = p.cafe_id WHERE {where}",
+            params,
+        )
+
+    @property
+    def products(self):
+        return self.connection.ops.quote_name(Product._meta.db_table)
+
+    @property
+    def establishments(self):
+        return self.connection.ops.quote_name(Establishment._meta.db_table)
+
+    @staticmethod
+    def keyset(after, reverse):
+        """ Условие (score, id) > after (< при reverse) и порядок для внешнего запроса """
+        if after is None:
+            condition, params = '1 = 1', []
+        else:
+            op = '<' if reverse else '>'
+            condition = f"(score {op} %s OR (score = %s AND id {op} %s))"
+            params = [after[0], after[0], after[1]]
+        order = 'score DESC, id DESC' if reverse else 'score, id'
+        return condition, params, order
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    FTS5: rowid строки индекса - id продукта, unicode61 без учёта регистра и диакритики,
+    префиксные индексы на 2 и 3 символа для коротких префиксов. Ранжирование - bm25
+    (меньше - лучше) с весами столбцов.
+    """
+    key = 'rowid'
+    columns = ('rowid', 'name', 'cafe_name', 'cafe_description', 'cafe_id')
+    document = ('p.id', 'p.name', 'e.name', "COALESCE(e.description, '')", 'p.cafe_id')
+    # веса bm25 по столбцам: название продукта, название заведения, описание, cafe_id
+    weights = (10.0, 4.0, 1.0, 0.0)
+
+    def install(self):
+        self.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+            "name, cafe_name, cafe_description, cafe_id UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+
+    def uninstall(self):
+        self.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    def search(self, words, limit, after=None, reverse=False, establishment_id=None):
+        # слова - только \w+, поэтому в кавычках синтаксис FTS5 в них не встречается
+        match = ' AND '.join(f'"{word}"*' for word in words)
+        where, params = f"{TABLE} MATCH %s", [match]
+        if establishment_id is not None:
+            where += ' AND cafe_id = %s'
+            params.append(establishment_id)
+        condition, keyset_params, order = self.keyset(after, reverse)
+        return self.fetch(
+            f"SELECT score, id FROM ("
+            f"SELECT bm25({TABLE}, {', '.join(map(str, self.weights))}) AS score, rowid AS id FROM {TABLE} WHERE {where}"
+            f") WHERE {condition} ORDER BY {order} LIMIT %s",
+            [*params, *keyset_params, limit],
+        )
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    tsvector с конфигурацией 'simple' (без стемминга, подходит для любых языков) и весами
+    A/B/C по полям; GIN-индекс, префиксы - через to_tsquery('слово:*'). Ранжирование - ts_rank,
+    score - с обратным знаком, чтобы порядок был тем же, что у SQLite (меньше - лучше).
+    """
+    key = 'product_id'
+    columns = ('product_id', 'cafe_id', 'document')
+    document = (
+        'p.id',
+        'p.cafe_id',
+        "setweight(to_tsvector('simple', p.name), 'A') || setweight(to_tsvector('simple', e.name), 'B') || "
+        "setweight(to_tsvector('simple', COALESCE(e.description, '')), 'C')",
+    )
+    # веса ts_rank для {D, C, B, A}
+    weights = '{0, 0.1, 0.4, 1.0}'
+
+    def install(self):
+        self.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+            "product_id bigint PRIMARY KEY, cafe_id bigint NOT NULL, document tsvector NOT NULL)"
+        )
+        self.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_document_idx ON {TABLE} USING GIN (document)")
+
+    def uninstall(self):
+        self.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    def search(self, words, limit, after=None, reverse=False, establishment_id=None):
+        query = ' & '.join(f'{word}:*' for word in words)
+        where, params = "document @@ to_tsquery('simple', %s)", [query]
+        if establishment_id is not None:
+            where += ' AND cafe_id = %s'
+            params.append(establishment_id)
+        condition, keyset_params, order = self.keyset(after, reverse)
+        return self.fetch(
+            f"SELECT score, id FROM ("
+            f"SELECT -ts_rank(%s::float4[], document, to_tsquery('simple', %s)) AS score, product_id AS id "
+            f"FROM {TABLE} WHERE {where}"
+            f") ranked WHERE {condition} ORDER BY {order} LIMIT %s",
+            [self.weights, query, *params, *keyset_params, limit],
+        )
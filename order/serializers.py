@@ -1,8 +1,9 @@
-from datetime import datetime
+from datetime import date
 
+from django.db import transaction
 from django.http import Http404
 from rest_framework import serializers
-from . import models
+from . import models, reports
 
 
 class EstablishmentSerializer(serializers.Serializer):
@@ -30,6 +31,11 @@ class ProductSerializer(serializers.Serializer):
         return models.Product.objects.create(**validated_data)
 
 
+class MenuImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=['csv', 'jsonl'], required=False)
+
+
 class DeliverySerializer(serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
     address = serializers.CharField(max_length=100)
@@ -42,8 +48,10 @@ class DeliverySerializer(serializers.Serializer):
             validated_data['order'] = models.Order.objects.get(id=validated_data['order'])
         except models.Order.objects.get(id=validated_data['order']).DoesNotExist:
             raise Http404
-        validated_data['order'].order_type = 2
-        validated_data['order'].save()
+        if validated_data['order'].order_type != 2:
+            # уже доставка - заказ не перезаписывается и сигналы не отправляются
+            validated_data['order'].order_type = 2
+            validated_data['order'].save()
         return models.Delivery.objects.create(**validated_data)
 
 
@@ -80,12 +88,27 @@ class DelivSerializer(serializers.Serializer):
     description = serializers.CharField(max_length=255)
 
 
-class OrderSerializer(serializers.Serializer):
+class OrderRelationsMixin:
+    """ Адреса доставки и единицы заказа в выводе заказа (если они есть) """
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        # .all() берёт данные из prefetch_related, если queryset подготовлен через with_related()
+        delivery_address = instance.delivery_address.all()
+        if delivery_address:
+            representation['delivery_address'] = DelivSerializer(delivery_address, many=True).data
+        order_items = instance.order_items.all()
+        if order_items:
+            representation['order_items'] = OrderItemSerializer(order_items, many=True).data
+        return representation
+
+
+class OrderSerializer(OrderRelationsMixin, serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
     order_type = serializers.IntegerField(max_value=3, min_value=1)
     created_at = serializers.DateTimeField(read_only=True)
     modified_at = serializers.DateTimeField(read_only=True)
-    total = serializers.IntegerField(read_only=True)
+    total = serializers.IntegerField(source='current_total', read_only=True)
     paid = serializers.BooleanField(read_only=True)
 
     def create(self, validated_data):
@@ -96,21 +119,17 @@ class OrderSerializer(serializers.Serializer):
         instance.save()
         return instance
 
-    def to_representation(self, instance):
-        representation = super(OrderSerializer, self).to_representation(instance)
-        if instance.delivery_address.exists():
-            representation['delivery_address'] = DelivSerializer(instance.delivery_address.all(), many=True).data
-        if instance.order_items.exists():
-            representation['order_items'] = OrderItemSerializer(instance.order_items.all(), many=True).data
-        return representation
 
+class ArchivedOrderSerializer(OrderSerializer):
+    """ Заказ из архива: тот же вывод, что у OrderSerializer; архив только читается """
 
-class OrderDetailSerializer(serializers.Serializer):
+
+class OrderDetailSerializer(OrderRelationsMixin, serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
     order_type = serializers.IntegerField()
     created_at = serializers.DateTimeField(read_only=True)
     modified_at = serializers.DateTimeField(read_only=True)
-    total = serializers.IntegerField(read_only=True)
+    total = serializers.IntegerField(source='current_total', read_only=True)
     paid = serializers.BooleanField(read_only=True)
 
     def create(self, validated_data):
@@ -118,18 +137,9 @@ class OrderDetailSerializer(serializers.Serializer):
 
     def update(self, instance, validated_data):
         instance.order_type = validated_data.get('order_type', instance.order_type)
-        instance.modified_at = datetime.now()
         instance.save()
         return instance
 
-    def to_representation(self, instance):
-        representation = super(OrderDetailSerializer, self).to_representation(instance)
-        if instance.delivery_address.exists():
-            representation['delivery_address'] = DelivSerializer(instance.delivery_address.all(), many=True).data
-        if instance.order_items.exists():
-            representation['order_items'] = OrderItemSerializer(instance.order_items.all(), many=True).data
-        return representation
-
 
 class CreateOrderSerializer(serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
@@ -149,6 +159,83 @@ class CreateOrderSerializer(serializers.Serializer):
         return {'order': order,'order_item': order_item}
 
 
+class EstablishmentOrderFilterSerializer(serializers.Serializer):
+    paid = serializers.BooleanField(required=False, allow_null=True, default=None)
+    order_type = serializers.IntegerField(max_value=3, min_value=1, required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate_date_to(self, value):
+        # date_to включительно: выборка идёт до начала следующего дня, а после 9999-12-31 его нет
+        if value == date.max:
+            raise serializers.ValidationError('Date is out of range.')
+        return value
+
+
+class EstablishmentFilterSerializer(serializers.Serializer):
+    # диапазон id: число больше 64 бит не влезло бы в запрос
+    establishment = serializers.IntegerField(required=False, min_value=1, max_value=models.MAX_ID)
+
+
+class ProductSearchFilterSerializer(EstablishmentFilterSerializer):
+    q = serializers.CharField(required=False, allow_blank=True)
+
+
+class RevenueReportFilterSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    establishment = serializers.IntegerField(required=False, min_value=1, max_value=models.MAX_ID)
+    order_type = serializers.IntegerField(max_value=3, min_value=1, required=False)
+    paid = serializers.BooleanField(required=False, allow_null=True, default=None)
+    group_by = serializers.MultipleChoiceField(choices=reports.GROUP_BY, required=False)
+
+
+class CartItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1, max_value=models.MAX_ID)
+    amount = serializers.IntegerField(min_value=1, max_value=models.MAX_POSITIVE_INT)
+
+
+class CheckoutDeliverySerializer(DelivSerializer):
+    """ Доставка при оформлении корзины: описание для доставщика необязательно, как в модели """
+    description = serializers.CharField(max_length=255, required=False, allow_blank=True, allow_null=True)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    """ Заказ целой корзиной: все единицы заказа и, при необходимости, доставка """
+    order_type = serializers.IntegerField(max_value=3, min_value=1, required=False)
+    items = CartItemSerializer(many=True, allow_empty=False)
+    delivery = CheckoutDeliverySerializer(required=False)
+
+    def validate(self, attrs):
+        product_ids = {item['product'] for item in attrs['items']}
+        products = models.Product.objects.in_bulk(product_ids)
+        missing = sorted(product_ids - products.keys())
+        if missing:
+            raise serializers.ValidationError({'items': f"Продукты не найдены: {missing}"})
+        attrs['products'] = products
+        return attrs
+
+    def create(self, validated_data):
+        products = validated_data['products']
+        delivery = validated_data.get('delivery')
+        order_type = 2 if delivery else validated_data.get('order_type', 1)
+        subtotal = sum(products[item['product']].price * item['amount'] for item in validated_data['items'])
+
+        with transaction.atomic():
+            establishment_id = products[validated_data['items'][0]['product']].cafe_id
+            order = models.Order.objects.create(
+                order_type=order_type, subtotal=subtotal, establishment_id=establishment_id,
+            )
+            models.OrderItem.objects.bulk_create([
+                models.OrderItem(order=order, product=products[item['product']], amount=item['amount'])
+                for item in validated_data['items']
+            ])
+            if delivery:
+                models.Delivery.objects.create(order=order, **delivery)
+            order.refresh_total()
+        return order
+
+
 class CreateDeliveryOrder(serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
     order_type = serializers.IntegerField(max_value=3, min_value=1)
@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from order import live, menu_cache, reports, search, tasks
+from order.models import (
+    Establishment, Order, OrderItem, Product, apply_subtotal_delta, establishment_changed, refresh_establishments,
+    totals_changed,
+)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_menu(sender, instance, **kwargs):
+    # _saved_cafe_id - прежнее заведение, если продукт перенесли (Product.save обновляет его после сигнала)
+    menu_cache.invalidate(*{instance.cafe_id, instance._saved_cafe_id} - {None})
+
+
+@receiver([post_save, post_delete], sender=Establishment)
+def invalidate_establishment_menu(sender, instance, **kwargs):
+    menu_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, using, **kwargs):
+    search.index_products([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using, **kwargs):
+    search.remove_products([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Establishment)
+def index_establishment_products(sender, instance, created, using, **kwargs):
+    # название и описание заведения входят в индекс его продуктов; у нового заведения продуктов нет
+    if not created:
+        search.index_establishments([instance.pk], using=using)
+
+
+@receiver([post_save, pre_delete], sender=Order)
+def refresh_order_revenue(sender, instance, **kwargs):
+    # заведение берётся из БД: у загруженного раньше экземпляра оно может быть устаревшим
+    reports.mark_orders([instance.pk])
+
+
+@receiver(totals_changed, sender=Order)
+def refresh_changed_totals_revenue(sender, order_ids, **kwargs):
+    reports.mark_orders(order_ids)
+
+
+@receiver(establishment_changed, sender=Order)
+def refresh_moved_orders_revenue(sender, order_ids, previous, **kwargs):
+    # заказ ушёл из корзины прежнего заведения в корзину нового
+    reports.mark(reports.bucket(*row) for row in previous)
+    reports.mark_orders(order_ids)
+
+
+@receiver(post_delete, sender=OrderItem)
+def subtract_deleted_item(sender, instance, origin=None, **kwargs):
+    # сигнал, а не OrderItem.delete: так учитываются и queryset.delete(), массовое удаление
+    # в админке и каскад от удалённого продукта
+    if deletes_order(origin, instance.order_id):
+        return
+    apply_subtotal_delta(instance.order_id, -instance.amount * instance.product.price)
+    refresh_establishments([instance.order_id])
+
+
+def deletes_order(origin, order_id):
+    """ Единица удаляется вместе со своим заказом - сумму сдвигать незачем """
+    if isinstance(origin, Order):
+        return origin.pk == order_id
+    return isinstance(origin, QuerySet) and origin.model is Order
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def reconcile_item_order(sender, instance, origin=None, **kwargs):
+    # сумма уже сдвинута на дельту в запросе; полная сверка по единицам заказа - воркером.
+    # В режиме TASKS_EAGER воркера нет, и сверка после каждого коммита шла бы в самом запросе:
+    # тогда она выполняется периодически командой reconcile_totals (cron)
+    if not settings.TASKS_EAGER and not deletes_order(origin, instance.order_id):
+        tasks.enqueue('reconcile_totals', [instance.order_id])
+
+
+@receiver(post_save, sender=Order)
+def publish_order_event(sender, instance, created, **kwargs):
+    if created:
+        kind = 'created'
+    elif instance.paid and not instance._saved_paid:
+        kind = 'paid'
+    else:
+        kind = 'updated'
+    live.broker.publish_orders(kind, [instance.pk])
+
+
+@receiver(totals_changed, sender=Order)
+def publish_totals_event(sender, order_ids, **kwargs):
+    live.broker.publish_orders('updated', order_ids)
+
+
+@receiver(establishment_changed, sender=Order)
+def publish_moved_orders_event(sender, order_ids, **kwargs):
+    live.broker.publish_orders('updated', order_ids)
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from main.renderers import FastJSONRenderer
+
+STREAM_QUERY_PARAM = 'stream'
+STREAM_HEADER = 'HTTP_X_STREAM'
+
+
+def wants_stream(request):
+    """ Потоковый ответ запрошен через ?stream=1 или заголовок X-Stream: 1 """
+    value = request.GET.get(STREAM_QUERY_PARAM) or request.META.get(STREAM_HEADER, '')
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def iter_json_list(queryset, serializer_class, chunk_size):
+    """
+    Отдаёт JSON-массив кусками: queryset читается через iterator(chunk_size)
+    (серверный курсор там, где БД его поддерживает), каждая пачка сериализуется
+    и кодируется отдельно, так что в памяти одновременно не больше chunk_size объектов.
+    """
+    renderer = FastJSONRenderer()
+    separator = b'['
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) >= chunk_size:
+            yield separator + _encode_chunk(renderer, serializer_class, chunk)
+            separator = b','
+            chunk = []
+    if chunk:
+        yield separator + _encode_chunk(renderer, serializer_class, chunk)
+        separator = b','
+    yield b']' if separator == b',' else b'[]'
+
+
+def _encode_chunk(renderer, serializer_class, chunk):
+    data = serializer_class(chunk, many=True).data
+    return b','.join(renderer.render(item) for item in data)
+
+
+def stream_response(queryset, serializer_class, chunk_size=None):
+    chunk_size = chunk_size or settings.STREAM_CHUNK_SIZE
+    return StreamingHttpResponse(
+        iter_json_list(queryset, serializer_class, chunk_size),
+        content_type='application/json',
+    )
@@ -0,0 +1,238 @@
+"""
+Отложенные задачи: очередь в БД и пул воркеров.
+
+Побочная работа после записи заказов (пересчёт сводок выручки, сверка сумм) не выполняется
+в запросе: enqueue() пишет строки Task в той же транзакции, что и изменение, а воркеры
+выполняют их пачками (manage.py run_tasks или потоки внутри веб-процесса, TASKS_WORKERS).
+Ожидающая задача с тем же (name, key) не дублируется. Обработчик получает список payload
+всей пачки и должен быть идемпотентным: при ошибке пачка повторяется с растущей паузой,
+после TASKS_MAX_ATTEMPTS попыток задачи остаются в статусе failed.
+
+TASKS_EAGER=True - очереди нет, обработчик выполняется после коммита в том же процессе
+(в потоке запроса); если он упал, задачи записываются в очередь для повтора.
+
+    @tasks.task('refresh_revenue')
+    def refresh_revenue(payloads): ...
+
+    tasks.enqueue('refresh_revenue', [[establishment_id, '2026-01-01']])
+"""
+import json
+import logging
+import statistics
+import threading
+import time
+import uuid
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from order.models import Task, reconcile_totals
+
+logger = logging.getLogger('order.tasks')
+
+registry = {}
+
+# будит локальных воркеров после коммита новых задач
+_wakeup = threading.Event()
+_local_workers = []
+
+
+def task(name):
+    """ Регистрирует обработчик пачки задач name: handler(payloads) """
+    def decorator(handler):
+        registry[name] = handler
+        return handler
+    return decorator
+
+
+def task_key(payload):
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'))
+
+
+def enqueue(name, payloads):
+    """ Поставить задачи name с данными payloads; выполняются после коммита текущей транзакции """
+    if name not in registry:
+        raise KeyError(f"unknown task: {name}")
+    unique = {task_key(payload): payload for payload in payloads}
+    if not unique:
+        return
+    if settings.TASKS_EAGER:
+        transaction.on_commit(partial(run_eager, name, unique))
+        return
+    Task.objects.bulk_create([
+        Task(name=name, key=key, payload=payload) for key, payload in unique.items()
+    ], ignore_conflicts=True)
+    transaction.on_commit(wake)
+
+
+def run_eager(name, unique):
+    try:
+        registry[name](list(unique.values()))
+    except Exception:
+        logger.exception('task %s failed, queued for retry', name)
+        Task.objects.bulk_create([
+            Task(name=name, key=key, payload=payload, attempts=1, run_at=retry_at(1))
+            for key, payload in unique.items()
+        ], ignore_conflicts=True)
+
+
+def retry_at(attempts):
+    return timezone.now() + timedelta(seconds=settings.TASKS_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+class Worker:
+    """ Берёт из очереди пачки задач одного name и выполняет их """
+
+    def __init__(self, batch_size=None, lease=None):
+        self.batch_size = batch_size or settings.TASKS_BATCH_SIZE
+        self.lease = lease or settings.TASKS_LEASE
+        self.last_cleanup = 0.0
+
+    def claim(self):
+        """ Пачка задач: (name, [Task]) или (None, []), если выполнять нечего """
+        now = timezone.now()
+        due = Task.objects.filter(status=Task.PENDING, run_at__lte=now).order_by('run_at', 'id')
+        name = due.values_list('name', flat=True).first()
+        if name is None:
+            return None, []
+        ids = list(due.filter(name=name).values_list('id', flat=True)[:self.batch_size])
+        token = uuid.uuid4().hex
+        # условие status=pending в UPDATE не даёт двум воркерам взять одну задачу
+        Task.objects.filter(id__in=ids, status=Task.PENDING).update(
+            status=Task.RUNNING, claimed_by=token, started_at=now,
+            locked_until=now + timedelta(seconds=self.lease), attempts=F('attempts') + 1,
+        )
+        return name, list(Task.objects.filter(claimed_by=token, status=Task.RUNNING).order_by('id'))
+
+    def run_once(self):
+        """ Выполнить одну пачку; возвращает число выполненных задач """
+        self.maintain()
+        name, batch = self.claim()
+        if not batch:
+            return 0
+        start = time.perf_counter()
+        handler = registry.get(name)
+        try:
+            if handler is None:
+                raise KeyError(f"unknown task: {name}")
+            handler([item.payload for item in batch])
+        except Exception as e:
+            logger.exception('task %s failed (%s tasks)', name, len(batch))
+            self.fail(batch, e)
+            return 0
+        Task.objects.filter(id__in=[item.id for item in batch]).update(status=Task.DONE, finished_at=timezone.now())
+        logger.info(json.dumps({
+            'task': name,
+            'batch': len(batch),
+            'duration_ms': round((time.perf_counter() - start) * 1000, 2),
+            'max_wait_ms': round(max((item.started_at - item.created_at).total_seconds() for item in batch) * 1000, 2),
+        }))
+        return len(batch)
+
+    def fail(self, batch, error):
+        for item in batch:
+            fields = {'error': f"{type(error).__name__}: {error}", 'finished_at': timezone.now()}
+            if item.attempts >= settings.TASKS_MAX_ATTEMPTS:
+                Task.objects.filter(id=item.id).update(status=Task.FAILED, **fields)
+                continue
+            try:
+                with transaction.atomic():
+                    Task.objects.filter(id=item.id).update(
+                        status=Task.PENDING, run_at=retry_at(item.attempts), claimed_by='', locked_until=None, **fields,
+                    )
+            except IntegrityError:
+                # за это время поставлена такая же задача - повтор выполнит она
+                Task.objects.filter(id=item.id).update(status=Task.DONE, **fields)
+
+    def maintain(self):
+        """ Вернуть в очередь задачи упавших воркеров и удалить старые выполненные """
+        if time.monotonic() - self.last_cleanup < settings.TASKS_CLEANUP_INTERVAL:
+            return
+        self.last_cleanup = time.monotonic()
+        now = timezone.now()
+        for item in Task.objects.filter(status=Task.RUNNING, locked_until__lt=now):
+            self.fail([item], TimeoutError('lease expired'))
+        Task.objects.filter(status=Task.DONE, finished_at__lt=now - timedelta(seconds=settings.TASKS_KEEP_DONE)).delete()
+
+    def run(self, stop, poll_interval=None):
+        """ Выполнять задачи, пока не выставлен stop (threading.Event) """
+        poll_interval = poll_interval or settings.TASKS_POLL_INTERVAL
+        while not stop.is_set():
+            try:
+                done = self.run_once()
+            except OperationalError:
+                # БД занята другим пишущим процессом или соединение потеряно - повторим после паузы
+                logger.warning('task queue unavailable', exc_info=True)
+                connection.close()
+                done = 0
+            if not done:
+                _wakeup.wait(poll_interval)
+                _wakeup.clear()
+        connection.close()
+
+
+def wake():
+    """ Разбудить ждущих воркеров этого процесса """
+    _wakeup.set()
+
+
+def start_local_workers(count=None):
+    """ Потоки-воркеры внутри веб-процесса (TASKS_WORKERS); ничего не делает при TASKS_EAGER """
+    count = settings.TASKS_WORKERS if count is None else count
+    if settings.TASKS_EAGER or _local_workers:
+        return
+    stop = threading.Event()
+    for number in range(count):
+        thread = threading.Thread(target=Worker().run, args=(stop,), name=f'task-worker-{number}', daemon=True)
+        thread.start()
+        _local_workers.append(thread)
+
+
+def metrics(window=3600):
+    """
+    Глубина очереди и задержки по задачам: ожидающие (и из них готовые к выполнению),
+    выполняемые, с ошибкой, возраст самой старой готовой задачи и ожидание в очереди
+    (p50/p95, мс) у выполненных за последние window секунд.
+    """
+    now = timezone.now()
+    result = {}
+
+    def entry(name):
+        return result.setdefault(name, {
+            'pending': 0, 'due': 0, 'running': 0, 'failed': 0, 'done': 0,
+            'oldest_due_age_s': None, 'wait_p50_ms': None, 'wait_p95_ms': None,
+        })
+
+    for row in Task.objects.values('name', 'status').annotate(count=Count('id')).order_by():
+        if row['status'] in (Task.PENDING, Task.RUNNING, Task.FAILED):
+            entry(row['name'])[row['status']] = row['count']
+    due = Task.objects.filter(status=Task.PENDING, run_at__lte=now).values('name')
+    for row in due.annotate(count=Count('id'), oldest=Min('created_at')).order_by():
+        stats = entry(row['name'])
+        stats['due'] = row['count']
+        stats['oldest_due_age_s'] = round((now - row['oldest']).total_seconds(), 3)
+
+    waits = {}
+    done = Task.objects.filter(status=Task.DONE, finished_at__gte=now - timedelta(seconds=window))
+    for name, created_at, started_at in done.values_list('name', 'created_at', 'started_at').iterator():
+        waits.setdefault(name, []).append((started_at - created_at).total_seconds() * 1000)
+    for name, values in waits.items():
+        stats = entry(name)
+        stats['done'] = len(values)
+        stats['wait_p50_ms'] = round(statistics.median(values), 2)
+        stats['wait_p95_ms'] = round(_percentile(values, 95), 2)
+    return result
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+@task('reconcile_totals')
+def reconcile_orders(order_ids):
+    reconcile_totals(order_ids=order_ids)
@@ -1,3 +1,1268 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import os
+import pstats
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, modify_settings, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from main.handlers import StreamingASGIHandler
+from main.middleware import ReplicaReadMiddleware, make_profile_token
+from main.renderers import FastJSONRenderer
+from main.routers import PrimaryReplicaRouter, replica_reads, use_primary, use_replicas
+from order import admin, archive, fast_serializers, live, menu_import, models, reports, search, serializers, tasks
+
+
+class OrderTotalsTests(TestCase):
+    """ subtotal и total ведутся дельтами от записей единиц заказа и не затираются сохранением заказа """
+
+    @classmethod
+    def setUpTestData(cls):
+        cafe = models.Establishment.objects.create(name='Totals', service_price=10, delivery_price=150)
+        cls.plov = models.Product.objects.create(name='Плов', price=300, cafe=cafe)
+        cls.tea = models.Product.objects.create(name='Чай', price=50, cafe=cafe)
+
+    def totals(self, order):
+        return models.Order.objects.values_list('subtotal', 'total').get(pk=order.pk)
+
+    def assertTotals(self, order, subtotal):
+        # total - тот же, что считает БД по единицам заказа
+        self.assertEqual(self.totals(order), (subtotal, models.get_totall(order.pk)))
+
+    def test_item_add_update_delete(self):
+        order = models.Order.objects.create(order_type=1)
+        plov = models.OrderItem.objects.create(order=order, product=self.plov, amount=2)
+        self.assertEqual(self.totals(order), (600, 660))
+        tea = models.OrderItem.objects.create(order=order, product=self.tea, amount=1)
+        self.assertTotals(order, 650)
+
+        plov.amount = 1
+        plov.save()
+        self.assertTotals(order, 350)
+        plov.delete()
+        self.assertTotals(order, 50)
+
+        other = models.Order.objects.create(order_type=2)
+        tea.order = other
+        tea.save()
+        self.assertEqual(self.totals(order), (0, 0))
+        self.assertEqual(self.totals(other), (50, 200))
+        other.order_type = 3
+        other.save()
+        self.assertEqual(self.totals(other), (50, 50))
+        # у заказа не осталось единиц - нет и заведения
+        self.assertIsNone(models.Order.objects.get(pk=order.pk).establishment_id)
+        self.assertEqual(models.Order.objects.get(pk=other.pk).establishment_id, self.tea.cafe_id)
+
+    def test_deletes_bypassing_item_delete(self):
+        order = models.Order.objects.create(order_type=3)
+        items = [models.OrderItem.objects.create(order=order, product=product, amount=1)
+                 for product in (self.plov, self.tea, self.plov)]
+        models.OrderItem.objects.filter(pk=items[2].pk).delete()
+        self.assertEqual(self.totals(order), (350, 350))
+
+        # массовое удаление в админке
+        self.client.force_login(User.objects.create_superuser('bulk', 'bulk@example.com', 'x'))
+        response = self.client.post('/admin/order/orderitem/', {
+            'action': 'delete_selected', '_selected_action': [items[1].pk], 'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.totals(order), (300, 300))
+
+        # каскад от продукта
+        self.plov.delete()
+        self.assertEqual(self.totals(order), (0, 0))
+
+    def test_order_delete_cascades_items(self):
+        order = models.Order.objects.create(order_type=1)
+        models.OrderItem.objects.create(order=order, product=self.tea, amount=2)
+        # единицы, корзина выручки и её задача, три удаления: сумма и сверка удаляемого заказа не нужны
+        with self.assertNumQueries(6):
+            order.delete()
+        self.assertFalse(models.OrderItem.objects.filter(order_id=order.pk).exists())
+
+    def test_stale_instance_keeps_totals(self):
+        order = models.Order.objects.create(order_type=1)
+        stale = models.Order.objects.get(pk=order.pk)
+        models.OrderItem.objects.create(order=order, product=self.plov, amount=2)
+
+        stale.paid = True
+        stale.save()
+        self.assertEqual(self.totals(order), (600, 660))
+        self.assertTrue(models.Order.objects.get(pk=order.pk).paid)
+
+        response = self.client.patch(reverse('order-detail', args=[order.pk]), {'order_type': 3},
+                                     content_type='application/json')
+        self.assertEqual(response.json()['total'], 600)
+
+        # в форме админки суммы только для чтения
+        self.client.force_login(User.objects.create_superuser('totals', 'totals@example.com', 'x'))
+        response = self.client.post(f'/admin/order/order/{order.pk}/change/', {'order_type': 1, 'paid': 'on'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.totals(order), (600, 660))
+
+
+def cursor(position, reverse=False):
+    return base64.urlsafe_b64encode(json.dumps([position, reverse]).encode()).decode()
+
+
+class KeysetPaginationTests(TestCase):
+    """ Курсорная пагинация списка заказов: страницы, ссылки, размер страницы, плохие курсоры """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.orders = [models.Order.objects.create(order_type=1) for _ in range(5)]
+        # новые первыми: created_at может совпасть, тогда порядок решает id
+        cls.expected = [order.pk for order in sorted(cls.orders, key=lambda o: (o.created_at, o.pk), reverse=True)]
+
+    def get(self, **params):
+        return self.client.get(reverse('order-list'), params)
+
+    def test_pages_and_links(self):
+        first = self.get(page_size=2).json()
+        self.assertEqual([row['id'] for row in first['results']], self.expected[:2])
+        self.assertIsNone(first['previous'])
+
+        second = self.client.get(first['next']).json()
+        self.assertEqual([row['id'] for row in second['results']], self.expected[2:4])
+        back = self.client.get(second['previous']).json()
+        self.assertEqual([row['id'] for row in back['results']], self.expected[:2])
+        self.assertIsNone(back['previous'])
+
+        last = self.client.get(second['next']).json()
+        self.assertEqual([row['id'] for row in last['results']], self.expected[4:])
+        self.assertIsNone(last['next'])
+
+    def test_page_size_is_clamped(self):
+        self.assertEqual(len(self.get(page_size=0).json()['results']), 1)
+        self.assertEqual(len(self.get(page_size='x').json()['results']), 5)
+        with self.settings(MAX_PAGE_SIZE=3):
+            self.assertEqual(len(self.get(page_size=100).json()['results']), 3)
+
+    def test_invalid_cursor(self):
+        for value in ('%%%', 'bm90IGpzb24', cursor([1]), cursor(5), cursor([[123, 1], False]),
+                      cursor(['x', 1]), cursor(['2023-01-01T00:00:00+00:00', 10 ** 30])):
+            with self.subTest(cursor=value):
+                response = self.get(cursor=value)
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+    def test_infinite_cursor(self):
+        for url, position in ((reverse('product-list'), [float('inf')]),
+                              (reverse('order-list'), ['2023-01-01T00:00:00+00:00', float('-inf')])):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'cursor': cursor(position)})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+
+class CheckoutTests(TestCase):
+    """ Заказ корзиной: суммы, доставка, ошибки валидации """
+
+    @classmethod
+    def setUpTestData(cls):
+        cafe = models.Establishment.objects.create(name='Checkout', service_price=10, delivery_price=150)
+        cls.plov = models.Product.objects.create(name='Плов', price=300, cafe=cafe)
+        cls.tea = models.Product.objects.create(name='Чай', price=50, cafe=cafe)
+
+    def checkout(self, data):
+        return self.client.post(reverse('checkout'), data, content_type='application/json')
+
+    def test_in_place_order(self):
+        response = self.checkout({'items': [{'product': self.plov.pk, 'amount': 2}, {'product': self.tea.pk, 'amount': 1}]})
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body['order_type'], body['total']), (1, 650 + 650 // 100 * 10))
+        self.assertEqual(len(body['order_items']), 2)
+        self.assertEqual(body['total'], models.get_totall(body['id']))
+
+    def test_delivery_without_description(self):
+        response = self.checkout({
+            'items': [{'product': self.tea.pk, 'amount': 2}],
+            'delivery': {'address': 'Чуй 1', 'phone': '+996700000000'},
+        })
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body['order_type'], body['total']), (2, 100 + 150))
+        delivery = models.Delivery.objects.get(order_id=body['id'])
+        self.assertEqual((delivery.address, delivery.description), ('Чуй 1', None))
+
+    def test_invalid_cart(self):
+        missing = models.Product.objects.order_by('-id').values_list('id', flat=True).first() + 1
+        for data in ({'items': []}, {'items': [{'product': missing, 'amount': 1}]},
+                     {'items': [{'product': self.tea.pk, 'amount': 0}]},
+                     {'items': [{'product': 10 ** 20, 'amount': 1}]},
+                     {'items': [{'product': self.tea.pk, 'amount': 10 ** 20}]},
+                     {'items': [{'product': self.tea.pk, 'amount': 2 ** 31}]}):
+            with self.subTest(data=data):
+                self.assertEqual(self.checkout(data).status_code, 400)
+        self.assertFalse(models.Order.objects.exists())
+
+
+class MenuImportTests(TestCase):
+    """ Импорт меню из файла: пачки, отчёт об ошибках по строкам, файлы, которые нельзя прочитать """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cafe = models.Establishment.objects.create(name='Import', service_price=10, delivery_price=150)
+        models.Product.objects.create(name='Плов', price=300, cafe=cls.cafe)
+
+    def upload(self, content, name='menu.csv'):
+        return self.client.post(reverse('product-import'), {'file': SimpleUploadedFile(name, content)})
+
+    def test_create_update_and_row_errors(self):
+        content = (
+            'cafe,name,price\n'
+            f'{self.cafe.pk},Плов,350\n'
+            'Import,Чай,50\n'
+            f'{self.cafe.pk},Лагман,x\n'
+            f'²,Манты,200\n'
+            f'99999999999999999999999,Манты,200\n'
+            f'{self.cafe.pk},"{"я" * 200000}",1\n'
+            f'{self.cafe.pk},Ко\x00мпот,40\n'
+            'Import,Самса,90\n'
+        )
+        response = self.upload(content.encode())
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report['created'], report['updated'], report['unchanged']), (2, 1, 0))
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4, 5, 6, 7])
+        self.assertIn('invalid CSV', report['errors'][3]['error'])
+        self.assertEqual(
+            dict(models.Product.objects.filter(cafe=self.cafe).values_list('name', 'price')),
+            {'Плов': 350, 'Чай': 50, 'Самса': 90},
+        )
+
+    def test_jsonl(self):
+        content = f'{{"cafe": {self.cafe.pk}, "name": "Чай", "price": 50}}\n[1]\n{{broken\n'
+        report = self.upload(content.encode(), name='menu.jsonl').json()
+        self.assertEqual(report['created'], 1)
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3])
+
+    def test_invalid_prices(self):
+        prices = ['1.5', 10 ** 30, 2 ** 40, 2 ** 31, -1, True, 1.5, '1e3', '-5', None]
+        content = ''.join(
+            json.dumps({'cafe': self.cafe.pk, 'name': f'Продукт {number}', 'price': price}) + '\n'
+            for number, price in enumerate(prices + [' 2147483647 ', 0])
+        )
+        report = self.upload(content.encode(), name='menu.jsonl').json()
+        self.assertEqual(report['created'], 2)
+        self.assertEqual([error['row'] for error in report['errors']], list(range(1, len(prices) + 1)))
+        self.assertEqual(
+            sorted(models.Product.objects.filter(name__startswith='Продукт').values_list('price', flat=True)),
+            [0, models.MAX_POSITIVE_INT],
+        )
+
+    def test_file_not_utf8(self):
+        response = self.upload('cafe,name,price\nImport,Чай,50\n'.encode('cp1251'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('UTF-8', response.json()['file'][0])
+        self.assertFalse(models.Product.objects.filter(name='Чай').exists())
+
+    def test_parse_id(self):
+        self.assertEqual(models.parse_id(' 42 '), 42)
+        self.assertEqual(models.parse_id(str(models.MAX_ID)), models.MAX_ID)
+        for value in ('', '-1', '1.5', '²', 'x1', str(models.MAX_ID + 1)):
+            self.assertIsNone(models.parse_id(value), value)
+
+
+class MenuCacheTests(TestCase):
+    """ Кэш меню заведения: 304 по ETag и сброс версии при изменении продуктов """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cafe = models.Establishment.objects.create(name='Menu', service_price=10, delivery_price=150)
+        cls.other = models.Establishment.objects.create(name='Other', service_price=10, delivery_price=150)
+        cls.plov = models.Product.objects.create(name='Плов', price=300, cafe=cls.cafe)
+
+    def setUp(self):
+        cache.clear()
+
+    def menu(self, cafe, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('establishment-menu', args=[cafe.pk]), **headers)
+
+    def names(self, cafe):
+        return [product['name'] for product in json.loads(self.menu(cafe).content)['products']]
+
+    def test_not_modified(self):
+        response = self.menu(self.cafe)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.menu(self.cafe, response['ETag']).status_code, 304)
+        self.assertEqual(self.menu(self.cafe, '"stale"').status_code, 200)
+
+    def test_id_out_of_range(self):
+        self.assertEqual(self.client.get(reverse('establishment-menu', args=[10 ** 20])).status_code, 404)
+
+    def test_product_change(self):
+        etag = self.menu(self.cafe)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Product.objects.create(name='Чай', price=50, cafe=self.cafe)
+        response = self.menu(self.cafe, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.names(self.cafe), ['Плов', 'Чай'])
+
+    def test_product_moved_to_other_cafe(self):
+        self.assertEqual(self.names(self.cafe), ['Плов'])
+        self.assertEqual(self.names(self.other), [])
+        # экземпляр загружен заново, как в представлении или админке
+        product = models.Product.objects.get(pk=self.plov.pk)
+        product.cafe = self.other
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(self.names(self.cafe), [])
+        self.assertEqual(self.names(self.other), ['Плов'])
+
+        product.cafe = self.cafe
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(self.names(self.cafe), ['Плов'])
+        self.assertEqual(self.names(self.other), [])
+
+    def test_import_invalidates(self):
+        etag = self.menu(self.cafe)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            menu_import.import_menu([{'cafe': 'Menu', 'name': 'Плов', 'price': '310'}])
+        self.assertEqual(self.menu(self.cafe, etag).status_code, 200)
+        self.assertEqual(json.loads(self.menu(self.cafe).content)['products'][0]['price'], 310)
+
+
+class OrderConditionalGetTests(TestCase):
+    """ 304 для деталей заказа по ETag и If-Modified-Since """
+
+    def setUp(self):
+        self.order = models.Order.objects.create(order_type=1)
+        # изменение в прошлой секунде: у заказа есть Last-Modified
+        models.Order.objects.filter(pk=self.order.pk).update(modified_at=timezone.now() - timedelta(seconds=5))
+
+    def get(self, **headers):
+        return self.client.get(reverse('order-detail', args=[self.order.pk]), **headers)
+
+    def test_etag_and_if_modified_since(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        self.client.patch(reverse('order-detail', args=[self.order.pk]), {'order_type': 3},
+                          content_type='application/json')
+        changed = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['order_type'], 3)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 200)
+
+    def test_no_last_modified_within_the_changed_second(self):
+        models.Order.objects.filter(pk=self.order.pk).update(modified_at=timezone.now())
+        with mock.patch('order.views.time.time', return_value=timezone.now().timestamp()):
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class EstablishmentOrderListTests(TestCase):
+    """ Заказы заведения: фильтры, 404/400 и число запросов на страницу """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cafe = models.Establishment.objects.create(name='Orders', service_price=10, delivery_price=150)
+        other = models.Establishment.objects.create(name='Elsewhere', service_price=10, delivery_price=150)
+        product = models.Product.objects.create(name='Плов', price=300, cafe=cls.cafe)
+        foreign = models.Product.objects.create(name='Суп', price=100, cafe=other)
+
+        def order(day, order_type=1, paid=False, product=product):
+            created = models.Order.objects.create(order_type=order_type)
+            models.OrderItem.objects.create(order=created, product=product, amount=1)
+            models.Order.objects.filter(pk=created.pk).update(
+                paid=paid, created_at=timezone.make_aware(datetime(2023, 3, day, 12)),
+            )
+            return created.pk
+
+        cls.first = order(1)
+        cls.paid = order(2, paid=True)
+        cls.pick_up = order(3, order_type=3)
+        cls.last = order(4, paid=True)
+        order(2, product=foreign)
+
+    def ids(self, **params):
+        response = self.client.get(reverse('establishment-orders', args=[self.cafe.pk]), params)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_filters(self):
+        self.assertEqual(self.ids(), [self.last, self.pick_up, self.paid, self.first])
+        self.assertEqual(self.ids(paid='true'), [self.last, self.paid])
+        self.assertEqual(self.ids(paid='false'), [self.pick_up, self.first])
+        self.assertEqual(self.ids(order_type=3), [self.pick_up])
+        self.assertEqual(self.ids(date_from='2023-03-02', date_to='2023-03-03'), [self.pick_up, self.paid])
+        self.assertEqual(self.ids(date_to='2023-03-01', paid='false'), [self.first])
+
+    def test_page_has_items_without_extra_queries(self):
+        # заведение, страница заказов, доставки и единицы заказа - независимо от размера страницы
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('establishment-orders', args=[self.cafe.pk]), {'page_size': 2})
+        rows = response.json()['results']
+        self.assertEqual([row['id'] for row in rows], [self.last, self.pick_up])
+        self.assertEqual([len(row['order_items']) for row in rows], [1, 1])
+        self.assertEqual([row['id'] for row in self.client.get(response.json()['next']).json()['results']],
+                         [self.paid, self.first])
+
+    def test_errors(self):
+        missing = models.Establishment.objects.order_by('-id').values_list('id', flat=True).first() + 1
+        self.assertEqual(self.client.get(reverse('establishment-orders', args=[missing])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('establishment-orders', args=[10 ** 20])).status_code, 404)
+        for params in ({'order_type': 4}, {'date_from': '03.03.2023'}, {'paid': 'maybe'},
+                       {'date_to': '9999-12-31'}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('establishment-orders', args=[self.cafe.pk]), params)
+                self.assertEqual(response.status_code, 400)
+
+    def test_establishment_list(self):
+        response = self.client.get(reverse('establishment-list'), {'page_size': 1})
+        self.assertEqual(response.json()['results'][0]['name'], 'Orders')
+        self.assertEqual(self.client.get(response.json()['next']).json()['results'][0]['name'], 'Elsewhere')
+
+
+@override_settings(REQUEST_TIMING_SAMPLE_RATE=1)
+@modify_settings(MIDDLEWARE={'prepend': 'main.middleware.RequestTimingMiddleware'})
+class RequestTimingTests(TestCase):
+    """ Server-Timing: время сериализаторов - отдельная метрика, а не часть view """
+
+    def timings(self, url):
+        """ Метрики из Server-Timing; та же строка уходит в лог main.timing """
+        with self.assertLogs('main.timing', 'INFO') as logs:
+            response = self.client.get(url)
+        timings = {
+            name: float(value.split('=')[1])
+            for name, value in (metric.split(';') for metric in response['Server-Timing'].split(', '))
+        }
+        logged = json.loads(logs.records[0].getMessage())
+        self.assertEqual(logged['queries'], int(response['X-Query-Count']))
+        self.assertEqual(logged['serialize_ms'], round(timings['serialize'], 2))
+        return timings
+
+    def test_metrics(self):
+        models.Order.objects.create(order_type=1)
+        self.assertEqual(list(self.timings(reverse('order-list'))), ['db', 'view', 'serialize', 'render', 'total'])
+
+    def test_serializer_time_is_not_view_time(self):
+        order = models.Order.objects.create(order_type=1)
+        data = fast_serializers.FastSerializer.data
+
+        def slow(serializer):
+            time.sleep(0.05)
+            return data.fget(serializer)
+
+        with mock.patch.object(fast_serializers.FastSerializer, 'data', property(slow)):
+            timings = self.timings(reverse('order-list'))
+        self.assertGreaterEqual(timings['serialize'], 50)
+        self.assertLess(timings['view'], 50)
+        self.assertGreaterEqual(timings['total'], timings['view'] + timings['serialize'])
+
+        self.assertGreater(self.timings(reverse('order-detail', args=[order.pk]))['serialize'], 0)
+
+
+@modify_settings(MIDDLEWARE={'prepend': 'main.middleware.ProfilerMiddleware'})
+class ProfilerTests(TestCase):
+    """ Профилирование запроса по подписанному токену """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        override = override_settings(PROFILER_ENABLED=True, PROFILER_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_cprofile(self):
+        with self.assertLogs('main.profiler', 'INFO'):
+            response = self.client.get(reverse('order-list'), HTTP_X_PROFILE=make_profile_token())
+        self.assertEqual(response.status_code, 200)
+        filename = response['X-Profile-File']
+        self.assertRegex(filename, r'^order-list-\d+-\d+\.prof$')
+        self.assertEqual(os.listdir(self.directory), [filename])
+        stats = pstats.Stats(os.path.join(self.directory, filename))
+        self.assertTrue(any(function == 'get' for _, _, function in stats.stats))
+
+    def test_sampling_via_query_string(self):
+        with self.settings(PROFILER_SAMPLE_INTERVAL=0.001), self.assertLogs('main.profiler', 'INFO'):
+            response = self.client.get(reverse('order-list'), {'profile': make_profile_token(), 'profile_mode': 'sampling'})
+        self.assertTrue(response['X-Profile-File'].endswith('.collapsed'))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, response['X-Profile-File'])))
+
+    def test_request_is_not_profiled(self):
+        cases = [('bad token', 'profile:nonsense', {}), ('expired', make_profile_token(), {'PROFILER_TOKEN_MAX_AGE': -1}),
+                 ('disabled', make_profile_token(), {'PROFILER_ENABLED': False})]
+        for name, token, overrides in cases:
+            # новый клиент - middleware читает настройки при создании
+            with self.subTest(name), self.settings(**overrides):
+                response = Client().get(reverse('order-list'), HTTP_X_PROFILE=token)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+@override_settings(ROOT_URLCONF='main.asgi_urls')
+class AsyncViewTests(TestCase):
+    """ Асинхронные GET-view (main.asgi_urls) отвечают так же, как синхронные """
+
+    @classmethod
+    def setUpTestData(cls):
+        cafe = models.Establishment.objects.create(name='Async', service_price=10, delivery_price=150)
+        product = models.Product.objects.create(name='Плов', price=300, cafe=cafe)
+        cls.cafe = cafe
+        cls.orders = []
+        for order_type in (1, 2, 1):
+            order = models.Order.objects.create(order_type=order_type)
+            models.OrderItem.objects.create(order=order, product=product, amount=1)
+            cls.orders.append(order)
+
+    async def test_same_as_sync_views(self):
+        for url in (reverse('order-list'), reverse('delivery-orders'), reverse('order-list') + '?page_size=1',
+                    reverse('order-detail', args=[self.orders[0].pk]), reverse('establishment-menu', args=[self.cafe.pk])):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                with override_settings(ROOT_URLCONF='main.urls'):
+                    expected = await sync_to_async(Client().get)(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(response.content), json.loads(expected.content))
+
+    async def test_not_found(self):
+        response = await self.async_client.get(reverse('order-list'), {'cursor': 'garbage'})
+        self.assertEqual((response.status_code, json.loads(response.content)), (404, {'detail': 'Invalid cursor'}))
+        response = await self.async_client.get(reverse('order-list'), {'cursor': cursor([[123, 1], False])})
+        self.assertEqual(response.status_code, 404)
+        missing = self.orders[-1].pk + 1
+        self.assertEqual((await self.async_client.get(reverse('order-detail', args=[missing]))).status_code, 404)
+        self.assertEqual((await self.async_client.get(reverse('establishment-menu', args=[10 ** 20]))).status_code, 404)
+
+    async def test_conditional_get(self):
+        url = reverse('order-detail', args=[self.orders[0].pk])
+        response = await self.async_client.get(url)
+        # AsyncClient в Django 4.1 передаёт extra в заголовки ASGI как есть, без HTTP_
+        self.assertEqual((await self.async_client.get(url, **{'If-None-Match': response['ETag']})).status_code, 304)
+
+    async def asgi_get(self, path, query_string):
+        """ Запрос через ASGI-обработчик main/asgi.py (AsyncClient сам дочитывает потоковый ответ в потоке) """
+        # как тестовый клиент: соединение тестовой транзакции не закрывается сигналами запроса
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query_string, 'headers': []}
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            sent.append(message)
+
+        await StreamingASGIHandler()(scope, receive, send)
+        return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+    async def test_stream(self):
+        for url, queryset, serializer_class in (
+            (reverse('order-list'), models.Order.objects.with_related().order_by('-created_at', '-id'),
+             serializers.OrderSerializer),
+            (reverse('order-item-list'), models.OrderItem.objects.select_related('product').order_by('id'),
+             serializers.OrderItemSerializer),
+        ):
+            with self.subTest(url=url):
+                status, body = await self.asgi_get(url, b'stream=1')
+                expected = await sync_to_async(lambda: serializer_class(queryset, many=True).data)()
+                self.assertEqual(status, 200)
+                self.assertEqual(json.loads(body), json.loads(JSONRenderer().render(expected)))
+
+
+@override_settings(DATABASE_REPLICA_ALIASES=['replica1'], PRIMARY_PIN_SECONDS=5)
+class ReplicaRoutingTests(TestCase):
+    """ Чтение с реплик: роутер и ReplicaReadMiddleware (сами реплики не нужны) """
+
+    def test_router(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(models.Order), 'default')
+        with use_replicas():
+            self.assertEqual(router.db_for_read(models.Order), 'replica1')
+            with use_primary():
+                self.assertEqual(router.db_for_read(models.Order), 'default')
+            order = models.Order(order_type=1)
+            order._state.db = 'default'
+            self.assertEqual(router.db_for_read(models.OrderItem, instance=order), 'default')
+            self.assertEqual(router.db_for_write(models.Order), 'default')
+            with self.settings(DATABASE_REPLICA_ALIASES=[]):
+                self.assertEqual(router.db_for_read(models.Order), 'default')
+        self.assertFalse(router.allow_migrate('replica1', 'order'))
+        self.assertTrue(router.allow_migrate('default', 'order'))
+
+    def test_middleware(self):
+        def view(request):
+            response = HttpResponse('replica' if replica_reads.get() else 'primary')
+            response.status_code = 400 if request.GET.get('fail') else 200
+            return response
+
+        middleware = ReplicaReadMiddleware(view)
+        factory = RequestFactory()
+        self.assertEqual(middleware(factory.get('/')).content, b'replica')
+        self.assertEqual(middleware(factory.get('/', HTTP_X_PIN_PRIMARY='1')).content, b'primary')
+
+        response = middleware(factory.post('/'))
+        self.assertEqual(response.content, b'primary')
+        self.assertEqual(response.cookies['pin_primary']['max-age'], 5)
+        self.assertNotIn('pin_primary', middleware(factory.post('/?fail=1')).cookies)
+        self.assertNotIn('pin_primary', middleware(factory.get('/')).cookies)
+
+        pinned = factory.get('/')
+        pinned.COOKIES['pin_primary'] = '1'
+        self.assertEqual(middleware(pinned).content, b'primary')
+        self.assertFalse(replica_reads.get())
+
+
+class FormatTests(TestCase):
+    """ Ответы через orjson совпадают с JSONRenderer; MessagePack в запросах и ответах """
+
+    @classmethod
+    def setUpTestData(cls):
+        cafe = models.Establishment.objects.create(name='Formats', service_price=10, delivery_price=150)
+        cls.product = models.Product.objects.create(name='Плов\u2028', price=300, cafe=cafe)
+
+    def test_fast_json_same_as_drf(self):
+        data = {
+            'text': 'Плов\u2028\u2029 "x"', 'when': timezone.make_aware(datetime(2023, 3, 1, 12, 30, 0, 123456)),
+            'day': datetime(2023, 3, 1).date(), 'price': Decimal('1.50'), 'id': uuid.UUID(int=1), 'nested': [1, None, True],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), JSONRenderer().render(None))
+        response = self.client.get(reverse('product-detail', args=[self.product.pk]))
+        self.assertIn(b'\\u2028', response.content)
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        url = reverse('product-detail', args=[self.product.pk])
+        response = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), self.client.get(url).json())
+
+        body = msgpack.packb({'product': self.product.pk, 'amount': 2})
+        response = self.client.post(reverse('create-order'), body, content_type='application/msgpack')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['amount'], 2)
+
+        response = self.client.post(reverse('create-order'), b'\x92\x01', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_order_body_must_be_object(self):
+        for content_type, body in (('application/json', '[1, 2]'), ('application/json', '7')):
+            with self.subTest(body=body):
+                response = self.client.post(reverse('create-order'), body, content_type=content_type)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'non_field_errors': ['Invalid data. Expected a JSON object.']})
+        self.assertFalse(models.Order.objects.exists())
+
+
+class FastSerializerTests(TestCase):
+    """ Быстрые сериализаторы дают побайтно тот же JSON, что DRF-сериализаторы """
+
+    @classmethod
+    def setUpTestData(cls):
+        cafes = [
+            models.Establishment.objects.create(name='Ош "Базар"', description=None, service_price=10, delivery_price=150),
+            models.Establishment.objects.create(name='Cafe Line', description='x', service_price=0, delivery_price=0),
+        ]
+        products = [
+            models.Product.objects.create(name=f'Лагман {n}', price=100 + n, cafe=cafes[n % 2])
+            for n in range(4)
+        ]
+        now = timezone.now().replace(microsecond=123456)
+        for n in range(6):
+            order = models.Order.objects.create(order_type=n % 3 + 1, paid=n % 2 == 0)
+            for product in products[:n % 4]:
+                models.OrderItem.objects.create(order=order, product=product, amount=n + 1)
+            if order.order_type == 2:
+                models.Delivery.objects.create(order=order, address=f'Street {n}', phone='+996555000000',
+                                               description=None if n % 4 else 'Домофон')
+            # без микросекунд и с ними: формат DateTimeField должен совпасть в обоих случаях
+            stamp = now - timedelta(hours=n) if n % 2 else (now - timedelta(hours=n)).replace(microsecond=0)
+            models.Order.objects.filter(pk=order.pk).update(created_at=stamp, modified_at=stamp)
+
+    def assertSameJSON(self, fast, drf_class, queryset):
+        expected = JSONRenderer().render(drf_class(queryset, many=True).data)
+        actual = JSONRenderer().render(fast(fast.values(queryset), many=True).data)
+        self.assertEqual(actual, expected)
+
+    def test_orders(self):
+        queryset = models.Order.objects.with_related().order_by('-created_at', '-id')
+        self.assertSameJSON(fast_serializers.OrderSerializer, serializers.OrderSerializer, queryset)
+
+    def test_orders_with_totals(self):
+        queryset = models.Order.objects.with_related().with_totals().order_by('id')
+        self.assertSameJSON(fast_serializers.OrderSerializer, serializers.OrderSerializer, queryset)
+
+    def test_order_items_products_deliveries(self):
+        for fast, drf_class, queryset in (
+            (fast_serializers.OrderItemSerializer, serializers.OrderItemSerializer,
+             models.OrderItem.objects.select_related('order', 'product').order_by('id')),
+            (fast_serializers.ProductSerializer, serializers.ProductSerializer,
+             models.Product.objects.select_related('cafe').order_by('id')),
+            (fast_serializers.DeliverySerializer, serializers.DeliverySerializer,
+             models.Delivery.objects.select_related('order').order_by('id')),
+        ):
+            with self.subTest(serializer=drf_class.__name__):
+                self.assertSameJSON(fast, drf_class, queryset)
+
+    def test_order_list_endpoint(self):
+        orders = models.Order.objects.with_related().order_by('-created_at', '-id')
+        expected = JSONRenderer().render({
+            'next': None,
+            'previous': None,
+            'results': serializers.OrderSerializer(orders, many=True).data,
+        })
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('order-list'))
+        self.assertEqual(response.content, expected)
+
+    def test_order_list_stream(self):
+        orders = models.Order.objects.with_related().order_by('-created_at', '-id')
+        expected = json.loads(JSONRenderer().render(serializers.OrderSerializer(orders, many=True).data))
+        response = self.client.get(reverse('order-list'), {'stream': 1})
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), expected)
+
+    def test_keyset_pages(self):
+        url = reverse('order-item-list') + '?page_size=2'
+        items = models.OrderItem.objects.select_related('order', 'product').order_by('id')
+        results = []
+        while url:
+            page = self.client.get(url).json()
+            results += page['results']
+            url = page['next']
+        self.assertEqual(results, json.loads(JSONRenderer().render(serializers.OrderItemSerializer(items, many=True).data)))
+
+
+@override_settings(TASKS_EAGER=True)
+class RevenueRollupTests(TestCase):
+    """ Сводки, обновляемые по изменениям заказов, совпадают с полным пересчётом (задачи - сразу после коммита) """
+
+    def snapshot(self):
+        return sorted(models.DailyRevenue.objects.values_list(
+            'establishment_id', 'day', 'order_type', 'paid', 'orders', 'subtotal', 'revenue',
+        ))
+
+    def test_incremental_matches_rebuild(self):
+        cafe = models.Establishment.objects.create(name='Rollup', service_price=10, delivery_price=150)
+        product = models.Product.objects.create(name='Плов', price=300, cafe=cafe)
+        with self.captureOnCommitCallbacks(execute=True):
+            orders = [models.Order.objects.create(order_type=n % 3 + 1) for n in range(4)]
+            items = [models.OrderItem.objects.create(order=order, product=product, amount=2) for order in orders]
+        with self.captureOnCommitCallbacks(execute=True):
+            orders[0].paid = True
+            orders[0].save()
+            orders[1].order_type = 3
+            orders[1].save()
+            items[2].amount = 5
+            items[2].save()
+            orders[3].delete()
+
+        incremental = self.snapshot()
+        self.assertTrue(incremental)
+        reports.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+        report = self.client.get(reverse('revenue-report'), {'group_by': 'establishment'}).json()
+        self.assertEqual(report['totals']['orders'], 3)
+        self.assertEqual(report['results'], [{
+            'establishment': cafe.id, **report['totals'],
+        }])
+
+    def test_report_filter_errors(self):
+        for params in ({'establishment': 10 ** 20}, {'establishment': 0}, {'order_type': 4}, {'group_by': 'week'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse('revenue-report'), params).status_code, 400)
+
+    def test_establishment_follows_first_item(self):
+        first_cafe, second_cafe = (
+            models.Establishment.objects.create(name=name, service_price=10, delivery_price=150)
+            for name in ('First', 'Second')
+        )
+        plov = models.Product.objects.create(name='Плов', price=300, cafe=first_cafe)
+        soup = models.Product.objects.create(name='Суп', price=100, cafe=second_cafe)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = models.Order.objects.create(order_type=1)
+            first = models.OrderItem.objects.create(order=order, product=plov, amount=1)
+            models.OrderItem.objects.create(order=order, product=soup, amount=1)
+            other = models.Order.objects.create(order_type=3)
+            moved = models.OrderItem.objects.create(order=other, product=soup, amount=1)
+
+        def establishments():
+            return [models.Order.objects.get(pk=pk).establishment_id for pk in (order.pk, other.pk)]
+
+        def assertRollup():
+            incremental = self.snapshot()
+            reports.rebuild()
+            self.assertEqual(incremental, self.snapshot())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.OrderItem.objects.filter(pk=first.pk).delete()
+        self.assertEqual(establishments(), [second_cafe.pk, second_cafe.pk])
+        assertRollup()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.product = plov
+            moved.save()
+        self.assertEqual(establishments(), [second_cafe.pk, first_cafe.pk])
+        assertRollup()
+
+        # разошедшееся заведение исправляет сверка
+        models.Order.objects.filter(pk=order.pk).update(establishment=first_cafe)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(models.reconcile_totals(order_ids=[order.pk])[:2], (1, 1))
+        self.assertEqual(establishments(), [second_cafe.pk, first_cafe.pk])
+        self.assertEqual(
+            sorted(models.DailyRevenue.objects.values_list('establishment_id', 'orders')),
+            [(first_cafe.pk, 1), (second_cafe.pk, 1)],
+        )
+
+
+def live_order(pk, establishment_id=1, order_type=1, paid=False):
+    return {'id': pk, 'establishment_id': establishment_id, 'order_type': order_type, 'paid': paid,
+            'total': 100, 'modified_at': timezone.make_aware(datetime(2023, 3, 1, 12))}
+
+
+class LiveBrokerTests(TestCase):
+    """ Брокер живой ленты: фильтры, повтор по Last-Event-ID, медленные клиенты """
+
+    async def test_filters(self):
+        broker = live.Broker(10)
+        loop = asyncio.get_running_loop()
+        kitchen, _ = broker.subscribe(loop, establishment=1, order_types={1, 3})
+        everything, _ = broker.subscribe(loop)
+        broker.publish('created', [live_order(1), live_order(2, order_type=2), live_order(3, establishment_id=2)])
+        await asyncio.sleep(0)
+        self.assertEqual([kitchen.queue.get_nowait().id], [1])
+        self.assertTrue(kitchen.queue.empty())
+        self.assertEqual([everything.queue.get_nowait().id for _ in range(3)], [1, 2, 3])
+
+        broker.unsubscribe(kitchen)
+        broker.publish('paid', [live_order(1, paid=True)])
+        await asyncio.sleep(0)
+        self.assertTrue(kitchen.queue.empty())
+        event = everything.queue.get_nowait()
+        self.assertEqual((event.id, event.kind), (4, 'paid'))
+        self.assertTrue(event.payload.startswith(b'id: 4\nevent: paid\ndata: {"id":1,'))
+        self.assertIn(b'"modified_at":"2023-03-01T12:00:00Z"', event.payload)
+
+    async def test_replay(self):
+        broker = live.Broker(3)
+        loop = asyncio.get_running_loop()
+        broker.publish('created', [live_order(pk, order_type=pk % 2 + 1) for pk in range(1, 6)])
+        # в буфере события 3, 4, 5
+        _, missed = broker.subscribe(loop, order_types={1}, last_event_id=2)
+        self.assertEqual([event.id for event in missed], [4])
+        _, missed = broker.subscribe(loop, last_event_id=5)
+        self.assertEqual(missed, [])
+        _, missed = broker.subscribe(loop, last_event_id=1)
+        self.assertEqual(missed, 'reset')
+        # id из другого процесса (до перезапуска)
+        _, missed = broker.subscribe(loop, last_event_id=99)
+        self.assertEqual(missed, 'reset')
+
+    @override_settings(LIVE_QUEUE_SIZE=2)
+    async def test_slow_client_is_disconnected(self):
+        broker = live.Broker(10)
+        subscription, _ = broker.subscribe(asyncio.get_running_loop())
+        broker.publish('created', [live_order(pk) for pk in range(1, 5)])
+        await asyncio.sleep(0)
+        queued = [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+        self.assertEqual([event and event.id for event in queued[:3]], [1, 2, None])
+
+    def test_signal_event_kinds(self):
+        cafe = models.Establishment.objects.create(name='Live', service_price=10, delivery_price=150)
+        product = models.Product.objects.create(name='Плов', price=300, cafe=cafe)
+        start = live.broker.last_id
+        live.broker.active = True
+        self.addCleanup(setattr, live.broker, 'active', False)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('checkout'), {'items': [{'product': product.pk, 'amount': 1}]},
+                                        content_type='application/json')
+        order = models.Order.objects.get(pk=response.json()['id'])
+        with self.captureOnCommitCallbacks(execute=True):
+            order.paid = True
+            order.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            models.OrderItem.objects.create(order=order, product=product, amount=1)
+
+        events = [event for event in live.broker.replay if event.id > start]
+        self.assertEqual([event.kind for event in events][:2], ['created', 'updated'])
+        self.assertIn('paid', [event.kind for event in events])
+        self.assertEqual(events[-1].kind, 'updated')
+        self.assertEqual({event.establishment for event in events}, {cafe.pk})
+
+
+class LiveStreamTests(TestCase):
+    """ ASGI-приложение ленты (sse_app) целиком """
+
+    async def stream(self, query_string=b'', headers=(), method='GET'):
+        scope = {'type': 'http', 'method': method, 'query_string': query_string, 'headers': list(headers)}
+        self.received, self.sent = asyncio.Queue(), asyncio.Queue()
+        return asyncio.create_task(live.sse_app(scope, self.received.get, self.sent.put))
+
+    async def body(self):
+        message = await asyncio.wait_for(self.sent.get(), 1)
+        return message['body']
+
+    async def test_stream(self):
+        task = await self.stream(b'establishment=1&order_type=1')
+        start = await asyncio.wait_for(self.sent.get(), 1)
+        self.assertEqual((start['status'], dict(start['headers'])[b'content-type']), (200, b'text/event-stream'))
+        self.assertEqual(await self.body(), f"retry: {settings.LIVE_RETRY_MS}\n\n".encode())
+
+        live.broker.publish('created', [live_order(1, order_type=2), live_order(2)])
+        payload = await self.body()
+        self.assertIn(b'event: created\ndata: {"id":2,', payload)
+
+        last_id = live.broker.last_id
+        await self.received.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(task, 1)
+        self.assertFalse(live.broker.subscriptions)
+
+        # переподключение: пропущенные события из буфера сразу после retry
+        live.broker.publish('paid', [live_order(2, paid=True)])
+        task = await self.stream(b'establishment=1', headers=[(b'last-event-id', str(last_id).encode())])
+        await self.sent.get()
+        self.assertIn(b'event: paid\n', await self.body())
+        await self.received.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(task, 1)
+
+    async def test_reset_and_errors(self):
+        task = await self.stream(headers=[(b'last-event-id', str(live.broker.last_id + 100).encode())])
+        await self.sent.get()
+        self.assertTrue((await self.body()).endswith(b'event: reset\ndata: {}\n\n'))
+        await self.received.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(task, 1)
+
+        for query_string, method, status in ((b'establishment=x', 'GET', 400), (b'', 'POST', 405)):
+            await asyncio.wait_for(await self.stream(query_string, method=method), 1)
+            self.assertEqual((await self.sent.get())['status'], status)
+
+
+@override_settings(TASKS_EAGER=False, TASKS_RETRY_DELAY=0)
+class TaskQueueTests(TestCase):
+    """ Побочная работа записей ставится в очередь без дублей и выполняется воркером пачками """
+
+    def drain(self):
+        worker = tasks.Worker()
+        while worker.run_once():
+            pass
+
+    def test_deferred_rollups_and_reconciliation(self):
+        cafe = models.Establishment.objects.create(name='Queue', service_price=10, delivery_price=150)
+        product = models.Product.objects.create(name='Манты', price=200, cafe=cafe)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = models.Order.objects.create(order_type=1)
+            for amount in (1, 2, 3):
+                models.OrderItem.objects.create(order=order, product=product, amount=amount)
+
+        pending = models.Task.objects.filter(status=models.Task.PENDING)
+        self.assertEqual(sorted(pending.values_list('name', flat=True)), ['reconcile_totals', 'refresh_revenue'])
+        self.assertFalse(models.DailyRevenue.objects.exists())
+        self.assertEqual(tasks.metrics()['refresh_revenue']['due'], 1)
+
+        self.drain()
+        self.assertFalse(pending.exists())
+        self.assertEqual(list(models.DailyRevenue.objects.values_list('orders', 'revenue')), [(1, 1320)])
+        self.assertEqual(tasks.metrics()['refresh_revenue']['done'], 1)
+
+    def test_reconcile_is_not_run_in_the_request_when_eager(self):
+        cafe = models.Establishment.objects.create(name='Eager', service_price=10, delivery_price=150)
+        product = models.Product.objects.create(name='Манты', price=200, cafe=cafe)
+        order = models.Order.objects.create(order_type=1)
+        reconcile = mock.Mock()
+        with mock.patch.dict(tasks.registry, {'reconcile_totals': reconcile}), self.settings(TASKS_EAGER=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                models.OrderItem.objects.create(order=order, product=product, amount=2)
+        reconcile.assert_not_called()
+        self.assertFalse(models.Task.objects.filter(name='reconcile_totals').exists())
+        self.assertEqual(models.Order.objects.get(pk=order.pk).subtotal, 400)
+
+    def test_failed_batch_is_retried(self):
+        calls = []
+
+        @tasks.task('flaky')
+        def flaky(payloads):
+            calls.append(sorted(payloads))
+            if len(calls) == 1:
+                raise RuntimeError('boom')
+
+        try:
+            tasks.enqueue('flaky', [1, 2, 2])
+            worker = tasks.Worker()
+            with self.assertLogs('order.tasks', 'ERROR'):
+                self.assertEqual(worker.run_once(), 0)
+            self.assertEqual(worker.run_once(), 2)
+        finally:
+            del tasks.registry['flaky']
+        self.assertEqual(calls, [[1, 2], [1, 2]])
+        self.assertEqual(
+            sorted(models.Task.objects.filter(name='flaky').values_list('status', 'attempts')),
+            [(models.Task.DONE, 2), (models.Task.DONE, 2)],
+        )
+
+
+@modify_settings(MIDDLEWARE={'prepend': 'main.middleware.AdmissionControlMiddleware'})
+class AdmissionControlTests(TestCase):
+    """ Лишние запросы отклоняются сразу, создание заказа проходит всегда """
+
+    @classmethod
+    def setUpTestData(cls):
+        cafe = models.Establishment.objects.create(name='Admission', service_price=0, delivery_price=0)
+        cls.product = models.Product.objects.create(name='Самса', price=80, cafe=cafe)
+        models.Order.objects.create()
+
+    def checkout(self):
+        return self.client.post(reverse('checkout'), {'items': [{'product': self.product.id, 'amount': 1}]},
+                                content_type='application/json')
+
+    @override_settings(ADMISSION_CLIENT_RATE=0.5, ADMISSION_CLIENT_BURST=2)
+    def test_client_rate_limit(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(reverse('order-list')).status_code, 200)
+        response = self.client.get(reverse('order-list'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(self.checkout().status_code, 201)
+
+    @override_settings(ADMISSION_CONCURRENCY={'reads': 1})
+    def test_lane_concurrency(self):
+        # потоковый ответ держит место в полосе reads, пока не закрыт
+        stream = self.client.get(reverse('order-list'), {'stream': 1})
+        busy = self.client.get(reverse('order-item-list'))
+        self.assertEqual(busy.status_code, 503)
+        self.assertEqual(busy['Retry-After'], '1')
+        self.assertEqual(self.checkout().status_code, 201)
+        stream.close()
+        self.assertEqual(self.client.get(reverse('order-item-list')).status_code, 200)
+
+    @override_settings(ADMISSION_CONCURRENCY={'reads': 1}, ADMISSION_CLIENT_RATE=0.01, ADMISSION_CLIENT_BURST=2)
+    def test_busy_lane_does_not_spend_tokens(self):
+        stream = self.client.get(reverse('order-list'), {'stream': 1})
+        for _ in range(3):
+            self.assertEqual(self.client.get(reverse('order-item-list')).status_code, 503)
+        stream.close()
+        # после трёх 503 у клиента остался второй токен
+        self.assertEqual(self.client.get(reverse('order-item-list')).status_code, 200)
+        # 429 не занимает место в полосе: иначе следующий запрос получил бы 503
+        for _ in range(2):
+            self.assertEqual(self.client.get(reverse('order-item-list')).status_code, 429)
+
+
+class AdminChangelistTests(TestCase):
+    """ Списки админки на больших таблицах: date_hierarchy по индексу и оценка числа строк """
+
+    @classmethod
+    def setUpTestData(cls):
+        cafe = models.Establishment.objects.create(name='Admin', service_price=0, delivery_price=0)
+        product = models.Product.objects.create(name='Шорпо', price=150, cafe=cafe)
+        for n, stamp in enumerate(['2025-12-31 23:30', '2026-01-01 00:10', '2026-01-15 12:00', '2026-03-02 08:00']):
+            order = models.Order.objects.create(order_type=n % 3 + 1)
+            models.OrderItem.objects.create(order=order, product=product, amount=1)
+            models.Delivery.objects.create(order=order, address='Street', phone='+996555000000')
+            created_at = timezone.make_aware(datetime.fromisoformat(stamp))
+            models.Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+
+    def test_indexed_dates_match_distinct(self):
+        orders = models.Order.objects.all()
+        indexed = orders._chain()
+        indexed.__class__ = type('Indexed', (admin.IndexedDatesQuerySetMixin, orders.__class__), {})
+        for kind, queryset in (
+            ('year', orders),
+            ('month', orders.filter(created_at__year=2026)),
+            ('day', orders.filter(created_at__year=2026, created_at__month=1)),
+        ):
+            with self.subTest(kind=kind):
+                expected = list(queryset.datetimes('created_at', kind))
+                self.assertEqual(indexed.filter(pk__in=queryset.values('pk')).datetimes('created_at', kind), expected)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_FROM=0)
+    def test_changelists(self):
+        self.client.force_login(self.user)
+        for name in ('order', 'orderitem', 'product', 'delivery'):
+            with self.subTest(model=name):
+                self.assertEqual(self.client.get(f'/admin/order/{name}/').status_code, 200)
+        response = self.client.get('/admin/order/order/', {'created_at__year': 2026, 'created_at__month': 1})
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+        self.assertEqual(self.client.get('/admin/order/product/', {'q': 'Admin'}).context['cl'].result_count, 1)
+
+    def test_order_search_by_number(self):
+        self.client.force_login(self.user)
+        order = models.Order.objects.order_by('id').first()
+        for term, expected in ((f' {order.pk} ', [order.pk]), ('²', []), ('99999999999999999999999', []), ('abc', [])):
+            with self.subTest(term=term):
+                response = self.client.get('/admin/order/order/', {'q': term})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([row.pk for row in response.context['cl'].result_list], expected)
+        response = self.client.get('/admin/autocomplete/', {
+            'app_label': 'order', 'model_name': 'orderitem', 'field_name': 'order', 'term': '²',
+        })
+        self.assertEqual((response.status_code, response.json()['results']), (200, []))
+
+
+class ArchiveTests(TestCase):
+    """ Перенос старых оплаченных заказов в архив не меняет сводки и вывод API """
+
+    def test_archive_matches_live(self):
+        cafe = models.Establishment.objects.create(name='Archive', service_price=10, delivery_price=150)
+        product = models.Product.objects.create(name='Манты', price=200, cafe=cafe)
+        with self.captureOnCommitCallbacks(execute=True):
+            orders = [models.Order.objects.create(order_type=n % 3 + 1, establishment=cafe) for n in range(4)]
+            for n, order in enumerate(orders):
+                models.OrderItem.objects.create(order=order, product=product, amount=n + 1)
+                models.Delivery.objects.create(order=order, address=f'Street {n}', phone='+996555000000')
+            for order in orders[:3]:
+                order.paid = True
+                order.save()
+        old = timezone.now() - timedelta(days=100)
+        # orders[2] - оплачен, но свежий; orders[3] - старый, но не оплачен
+        models.Order.objects.filter(pk__in=[orders[0].pk, orders[1].pk, orders[3].pk]).update(created_at=old)
+        reports.rebuild()
+        rollups = RevenueRollupTests.snapshot(self)
+        self.assertTrue(rollups)
+        details = {order.pk: self.client.get(reverse('order-detail', args=[order.pk])).json() for order in orders[:2]}
+        listed = self.client.get(reverse('order-list')).json()['results']
+
+        moved = archive.archive_orders(archive.cutoff(90), batch_size=1)
+        self.assertEqual(moved, {'orders': 2, 'items': 2, 'deliveries': 2})
+        self.assertEqual(list(models.Order.objects.order_by('id').values_list('id', flat=True)), [orders[2].pk, orders[3].pk])
+        self.assertFalse(models.OrderItem.objects.filter(order_id__in=details).exists())
+
+        reports.rebuild()
+        self.assertEqual(RevenueRollupTests.snapshot(self), rollups)
+
+        for pk, expected in details.items():
+            with self.subTest(order=pk):
+                self.assertEqual(self.client.get(reverse('archived-order-detail', args=[pk])).json(), expected)
+        archived = self.client.get(reverse('archived-order-list'), {'establishment': cafe.id}).json()['results']
+        self.assertEqual(archived, [order for order in listed if order['id'] in details])
+        self.assertEqual(self.client.get(reverse('archived-order-detail', args=[orders[2].pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('archived-order-detail', args=[10 ** 20])).status_code, 404)
+
+        # удалённый продукт не стирает историю: единица остаётся без продукта, список и карточка совпадают
+        product.delete()
+        archived = self.client.get(reverse('archived-order-list'), {'establishment': cafe.id}).json()['results']
+        self.assertEqual(len(archived), 2)
+        for row in archived:
+            with self.subTest(order=row['id']):
+                self.assertEqual([item['product'] for item in row['order_items']], [None])
+                self.assertEqual(self.client.get(reverse('archived-order-detail', args=[row['id']])).json(), row)
+
+    def test_invalid_establishment_filter(self):
+        for value in ('²', 'x', '0', '99999999999999999999999'):
+            with self.subTest(establishment=value):
+                response = self.client.get(reverse('archived-order-list'), {'establishment': value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('establishment', response.json())
+
+
+class ProductSearchTests(TestCase):
+    """ Поиск продуктов по индексу: префиксы, ранжирование, страницы и синхронизация с изменениями """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cafe = models.Establishment.objects.create(
+            name='Плов Центр', description='Лучший плов города', service_price=0, delivery_price=0,
+        )
+        cls.other = models.Establishment.objects.create(name='Pizza Bar', service_price=0, delivery_price=0)
+        cls.plov = models.Product.objects.create(name='Плов чайханский', price=300, cafe=cls.other)
+        cls.lagman = models.Product.objects.create(name='Лагман', price=250, cafe=cls.cafe)
+        cls.pizza = models.Product.objects.create(name='Pizza margherita', price=500, cafe=cls.other)
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('product-search'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, q, **params):
+        return [product['id'] for product in self.search(q, **params)['results']]
+
+    def test_prefix_and_ranking(self):
+        # "пло" - префикс названия продукта (выше) и названия/описания заведения Лагмана
+        self.assertEqual(self.ids('пло'), [self.plov.id, self.lagman.id])
+        self.assertEqual(self.ids('ПИЦ'), [])
+        self.assertEqual(self.ids('pizz marg'), [self.pizza.id])
+        self.assertEqual(self.ids('пло', establishment=self.cafe.id), [self.lagman.id])
+        self.assertEqual(self.search('лаг')['results'], [
+            {'id': self.lagman.id, 'name': 'Лагман', 'price': 250, 'cafe': str(self.cafe)},
+        ])
+        self.assertEqual(self.client.get(reverse('product-search'), {'q': ' ,'}).status_code, 400)
+        for establishment in ('²', 'x', '99999999999999999999999'):
+            with self.subTest(establishment=establishment):
+                response = self.client.get(reverse('product-search'), {'q': 'пло', 'establishment': establishment})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('establishment', response.json())
+
+    def test_pages(self):
+        expected = self.ids('p', page_size=10)
+        self.assertEqual(len(expected), 2)
+        pages, url = [], f"{reverse('product-search')}?q=p&page_size=1"
+        while url:
+            page = self.client.get(url).json()
+            pages.append([product['id'] for product in page['results']])
+            previous, url = page['previous'], page['next']
+        self.assertEqual(pages, [[pk] for pk in expected])
+        self.assertEqual([product['id'] for product in self.client.get(previous).json()['results']], expected[:1])
+
+    def test_invalid_cursor(self):
+        for position in ([-1.0, 10 ** 20], [-1.0, 1e300], [float('inf'), 1], [float('nan'), 1], [10 ** 400, 1],
+                         [-1.0, -1], [-1.0, True], ['x', 1], [-1.0, None]):
+            with self.subTest(position=position):
+                response = self.client.get(reverse('product-search'), {'q': 'p', 'cursor': cursor(position)})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+        # 1e999 в JSON - бесконечность
+        raw = base64.urlsafe_b64encode(b'[[-1.0,1e999],false]').decode()
+        self.assertEqual(self.client.get(reverse('product-search'), {'q': 'p', 'cursor': raw}).status_code, 404)
+
+    def test_index_follows_changes(self):
+        self.lagman.name = 'Манты'
+        self.lagman.save()
+        self.assertEqual(self.ids('лаг'), [])
+        self.assertEqual(self.ids('мант'), [self.lagman.id])
+        self.other.name = 'Ош Кафе'
+        self.other.save()
+        self.assertEqual(self.ids('ош'), [self.plov.id, self.pizza.id])
+        self.pizza.delete()
+        self.assertEqual(self.ids('ош'), [self.plov.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = menu_import.import_menu([
+                {'cafe': 'Ош Кафе', 'name': 'Самса', 'price': '120'},
+                {'cafe': 'Ош Кафе', 'name': 'Плов чайханский', 'price': '350'},
+            ])
+        self.assertEqual((report['created'], report['updated']), (1, 1))
+        samsa = models.Product.objects.get(name='Самса')
+        self.assertEqual(self.ids('сам'), [samsa.id])
+        self.assertEqual(search.get_backend().rebuild(), models.Product.objects.count())
+        self.assertEqual(self.ids('сам'), [samsa.id])
@@ -1,30 +1,43 @@
-from django.urls import path
+from django.urls import path, register_converter
 
 
 from . import views
+from .converters import IdConverter
+
+
+register_converter(IdConverter, 'id')
 
 
 urlpatterns = [
-    path('order/', views.OrderListAPIView.as_view()),
-    path('order/<int:pk>/', views.OrderDetailAPIView.as_view()),
+    path('order/', views.OrderListAPIView.as_view(), name='order-list'),
+    path('order/<int:pk>/', views.OrderDetailAPIView.as_view(), name='order-detail'),
+
+    path('order-item/', views.OrderItemAPIView.as_view(), name='order-item-list'),
+    path('order-item/<int:pk>/', views.OrderItemDetailAPIView.as_view(), name='order-item-detail'),
+
+    path('product/', views.ProductAPIView.as_view(), name='product-list'),
+    path('product/<int:pk>/', views.ProductCRUDAPIView.as_view(), name='product-detail'),
+    path('product/import/', views.ProductImportAPIView.as_view(), name='product-import'),
+    path('product/search/', views.ProductSearchAPIView.as_view(), name='product-search'),
 
-    path('order-item/', views.OrderItemAPIView.as_view()),
-    path('order-item/<int:pk>/', views.OrderItemDetailAPIView.as_view()),
+    path('delivery/', views.DeliveryAPIView.as_view(), name='delivery-list'),
+    path('delivery/<int:pk>/', views.DeliveryCRUDAPIView.as_view(), name='delivery-detail'),
 
-    path('product/', views.ProductAPIView.as_view()),
-    path('product/<int:pk>/', views.ProductCRUDAPIView.as_view()),
+    path('establishment/', views.EstablishmentAPIView.as_view(), name='establishment-list'),
+    path('establishment/<int:pk>/', views.EstablishmentCRUDAPIView.as_view(), name='establishment-detail'),
+    path('establishment/<id:pk>/menu/', views.EstablishmentMenuAPIView.as_view(), name='establishment-menu'),
 
-    path('delivery/', views.DeliveryAPIView.as_view()),
-    path('delivery/<int:pk>/', views.DeliveryCRUDAPIView.as_view()),
+    path('get/delivery-orders/', views.DeliveryOrderListAPIView.as_view(), name='delivery-orders'),
+    path('get/in-place-orders/', views.InPlaceOrderListAPIView.as_view(), name='in-place-orders'),
+    path('get/pick-up-orders/', views.PickUpOrderListAPIView.as_view(), name='pick-up-orders'),
+    path('get/establishment-orders/<id:pk>/', views.EstablishmentOrderListAPIView.as_view(), name='establishment-orders'),
 
-    path('establishment/', views.EstablishmentAPIView.as_view()),
-    path('establishment/<int:pk>/', views.EstablishmentCRUDAPIView.as_view()),
+    path('api/create-order/', views.CreateOrderAPIView.as_view(), name='create-order'),
+    path('api/checkout/', views.CheckoutAPIView.as_view(), name='checkout'),
 
-    path('get/delivery-orders/', views.DeliveryOrderListAPIView.as_view()),
-    path('get/in-place-orders/', views.InPlaceOrderListAPIView.as_view()),
-    path('get/pick-up-orders/', views.PickUpOrderListAPIView.as_view()),
-    path('get/establishment-orders/<int:pk>/', views.EstablishmentOrderListAPIView.as_view()),
+    path('reports/revenue/', views.RevenueReportAPIView.as_view(), name='revenue-report'),
 
-    path('api/create-order/', views.CreateOrderAPIView.as_view()),
+    path('archive/order/', views.ArchivedOrderListAPIView.as_view(), name='archived-order-list'),
+    path('archive/order/<id:pk>/', views.ArchivedOrderDetailAPIView.as_view(), name='archived-order-detail'),
 
  ]
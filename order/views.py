@@ -1,27 +1,63 @@
-from django.http import Http404
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from order import models, serializers
-from order.models import get_totall
+from main.middleware import serialize_timer
+from main.renderers import FastJSONRenderer
+from order import fast_serializers, menu_cache, menu_import, models, pagination, reports, search, serializers, streaming
 
 
-class OrderListAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
+def order_validators(pk, modified_at):
+    """
+    ETag и Last-Modified заказа по его modified_at. Last-Modified точен до секунды, поэтому
+    пока секунда изменения не закончилась, его нет (None): иначе ещё одно изменение в ту же
+    секунду получило бы 304 по If-Modified-Since.
+    """
+    timestamp = modified_at.timestamp()
+    last_modified = int(timestamp) if int(timestamp) < int(time.time()) else None
+    return f'"{pk}-{timestamp:.6f}"', last_modified
+
+
+class KeysetListMixin:
+    pagination_class = pagination.KeysetPagination
+    # разрешить выгрузку всего списка одним потоковым ответом (?stream=1)
+    streaming = False
+
+    def paginated_response(self, request, queryset, serializer_class):
+        # списки строятся из .values() быстрыми сериализаторами с тем же выводом
+        fast = fast_serializers.for_serializer(serializer_class)
+        if fast is not None:
+            queryset, serializer_class = fast.values(queryset), fast
+        if self.streaming and streaming.wants_stream(request):
+            queryset = queryset.order_by(*self.pagination_class.ordering)
+            return streaming.stream_response(queryset, serializer_class)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        with serialize_timer(request):
+            data = serializer_class(page, many=True).data
+        return paginator.get_paginated_response(data)
+
+
+class OrderListAPIView(KeysetListMixin, APIView):
+    pagination_class = pagination.OrderKeysetPagination
+    streaming = True
 
     def get(self, request, format=None):
         """
             Return a list of all Orders.
         """
-        orders = models.Order.objects.all()
-        for order in orders:
-            order.total = get_totall(order.id)
-            order.save()
-        serializer = serializers.OrderSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        orders = models.Order.objects.with_related()
+        return self.paginated_response(request, orders, serializers.OrderSerializer)
 
     @swagger_auto_schema(request_body=serializers.OrderSerializer)
     def post(self, request, format=None):
@@ -34,23 +70,33 @@ class OrderListAPIView(APIView):
 
 
 class OrderDetailAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
     """
     Retrieve, update or delete a order instance.
     """
     def get_object(self, pk):
         try:
-            return models.Order.objects.get(pk=pk)
-        except models.Order.objects.get(pk=pk).DoesNotExist:
+            return models.Order.objects.with_related().get(pk=pk)
+        except models.Order.DoesNotExist:
             raise Http404
 
     def get(self, request, pk, format=None):
-
-        order = self.get_object(pk)
-        order.total = get_totall(order.id)
-
-        serializer = serializers.OrderDetailSerializer(order)
-        return Response(serializer.data)
+        # modified_at меняется при любом изменении заказа, его единиц и доставки,
+        # поэтому неизменённый заказ отвечает 304 после одного запроса по pk
+        modified_at = models.Order.objects.filter(pk=pk).values_list('modified_at', flat=True).first()
+        if modified_at is None:
+            raise Http404
+        etag, last_modified = order_validators(pk, modified_at)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            order = self.get_object(pk)
+            with serialize_timer(request):
+                data = serializers.OrderDetailSerializer(order).data
+            response = Response(data)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
 
     @swagger_auto_schema(request_body=serializers.OrderDetailSerializer)
     def put(self, request, pk, format=None):
@@ -82,16 +128,14 @@ class OrderDetailAPIView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class EstablishmentAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
+class EstablishmentAPIView(KeysetListMixin, APIView):
 
     def get(self, request, format=None):
         """
             Return a list of all Establishments.
         """
         establishment = models.Establishment.objects.all()
-        serializer = serializers.EstablishmentSerializer(establishment, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.paginated_response(request, establishment, serializers.EstablishmentSerializer)
 
     @swagger_auto_schema(request_body=serializers.EstablishmentSerializer)
     def post(self, request, format=None):
@@ -104,7 +148,6 @@ class EstablishmentAPIView(APIView):
 
 
 class EstablishmentCRUDAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
     """
     Retrieve, update or delete a Establishment instance.
     """
@@ -151,33 +194,63 @@ class EstablishmentCRUDAPIView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class OrderItemAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
+class EstablishmentMenuAPIView(APIView):
+    """
+    Menu of an Establishment (the establishment and all of its products).
+    The serialized payload is cached per menu version; a matching If-None-Match
+    is answered with 304 without touching the database.
+    """
+    # меню публичное: без аутентификации запрос не трогает сессии в БД
+    authentication_classes = []
+
+    def get(self, request, pk, format=None):
+        version = menu_cache.get_version(pk)
+        etag = menu_cache.get_etag(version)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return HttpResponseNotModified(headers={'ETag': etag})
+
+        payload = menu_cache.get_payload(pk, version)
+        if payload is None:
+            try:
+                establishment = models.Establishment.objects.get(pk=pk)
+            except models.Establishment.DoesNotExist:
+                raise Http404
+            products = establishment.products.select_related('cafe').order_by('id')
+            payload = FastJSONRenderer().render({
+                'establishment': serializers.EstablishmentSerializer(establishment).data,
+                'products': serializers.ProductSerializer(products, many=True).data,
+            })
+            menu_cache.set_payload(pk, version, payload)
+
+        return HttpResponse(payload, content_type='application/json', headers={
+            'ETag': etag,
+            'Cache-Control': 'no-cache',
+        })
+
+
+class OrderItemAPIView(KeysetListMixin, APIView):
+    streaming = True
 
     def get(self, request, format=None):
         """
         Return a list of all OrderItems.
         """
-        order_items = models.OrderItem.objects.all()
-        serializer = serializers.OrderItemSerializer(order_items, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        order_items = models.OrderItem.objects.select_related('order', 'product')
+        return self.paginated_response(request, order_items, serializers.OrderItemSerializer)
 
     @swagger_auto_schema(request_body=serializers.OrderItemSerializer)
     def post(self, request, format=None):
         serializer = serializers.OrderItemSerializer(data=request.data, context={'request': request})
 
         if serializer.is_valid():
-            order = models.Order.objects.get(id=request.data['order'])
-            order.total = get_totall(order.id)
-            print(f"\n\norder.total: {order.total}\n\n")
-            order.save()
-            serializer.save()
+            # запись строки и пересчёт суммы заказа - одна транзакция
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class OrderItemDetailAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
     """
     Retrieve, update or delete a order instance.
     """
@@ -224,16 +297,14 @@ class OrderItemDetailAPIView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class ProductAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
+class ProductAPIView(KeysetListMixin, APIView):
 
     def get(self, request, format=None):
         """
         Return a list of all OrderItems.
         """
-        order_items = models.Product.objects.all()
-        serializer = serializers.ProductSerializer(order_items, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        order_items = models.Product.objects.select_related('cafe')
+        return self.paginated_response(request, order_items, serializers.ProductSerializer)
 
     @swagger_auto_schema(request_body=serializers.ProductSerializer)
     def post(self, request, format=None):
@@ -245,8 +316,60 @@ class ProductAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ProductSearchAPIView(APIView):
+    """
+    Full-text product search by product name and establishment name/description (order/search.py).
+    """
+    pagination_class = pagination.SearchPagination
+
+    @swagger_auto_schema(query_serializer=serializers.ProductSearchFilterSerializer)
+    def get(self, request, format=None):
+        """
+        Search products: ?q=плов ош&establishment=1. Every word matches as a prefix;
+        results are ordered by relevance, keyset-paginated (cursor, page_size).
+        """
+        params = serializers.ProductSearchFilterSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        words = search.terms(params.validated_data.get('q'))
+        if not words:
+            return Response({'q': ['Enter at least one word.']}, status=status.HTTP_400_BAD_REQUEST)
+        filters = {}
+        if 'establishment' in params.validated_data:
+            filters['establishment_id'] = params.validated_data['establishment']
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_search(search.get_backend(), words, request, **filters)
+        fast = fast_serializers.ProductSerializer
+        rows = {row['id']: row for row in fast.values(models.Product.objects.filter(id__in=[hit['id'] for hit in page]))}
+        # порядок релевантности; продукт, удалённый после поиска по индексу, пропускается
+        with serialize_timer(request):
+            data = fast([rows[hit['id']] for hit in page if hit['id'] in rows], many=True).data
+        return paginator.get_paginated_response(data)
+
+
+class ProductImportAPIView(APIView):
+    # файл меню - только multipart
+    parser_classes = [MultiPartParser]
+
+    @swagger_auto_schema(request_body=serializers.MenuImportSerializer)
+    def post(self, request, format=None):
+        """
+        Bulk import of products from a CSV or JSON Lines menu file.
+        """
+        serializer = serializers.MenuImportSerializer(data=request.data)
+
+        if serializer.is_valid():
+            rows = menu_import.read_upload(serializer.validated_data['file'], serializer.validated_data.get('format'))
+            try:
+                report = menu_import.import_menu(rows)
+            except menu_import.MenuFileError as e:
+                return Response({'file': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(report, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
 class ProductCRUDAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
     """
     Retrieve, update or delete a order instance.
     """
@@ -293,29 +416,29 @@ class ProductCRUDAPIView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class DeliveryAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
+class DeliveryAPIView(KeysetListMixin, APIView):
+    streaming = True
 
     def get(self, request, format=None):
         """
         Return a list of all OrderItems.
         """
-        deliveries = models.Delivery.objects.all()
-        serializer = serializers.DeliverySerializer(deliveries, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        deliveries = models.Delivery.objects.select_related('order')
+        return self.paginated_response(request, deliveries, serializers.DeliverySerializer)
 
     @swagger_auto_schema(request_body=serializers.DeliverySerializer)
     def post(self, request, format=None):
         serializer = serializers.DeliverySerializer(data=request.data, context={'request': request})
 
         if serializer.is_valid():
-            serializer.save()
+            # запись строки и пересчёт суммы заказа - одна транзакция
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class DeliveryCRUDAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
     """
     Retrieve, update or delete a order instance.
     """
@@ -363,62 +486,120 @@ class DeliveryCRUDAPIView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class DeliveryOrderListAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
+class DeliveryOrderListAPIView(KeysetListMixin, APIView):
+    pagination_class = pagination.OrderKeysetPagination
 
     def get(self, request, format=None):
         """
         Return a list of all DeliveryOrderListAPIView.
         """
-        orders = models.Order.objects.filter(order_type=2)
-        serializer = serializers.OrderSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        orders = models.Order.objects.with_related().filter(order_type=2)
+        return self.paginated_response(request, orders, serializers.OrderSerializer)
 
 
-class InPlaceOrderListAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
+class InPlaceOrderListAPIView(KeysetListMixin, APIView):
+    pagination_class = pagination.OrderKeysetPagination
 
     def get(self, request, format=None):
         """
         Return a list of all InPlaceOrderListAPIView.
         """
-        orders = models.Order.objects.filter(order_type=1)
-        serializer = serializers.OrderSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        orders = models.Order.objects.with_related().filter(order_type=1)
+        return self.paginated_response(request, orders, serializers.OrderSerializer)
 
 
-class PickUpOrderListAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
+class PickUpOrderListAPIView(KeysetListMixin, APIView):
+    pagination_class = pagination.OrderKeysetPagination
 
     def get(self, request, format=None):
         """
         Return a list of all PickUpOrderListAPIView.
         """
-        orders = models.Order.objects.filter(order_type=3)
-        serializer = serializers.OrderSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        orders = models.Order.objects.with_related().filter(order_type=3)
+        return self.paginated_response(request, orders, serializers.OrderSerializer)
 
 
-class EstablishmentOrderListAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
+class EstablishmentOrderListAPIView(KeysetListMixin, APIView):
+    pagination_class = pagination.OrderKeysetPagination
     """
     Return a list of all Orders by Establishment.
+    Optional filters: paid, order_type, date_from, date_to (YYYY-MM-DD, inclusive).
     """
 
     def get_object(self, pk):
         try:
             return models.Establishment.objects.get(pk=pk)
-        except models.Establishment.objects.get(pk=pk).DoesNotExist:
+        except models.Establishment.DoesNotExist:
             raise Http404
 
+    @swagger_auto_schema(query_serializer=serializers.EstablishmentOrderFilterSerializer)
     def get(self, request, pk, format=None):
 
         establishment = self.get_object(pk)
+        filters = serializers.EstablishmentOrderFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = filters.validated_data
+
+        # фильтры по created_at - диапазоном, чтобы работал индекс (establishment, created_at, id)
+        orders = models.Order.objects.with_related().filter(establishment=establishment)
+        if params['paid'] is not None:
+            orders = orders.filter(paid=params['paid'])
+        if 'order_type' in params:
+            orders = orders.filter(order_type=params['order_type'])
+        if 'date_from' in params:
+            orders = orders.filter(created_at__gte=reports.start_of_day(params['date_from']))
+        if 'date_to' in params:
+            orders = orders.filter(created_at__lt=reports.start_of_day(params['date_to'] + timedelta(days=1)))
+
+        return self.paginated_response(request, orders, serializers.OrderSerializer)
+
+
+class ArchivedOrderListAPIView(KeysetListMixin, APIView):
+    """
+    Read-only list of archived orders (paid orders moved out of the live tables, see order/archive.py).
+    Optional filter: establishment.
+    """
+    pagination_class = pagination.OrderKeysetPagination
+
+    @swagger_auto_schema(query_serializer=serializers.EstablishmentFilterSerializer)
+    def get(self, request, format=None):
+        filters = serializers.EstablishmentFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+        orders = models.ArchivedOrder.objects.all()
+        if 'establishment' in filters.validated_data:
+            orders = orders.filter(establishment_id=filters.validated_data['establishment'])
+        return self.paginated_response(request, orders, serializers.ArchivedOrderSerializer)
+
+
+class ArchivedOrderDetailAPIView(APIView):
+    """ Read-only archived order with its items and deliveries """
+
+    def get(self, request, pk, format=None):
+        try:
+            order = models.ArchivedOrder.objects.prefetch_related(
+                Prefetch('order_items', queryset=models.ArchivedOrderItem.objects.select_related('product').order_by('id')),
+                Prefetch('delivery_address', queryset=models.ArchivedDelivery.objects.order_by('id')),
+            ).get(pk=pk)
+        except models.ArchivedOrder.DoesNotExist:
+            raise Http404
+        return Response(serializers.ArchivedOrderSerializer(order).data)
 
-        orders = models.Order.objects.filter(order_items=establishment.products.order_items.orders)
 
-        serializer = serializers.OrderSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+class RevenueReportAPIView(APIView):
+    """
+    Revenue per establishment per day, split by order_type and paid, from the daily rollups.
+    Optional filters: date_from, date_to (YYYY-MM-DD, inclusive), establishment, order_type, paid;
+    group_by (repeatable): day, establishment, order_type, paid - all by default.
+    """
+
+    @swagger_auto_schema(query_serializer=serializers.RevenueReportFilterSerializer)
+    def get(self, request, format=None):
+        filters = serializers.RevenueReportFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(reports.revenue_report(**filters.validated_data))
 
 
 #######################################################################################################################
@@ -428,29 +609,38 @@ class EstablishmentOrderListAPIView(APIView):
 
 
 class CreateOrderAPIView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
 
     @swagger_auto_schema(request_body=serializers.CreateOrderSerializer)
     def post(self, request, format=None):
-        order = models.Order.objects.create(
-            order_type=1
-        )
-        order.save()
-        data = request.data.copy()
-        data['order'] = order.id
-        print(f"\n\ndata:{data}\norderid:{order.id}\n")
-        serializer = serializers.OrderItemSerializer(data=data, context={'request': request})
-
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
+        if not isinstance(request.data, dict):
+            # тело - не объект (список, число из JSON/MessagePack): заказ не создаётся
+            return Response({'non_field_errors': ['Invalid data. Expected a JSON object.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        # заказ и позиция пишутся одной транзакцией; при невалидной позиции
+        # заказ откатывается, а не остаётся пустым
+        with transaction.atomic():
+            order = models.Order.objects.create(
+                order_type=1
+            )
+            data = request.data.copy()
+            data['order'] = order.id
+            serializer = serializers.OrderItemSerializer(data=data, context={'request': request})
+
+            if serializer.is_valid():
+                serializer.save()
+                return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+            transaction.set_rollback(True)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class CheckoutAPIView(APIView):
+    @swagger_auto_schema(request_body=serializers.CheckoutSerializer, responses={201: serializers.OrderDetailSerializer})
+    def post(self, request, format=None):
+        serializer = serializers.CheckoutSerializer(data=request.data, context={'request': request})
 
-
-
-
-
-
+        if serializer.is_valid():
+            order = serializer.save()
+            order = models.Order.objects.with_related().get(pk=order.pk)
+            return Response(serializers.OrderDetailSerializer(order).data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)